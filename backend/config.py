@@ -7,14 +7,146 @@ class Config:
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
     QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
     QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+    # "qdrant" (remote server) or "numpy" (in-process, memory-mapped, no server needed)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+    VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", os.path.join(os.getcwd(), "vector_store"))
+    # numpy backend: rewrite a collection's files once this share of its rows is overwritten or deleted
+    VECTOR_STORE_COMPACT_RATIO = float(os.getenv("VECTOR_STORE_COMPACT_RATIO", "0.5"))
+
+    # Qdrant storage: "per_repo" (one collection per repository) or "shared"
+    # (one collection, points filtered by an indexed repo_id; see backend/migrate_vectors.py)
+    VECTOR_LAYOUT = os.getenv("VECTOR_LAYOUT", "per_repo")
+    SHARED_COLLECTION = os.getenv("SHARED_COLLECTION", "codebase_chunks")
+
+    # Qdrant collection layout (applied when a collection is created)
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")  # none | scalar (int8) | binary
+    VECTOR_ON_DISK = os.getenv("VECTOR_ON_DISK", "false").lower() == "true"  # originals on disk, quantized in RAM
+    HNSW_M = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCT = int(os.getenv("HNSW_EF_CONSTRUCT", "100"))
+    HNSW_ON_DISK = os.getenv("HNSW_ON_DISK", "false").lower() == "true"
+    # Query-time: HNSW beam width, and re-ranking of quantized candidates with the original vectors
+    SEARCH_HNSW_EF = int(os.getenv("SEARCH_HNSW_EF", "128"))
+    SEARCH_RESCORE = os.getenv("SEARCH_RESCORE", "true").lower() == "true"
+    SEARCH_OVERSAMPLING = float(os.getenv("SEARCH_OVERSAMPLING", "2.0"))
     GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
     
     # Models
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
     DEFAULT_LLM_MODEL = os.getenv("DEFAULT_LLM_MODEL", "anthropic/claude-3-haiku")
+    OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+    # OpenRouter HTTP client (one pooled client for the app's lifetime)
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"  # needs the h2 package
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # seconds
+    LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))  # max wait for the next streamed chunk
+    LLM_WRITE_TIMEOUT = float(os.getenv("LLM_WRITE_TIMEOUT", "10"))
+    LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "5"))
+    LLM_STREAM_TIMEOUT = float(os.getenv("LLM_STREAM_TIMEOUT", "300"))  # whole answer
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))  # only before the first byte
+    LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))  # seconds, doubled per retry
     
     # App Settings
     REPOS_DIR = os.path.join(os.getcwd(), "repos")
+    # Cloning: "mirror" (one cached bare mirror per URL, so re-ingesting a URL only
+    # fetches), "shallow" (depth-1 clone per repo) or "full"
+    CLONE_STRATEGY = os.getenv("CLONE_STRATEGY", "mirror")
+    MIRRORS_DIR = os.getenv("MIRRORS_DIR", os.path.join(os.getcwd(), "mirrors"))
+    MIRROR_FILTER = os.getenv("MIRROR_FILTER", "blob:none")  # partial clone filter; "" for complete mirrors
+    # Mirror checkouts: "worktree" (git worktree) or "archive" (only indexable files, from git archive)
+    CHECKOUT_MODE = os.getenv("CHECKOUT_MODE", "worktree")
     MAX_FILE_SIZE = 1024 * 1024  # 1MB
-    
+
+    # Chunking: "syntax" (tree-sitter, falls back to lines) or "lines" (50-line windows)
+    CHUNKER = os.getenv("CHUNKER", "syntax")
+    # In cl100k tokens. The embedding model truncates its input to max_seq_length
+    # wordpieces (256 for all-MiniLM-L6-v2) and code takes ~1.2-1.3 wordpieces per
+    # cl100k token, so larger chunks lose their tail before they are embedded
+    CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "200"))
+    CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))  # smaller nodes get merged
+
+    # File discovery / chunking pool ("process" or "thread")
+    PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", str(os.cpu_count() or 1)))
+    PARSER_EXECUTOR = os.getenv("PARSER_EXECUTOR", "process")
+
+    # Ingestion pipeline
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks per embed call
+    UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "128"))  # points per Qdrant request
+    MAX_INFLIGHT_BATCHES = int(os.getenv("MAX_INFLIGHT_BATCHES", "2"))
+
+    # Load models and open connections right after startup (in the background;
+    # /ready turns 200 once done) instead of on the first request
+    WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+    # Ingestion job queue: worker processes started with the API (0 = run
+    # `python -m backend.worker` separately)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+    JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))  # seconds
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))  # missed heartbeats => requeue
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    # Ingestion progress is pushed live over the event bus (and
+    # /api/repos/status/<repo_id>/stream); a job writes it to the database at most this often
+    PROGRESS_WRITE_INTERVAL = float(os.getenv("PROGRESS_WRITE_INTERVAL", "5"))  # seconds
+    STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "5"))  # seconds between repository list reloads
+
+    # SQLite (WAL mode) connection pool
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "30"))  # seconds a write waits for the lock
+
+    # Embedding engine: >1 workers encodes large batches on a process pool
+    # (torch backend only); 0 = cores / INGEST_WORKERS - 1, 1 = no pool
+    EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "0"))
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    # "torch" (sentence-transformers) or "onnx" (ONNX Runtime on CPU; export the
+    # model first with `python -m backend.export_onnx`)
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getcwd(), "onnx_models"))
+    ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "int8")  # int8 (dynamic quantization) | none
+    ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # intra-op threads; 0 = cores / (INGEST_WORKERS + 1)
+    ONNX_PARITY_THRESHOLD = float(os.getenv("ONNX_PARITY_THRESHOLD", "0.99"))  # min cosine vs the torch model
+
+    # Chat queries arriving within this window share one encode call
+    QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+    QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+    # Chat retrieval cache (query embeddings and search hits)
+    QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+    QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "900"))  # seconds
+
+    # Embedding cache (stored next to codebase_rag.db); 0 MB disables it
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getcwd(), "embedding_cache.db"))
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+
+    # Hybrid retrieval: BM25 over identifiers fused with dense hits (reciprocal rank fusion)
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+    LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(os.getcwd(), "lexical_index"))
+    LEXICAL_RELOAD_INTERVAL = float(os.getenv("LEXICAL_RELOAD_INTERVAL", "10"))  # seconds between change checks
+    LEXICAL_MAX_LOADED = int(os.getenv("LEXICAL_MAX_LOADED", "32"))  # repos kept in memory
+    LEXICAL_IDLE_TIMEOUT = float(os.getenv("LEXICAL_IDLE_TIMEOUT", "1800"))  # seconds unused before unloading
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # hits fetched from each side
+    RRF_K = int(os.getenv("RRF_K", "60"))
+
+    # Chat context: over-fetch, rerank with a CPU cross-encoder, then pack to a prompt budget
+    RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "50"))
+    RERANK_ENABLED = os.getenv("RERANK_ENABLED", "true").lower() == "true"
+    RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+    # Conversation history sent to the LLM: recent turns verbatim, older ones summarized
+    HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+    HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+    RETRIEVAL_HISTORY_TURNS = int(os.getenv("RETRIEVAL_HISTORY_TURNS", "1"))  # earlier user turns added to the search query
+
+    # Answer cache: replays full LLM answers for the same question over the same context
+    ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))  # 0 disables it
+    ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # seconds
+    # Cosine similarity at which a differently worded question reuses an answer; 1 (the
+    # default) replays exact repeats only, lower values opt into near-duplicate matching
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "1.0"))
+
 config = Config()
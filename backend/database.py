@@ -1,13 +1,33 @@
 from datetime import datetime
 from typing import Optional
+from sqlalchemy import event, inspect, text
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 import os
+from backend.config import config
 
 # Database setup
 sqlite_file_name = "codebase_rag.db"
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-engine = create_engine(sqlite_url, echo=False)
+# Pooled connections, shared across threads; each process has its own pool
+engine = create_engine(
+    sqlite_url,
+    echo=False,
+    poolclass=QueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    connect_args={"check_same_thread": False, "timeout": config.DB_BUSY_TIMEOUT},
+)
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL: readers never wait for the ingestion workers' writes (and vice
+    # versa); NORMAL sync is crash-safe in WAL mode and skips most fsyncs
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 class Repository(SQLModel, table=True):
     id: str = Field(primary_key=True)
@@ -19,9 +39,52 @@ class Repository(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
+    commit_sha: Optional[str] = None  # HEAD of the last successful (re-)index
+    # Resume point of an in-progress full ingest: the first checkpoint_files
+    # files (in sorted order) of checkpoint_sha are already in the vector store
+    checkpoint_sha: Optional[str] = None
+    checkpoint_files: int = Field(default=0)
+    index_version: int = Field(default=0)  # bumped whenever a job may have changed the index
+    stage_timings: Optional[str] = None  # JSON {stage: seconds} of the last ingest or refresh
+
+class IngestJob(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    repo_id: str = Field(index=True)
+    kind: str = Field(default="ingest")  # ingest | resume | refresh
+    priority: int = Field(default=0)  # higher runs first
+    status: str = Field(default="queued", index=True)  # queued | running | done | failed | cancelled
+    attempts: int = Field(default=0)
+    worker_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+def _add_missing_columns():
+    """
+    create_all() never alters existing tables, so add columns introduced
+    after a database was first created.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}'
+                    default = column.default.arg if column.default is not None else None
+                    if isinstance(default, (int, float)):
+                        ddl += f' DEFAULT {default}'
+                    elif isinstance(default, str):
+                        ddl += f" DEFAULT '{default}'"
+                    conn.execute(text(ddl))
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
 
 def get_session():
     with Session(engine) as session:
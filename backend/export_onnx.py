@@ -0,0 +1,183 @@
+"""
+Exports the embedding model for EMBEDDING_BACKEND=onnx:
+
+    python -m backend.export_onnx [--model NAME] [--samples DIR] [--threshold 0.99]
+
+Writes the transformer as ONNX (model.onnx), a dynamically int8-quantized
+copy (model_int8.onnx) and the tokenizer under ONNX_MODEL_DIR. Both are then
+checked against the PyTorch model on code samples (by default this repository's
+backend sources): the lowest cosine similarity per text is recorded, and a
+variant below the threshold is refused at load time. Needs torch,
+sentence-transformers, onnx and onnxruntime; serving only needs onnxruntime
+and tokenizers. Re-run it after changing EMBEDDING_MODEL.
+"""
+import os
+import sys
+import json
+import time
+import inspect
+import logging
+import argparse
+from typing import List
+import numpy as np
+from backend.config import config
+from backend.services.onnx_embedder import META_FILE, MODEL_FILES, OnnxEmbedder, export_dir
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_EXTENSIONS = ('.py', '.js', '.ts', '.tsx', '.go', '.java', '.rs', '.md')
+
+def load_samples(root: str, limit: int, lines_per_sample: int = 40) -> List[str]:
+    samples = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.') and d not in ('node_modules', '__pycache__'))
+        for name in sorted(filenames):
+            if not name.endswith(SAMPLE_EXTENSIONS):
+                continue
+            try:
+                with open(os.path.join(dirpath, name), encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+            except (OSError, UnicodeDecodeError):
+                continue
+            for start in range(0, len(lines), lines_per_sample):
+                text = '\n'.join(lines[start:start + lines_per_sample]).strip()
+                if text:
+                    samples.append(text)
+                if len(samples) >= limit:
+                    return samples
+    return samples
+
+def export_transformer(st_model, output_dir: str) -> str:
+    import torch
+
+    transformer = st_model[0]
+    tokenizer = transformer.tokenizer
+    if not getattr(tokenizer, 'is_fast', False):
+        raise ValueError("Only models with a fast (tokenizer.json) tokenizer can be exported")
+    tokenizer.save_pretrained(output_dir)
+
+    hf_model = transformer.auto_model.eval()
+    sample = tokenizer(["def export(model): return model", "x"], padding=True, return_tensors='pt')
+    input_names = [n for n in ('input_ids', 'attention_mask', 'token_type_ids') if n in sample]
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = hf_model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+    axes = {0: 'batch', 1: 'sequence'}
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # the TorchScript exporter handles dynamic_axes
+    path = os.path.join(output_dir, MODEL_FILES['none'])
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(), tuple(sample[n] for n in input_names), path,
+            input_names=input_names, output_names=['last_hidden_state'],
+            dynamic_axes={**{n: axes for n in input_names}, 'last_hidden_state': axes},
+            opset_version=17, do_constant_folding=True, **kwargs
+        )
+    return path
+
+def describe(st_model) -> dict:
+    from sentence_transformers.models import Normalize, Pooling, Transformer
+
+    modules = list(st_model)
+    unsupported = [type(m).__name__ for m in modules if not isinstance(m, (Transformer, Pooling, Normalize))]
+    if unsupported or not isinstance(modules[0], Transformer):
+        raise ValueError(f"Unsupported sentence-transformers modules for ONNX export: {unsupported}")
+    pooling = next((m for m in modules if isinstance(m, Pooling)), None)
+    if pooling is None:
+        mode = 'cls'
+    elif hasattr(pooling, 'get_pooling_mode_str'):
+        mode = pooling.get_pooling_mode_str()
+    else:  # sentence-transformers >= 6
+        mode = pooling.pooling_mode
+    if mode not in ('mean', 'cls', 'max'):
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {mode}")
+    tokenizer = modules[0].tokenizer
+    return {
+        'max_seq_length': st_model.max_seq_length,
+        'pooling': mode,
+        'normalize': any(isinstance(m, Normalize) for m in modules),
+        'dimension': st_model.get_sentence_embedding_dimension(),
+        'pad_token': tokenizer.pad_token,
+        'pad_token_id': tokenizer.pad_token_id,
+    }
+
+def min_cosine(a: np.ndarray, b: np.ndarray) -> float:
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return float((a * b).sum(axis=1).min())
+
+def timed(encode, texts: List[str], batch_size: int):
+    started = time.perf_counter()
+    vectors = encode(texts, batch_size=batch_size)
+    return np.asarray(vectors, dtype=np.float32), len(texts) / max(time.perf_counter() - started, 1e-9)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=config.EMBEDDING_MODEL)
+    parser.add_argument('--output', default=config.ONNX_MODEL_DIR, help="root directory (default ONNX_MODEL_DIR)")
+    parser.add_argument('--samples', default=os.path.dirname(os.path.abspath(__file__)),
+                        help="directory of source files to compare embeddings on")
+    parser.add_argument('--max-samples', type=int, default=512)
+    parser.add_argument('--threshold', type=float, default=config.ONNX_PARITY_THRESHOLD,
+                        help="lowest acceptable cosine similarity to the PyTorch embeddings")
+    parser.add_argument('--no-quantize', action='store_true', help="skip the int8 model")
+    args = parser.parse_args(argv)
+    # The quantizer logs every tensor it skips at INFO
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    logger.setLevel(logging.INFO)
+
+    from sentence_transformers import SentenceTransformer
+
+    st_model = SentenceTransformer(args.model, device='cpu')
+    meta = {'source_model': args.model, **describe(st_model), 'threshold': args.threshold, 'parity': {}}
+    output_dir = export_dir(args.output, args.model)
+    os.makedirs(output_dir, exist_ok=True)
+
+    logger.info(f"Exporting {args.model} to {output_dir}")
+    fp32_path = export_transformer(st_model, output_dir)
+    variants = ['none']
+    if not args.no_quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, os.path.join(output_dir, MODEL_FILES['int8']), weight_type=QuantType.QInt8)
+        variants.append('int8')
+
+    # Written without parity results, so the models stay refused until checked
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    samples = load_samples(args.samples, args.max_samples)
+    if not samples:
+        logger.error(f"No sample texts found under {args.samples}")
+        return 1
+    samples.sort(key=len)
+    batch_size = config.EMBEDDING_BATCH_SIZE
+    threads = config.ONNX_THREADS or os.cpu_count() or 1
+    reference, torch_rate = timed(st_model.encode, samples, batch_size)
+    logger.info(f"torch: {torch_rate:.1f} texts/s over {len(samples)} samples")
+
+    failed = []
+    for variant in variants:
+        embedder = OnnxEmbedder(output_dir, quantize=variant, threads=threads, check_parity=False)
+        vectors, rate = timed(embedder.encode, samples, batch_size)
+        meta['parity'][variant] = round(min_cosine(reference, vectors), 6)
+        logger.info(f"onnx {variant}: {rate:.1f} texts/s ({rate / torch_rate:.2f}x), "
+                    f"min cosine {meta['parity'][variant]:.4f}")
+        if meta['parity'][variant] < args.threshold:
+            failed.append(variant)
+
+    with open(os.path.join(output_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    if failed:
+        logger.error(f"Below the parity threshold {args.threshold}: {failed}; these models will not be loaded")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
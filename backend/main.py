@@ -1,12 +1,20 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 
+from backend.config import config
+from backend.rate_limit import limiter
 from backend.routes import repos, chat
 from backend.database import create_db_and_tables
+from backend.worker import WorkerPool
+from backend.services.llm_service import llm_service
+from backend.services.metrics import metrics
+from backend.services.warmup import warmup_service
 
 # Configure logging
 logging.basicConfig(
@@ -15,14 +23,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Setup rate limiting
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="CodeBase RAG API")
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# Ingestion runs in separate processes fed by the durable job queue
+worker_pool = WorkerPool(config.INGEST_WORKERS)
 
-@app.on_event("startup")
-def on_startup():
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     # Pre-flight check: Ensure critical environment variables are present
     critical_vars = ["OPENROUTER_API_KEY", "QDRANT_URL", "QDRANT_API_KEY"]
     missing = [var for var in critical_vars if not getattr(config, var)]
@@ -32,6 +37,23 @@ def on_startup():
         # raise RuntimeError(f"Missing ENVs: {missing}")
     
     create_db_and_tables()
+    # Workers start before anything heavy is loaded here; they load their own models
+    if worker_pool.size > 0:
+        worker_pool.start()
+    # Models and connections load in the background; /ready reports when they are done
+    warmup = asyncio.create_task(warmup_service.run())
+
+    yield
+
+    warmup.cancel()
+    # Interrupted jobs stay 'running' and are resumed once their heartbeat goes stale
+    worker_pool.stop()
+    await llm_service.aclose()
+
+# Setup rate limiting
+app = FastAPI(title="CodeBase RAG API", lifespan=lifespan)
+app.state.limiter = limiter
+app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 # Configure CORS
 app.add_middleware(
@@ -48,8 +70,23 @@ app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 
 @app.get("/health")
 async def health_check():
+    # Liveness: the process is up and serving
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    # Readiness: warm-up finished (or is disabled), so requests won't stall on model loads
+    return JSONResponse(warmup_service.status(), status_code=200 if warmup_service.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # Includes the ingestion workers' numbers, which they flush over the event bus
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/llm")
+async def llm_pool_stats():
+    return llm_service.pool_stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,76 @@
+"""
+Moves repositories from the per-repo collection layout into the shared
+collection (VECTOR_LAYOUT=shared):
+
+    python -m backend.migrate_vectors [--delete-old] [repo_id ...]
+
+Without repo ids, every repository in the database is migrated. Points
+keep their ids and vectors and gain a repo_id payload field, so nothing
+is re-embedded. Running it again is safe (upserts are idempotent). The old
+collections are only deleted with --delete-old, after the point counts match.
+"""
+import sys
+import logging
+import argparse
+from sqlmodel import Session, select
+from qdrant_client.http import models
+from backend.config import config
+from backend.database import Repository, engine
+from backend.services.vector_service import QdrantVectorStore
+
+logger = logging.getLogger(__name__)
+
+def migrate_repository(store: QdrantVectorStore, repo_id: str, delete_old: bool = False) -> int:
+    client = store.client
+    if not client.collection_exists(repo_id):
+        logger.info(f"{repo_id}: no per-repo collection, skipping")
+        return 0
+
+    info = client.get_collection(repo_id)
+    store.ensure_collection(repo_id, vector_size=info.config.params.vectors.size)
+
+    copied, offset = 0, None
+    while True:
+        records, offset = client.scroll(collection_name=repo_id, with_vectors=True, with_payload=True,
+                                        limit=config.UPSERT_BATCH_SIZE, offset=offset)
+        if records:
+            client.upsert(collection_name=config.SHARED_COLLECTION, points=[
+                models.PointStruct(id=r.id, vector=r.vector, payload={**r.payload, 'repo_id': repo_id})
+                for r in records
+            ])
+            copied += len(records)
+        if offset is None:
+            break
+
+    source = client.count(repo_id, exact=True).count
+    target = client.count(config.SHARED_COLLECTION, count_filter=store._repo_filter(repo_id), exact=True).count
+    logger.info(f"{repo_id}: copied {copied} points ({source} in source, {target} in shared collection)")
+    if delete_old:
+        if target >= source:
+            client.delete_collection(repo_id)
+            logger.info(f"{repo_id}: deleted per-repo collection")
+        else:
+            logger.error(f"{repo_id}: counts differ, keeping the per-repo collection")
+    return copied
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('repo_ids', nargs='*')
+    parser.add_argument('--delete-old', action='store_true', help='drop per-repo collections once copied')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if config.VECTOR_LAYOUT != "shared":
+        logger.warning("VECTOR_LAYOUT is not 'shared'; set it before starting the API on the migrated data")
+    config.VECTOR_LAYOUT = "shared"
+    store = QdrantVectorStore()
+
+    repo_ids = args.repo_ids
+    if not repo_ids:
+        with Session(engine) as session:
+            repo_ids = list(session.exec(select(Repository.id)).all())
+    total = sum(migrate_repository(store, repo_id, args.delete_old) for repo_id in repo_ids)
+    logger.info(f"Migrated {total} points from {len(repo_ids)} repositories into {config.SHARED_COLLECTION}")
+
+if __name__ == '__main__':
+    sys.exit(main())
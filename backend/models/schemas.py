@@ -1,12 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class RepositoryBase(BaseModel):
     repo_url: str
 
 class RepositoryCreate(RepositoryBase):
-    pass
+    priority: int = 0  # higher-priority ingests are picked up first
 
 class RepositoryResponse(BaseModel):
     repo_id: str
@@ -18,6 +18,11 @@ class RepositoryResponse(BaseModel):
     created_at: datetime
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
+    stage_timings: Optional[Dict[str, float]] = None  # seconds per stage of the last ingest or refresh
+    # Live progress of the running job (only while the API process receives its events)
+    stage: Optional[str] = None  # started | cloned | discovered | fetched | embedded | upserted | completed | failed
+    chunks_embedded: Optional[int] = None
+    vectors_upserted: Optional[int] = None
 
     class Config:
         from_attributes = True
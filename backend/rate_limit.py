@@ -0,0 +1,6 @@
+from slowapi import Limiter
+from slowapi.util import get_remote_address
+
+# Shared by main (app.state) and the routes that decorate endpoints with it;
+# kept out of backend.main so routes can import it without a cycle
+limiter = Limiter(key_func=get_remote_address)
@@ -1,24 +1,39 @@
 import json
+import asyncio
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from backend.models.schemas import ChatRequest
-from backend.services.embedding_service import embedding_service
-from backend.services.vector_service import vector_service
+from backend.services.retrieval_service import retrieval_service
 from backend.services.llm_service import llm_service
-from backend.main import limiter
+from backend.services.answer_cache import answer_cache
+from backend.services.conversation import retrieval_query
+from backend.services.metrics import metrics
+from backend.services.progress_service import progress_service
+from backend.rate_limit import limiter
 
 router = APIRouter()
 
 @router.post("/stream")
 @limiter.limit("60/minute")
-async def chat(request: ChatRequest, req: Request):
-    # 1. Embed query
-    query_vector = embedding_service.generate_embeddings([request.message])[0]
-    
-    # 2. Search context
-    context = vector_service.search(request.repo_id, query_vector)
+async def chat(body: ChatRequest, request: Request):  # slowapi needs the Request named `request`
+    # 1-2. Search, rerank and pack context to the token budget (cached per repo);
+    # follow-up questions are searched together with the previous question
+    history = [m.model_dump() for m in (body.conversation_history or [])]
+    search_query = retrieval_query(body.message, history)
+    context = await retrieval_service.retrieve_context(body.repo_id, search_query)
+
+    # 3. Same question over the same context and index: replay the cached answer
+    # (index_version comes from the status cache, read off the event loop)
+    index_version = await asyncio.to_thread(progress_service.index_version, body.repo_id)
+    cache_key = answer_cache.key(body.repo_id, llm_service.model, index_version, context,
+                                 body.message, history)
+    query_vector = None
+    if answer_cache.similarity < 1.0:
+        query_vector = await retrieval_service.embed_query(search_query)  # cached by retrieval
+    cached_answer = answer_cache.get(cache_key, query_vector)
+    metrics.inc('coderag_chat_requests_total', answer_cache='miss' if cached_answer is None else 'hit')
     
-    # 3. Stream LLM response
+    # 4. Stream LLM response
     async def event_generator():
         # First send references
         references = [c['metadata'] for c in context]
@@ -36,8 +51,13 @@ async def chat(request: ChatRequest, req: Request):
         yield f"data: {json.dumps({'type': 'references', 'data': code_refs})}\n\n"
         
         # Then stream content
-        history = [m.model_dump() for m in (request.conversation_history or [])]
-        async for chunk in llm_service.chat_stream(request.message, context, history):
+        if cached_answer is not None:
+            for chunk in cached_answer:
+                yield f"data: {json.dumps({'type': 'content', 'data': chunk})}\n\n"
+            return
+
+        store = lambda chunks: answer_cache.set(cache_key, chunks, query_vector)
+        async for chunk in llm_service.chat_stream(body.message, context, history, on_complete=store):
             yield f"data: {json.dumps({'type': 'content', 'data': chunk})}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
@@ -1,74 +1,28 @@
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
-from sqlmodel import Session, select
+import asyncio
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
 from typing import List
 import uuid
 from datetime import datetime
 from backend.models.schemas import RepositoryCreate, RepositoryResponse, RepositoryListResponse
 from backend.services.github_service import github_service
-from backend.services.parser_service import parser_service
-from backend.services.embedding_service import embedding_service
+from backend.services.job_queue import job_queue
 from backend.services.vector_service import vector_service
+from backend.services.lexical_service import lexical_service
+from backend.services.retrieval_service import retrieval_service
+from backend.services.event_bus import event_bus
+from backend.services.progress_service import progress_service
 from backend.database import Repository, engine
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
 
-async def process_repository(repo_id: str, repo_url: str):
-    with Session(engine) as session:
-        repo = session.get(Repository, repo_id)
-        if not repo: return
-        
-        try:
-            repo.status = "processing"
-            session.add(repo)
-            session.commit()
-            
-            # 1. Clone
-            repo_path = github_service.clone_repository(repo_url, repo_id)
-            
-            # 2. Parse
-            files = parser_service.get_repo_files(repo_path)
-            repo.total_files = len(files)
-            session.add(repo)
-            session.commit()
-            
-            all_chunks = []
-            for i, file_path in enumerate(files):
-                chunks = parser_service.chunk_file(file_path, repo_path)
-                all_chunks.extend(chunks)
-                
-                # Update progress periodically to avoid DB thrashing
-                if i % 5 == 0 or i == len(files) - 1:
-                    repo.processed_files = i + 1
-                    repo.progress = (i + 1) / len(files)
-                    session.add(repo)
-                    session.commit()
-                
-            if all_chunks:
-                texts = [c['text'] for c in all_chunks]
-                payloads = [c['metadata'] for c in all_chunks]
-                
-                embeddings = embedding_service.generate_embeddings(texts)
-                vector_size = len(embeddings[0])
-                
-                vector_service.ensure_collection(repo_id, vector_size=vector_size)
-                vector_service.upsert_vectors(repo_id, embeddings, payloads)
-            
-            repo.status = "completed"
-            repo.completed_at = datetime.utcnow()
-            session.add(repo)
-            session.commit()
-            
-        except Exception as e:
-            import logging
-            logging.error(f"Error processing repo {repo_id}: {e}")
-            repo.status = "failed"
-            repo.error = str(e)
-            session.add(repo)
-            session.commit()
+router = APIRouter()
 
 @router.post("/ingest", response_model=RepositoryResponse)
 # @limiter.limit("5/hour") # Add to specific endpoints if needed via dependency
-async def ingest_repository(request: RepositoryCreate, background_tasks: BackgroundTasks):
+async def ingest_repository(request: RepositoryCreate):
     repo_id = str(uuid.uuid4())
     repo = Repository(
         id=repo_id,
@@ -82,7 +36,8 @@ async def ingest_repository(request: RepositoryCreate, background_tasks: Backgro
         session.commit()
         session.refresh(repo)
     
-    background_tasks.add_task(process_repository, repo_id, request.repo_url)
+    job_queue.enqueue(repo_id, "ingest", priority=request.priority)
+    progress_service.invalidate(repo_id)
     
     return RepositoryResponse(
         repo_id=repo.id,
@@ -91,30 +46,48 @@ async def ingest_repository(request: RepositoryCreate, background_tasks: Backgro
         created_at=repo.created_at
     )
 
-@router.get("/list", response_model=RepositoryListResponse)
-async def list_repositories():
+@router.post("/{repo_id}/refresh", response_model=RepositoryResponse)
+async def refresh_repository(repo_id: str, priority: int = 0):
     with Session(engine) as session:
-        repos = session.exec(select(Repository)).all()
-        return RepositoryListResponse(repositories=[
-            RepositoryResponse(
-                repo_id=r.id,
-                repo_url=r.repo_url,
-                status=r.status,
-                progress=r.progress,
-                total_files=r.total_files,
-                processed_files=r.processed_files,
-                created_at=r.created_at,
-                completed_at=r.completed_at,
-                error=r.error
-            ) for r in repos
-        ])
+        repo = session.get(Repository, repo_id)
+        if not repo:
+            raise HTTPException(status_code=404, detail="Repository not found")
+        if job_queue.has_pending(repo_id):
+            raise HTTPException(status_code=409, detail="Repository is already being indexed")
+        
+        job_queue.enqueue(repo_id, "refresh", priority=priority)
+        retrieval_service.invalidate(repo_id)
+        progress_service.invalidate(repo_id)
+        session.refresh(repo)
+        
+        return RepositoryResponse(
+            repo_id=repo.id,
+            repo_url=repo.repo_url,
+            status=repo.status,
+            progress=repo.progress,
+            total_files=repo.total_files,
+            processed_files=repo.processed_files,
+            created_at=repo.created_at,
+            completed_at=repo.completed_at,
+            error=repo.error
+        )
 
-@router.get("/status/{repo_id}", response_model=RepositoryResponse)
-async def get_repository(repo_id: str):
+@router.post("/{repo_id}/resume", response_model=RepositoryResponse)
+async def resume_repository(repo_id: str, priority: int = 0):
     with Session(engine) as session:
         repo = session.get(Repository, repo_id)
         if not repo:
             raise HTTPException(status_code=404, detail="Repository not found")
+        if repo.status == "completed":
+            raise HTTPException(status_code=409, detail="Repository is already indexed")
+        if job_queue.has_pending(repo_id):
+            raise HTTPException(status_code=409, detail="Repository is already being indexed")
+        
+        job_queue.enqueue(repo_id, "resume", priority=priority)
+        retrieval_service.invalidate(repo_id)
+        progress_service.invalidate(repo_id)
+        session.refresh(repo)
+        
         return RepositoryResponse(
             repo_id=repo.id,
             repo_url=repo.repo_url,
@@ -127,13 +100,59 @@ async def get_repository(repo_id: str):
             error=repo.error
         )
 
-@router.delete("/{repo_id}")
-async def delete_repository(repo_id: str):
+# Status reads are served from memory (see ProgressService), not one query per
+# poll; the periodic reload still queries SQLite, so they run off the event loop
+@router.get("/list", response_model=RepositoryListResponse)
+async def list_repositories():
+    return RepositoryListResponse(repositories=[
+        RepositoryResponse(**r) for r in await asyncio.to_thread(progress_service.list_repositories)
+    ])
+
+@router.get("/status/{repo_id}", response_model=RepositoryResponse)
+async def get_repository(repo_id: str):
+    repo = await asyncio.to_thread(progress_service.get, repo_id)
+    if not repo:
+        raise HTTPException(status_code=404, detail="Repository not found")
+    return RepositoryResponse(**repo)
+
+@router.get("/status/{repo_id}/stream")
+async def stream_repository_status(repo_id: str):
+    """
+    Server-sent events with the repository's status after every progress
+    update, until the job completes or fails.
+    """
+    if not await asyncio.to_thread(progress_service.get, repo_id):
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    async def event_generator():
+        async for repo in progress_service.watch(repo_id):
+            if repo is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {RepositoryResponse(**repo).model_dump_json()}\n\n"
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+def _delete_row(repo_id: str) -> bool:
     with Session(engine) as session:
         repo = session.get(Repository, repo_id)
-        if repo:
-            session.delete(repo)
-            session.commit()
-            github_service.cleanup(repo_id)
-            return {"status": "deleted"}
-    raise HTTPException(status_code=404, detail="Repository not found")
+        if not repo:
+            return False
+        session.delete(repo)
+        session.commit()
+    job_queue.cancel(repo_id)
+    return True
+
+@router.delete("/{repo_id}")
+async def delete_repository(repo_id: str):
+    if not await asyncio.to_thread(_delete_row, repo_id):
+        raise HTTPException(status_code=404, detail="Repository not found")
+    event_bus.publish({'type': 'repo_deleted', 'repo_id': repo_id})
+    # Best effort: the row is already gone, so one failing step (e.g. Qdrant
+    # unreachable) must not skip the others
+    for cleanup in (vector_service.delete_collection, lexical_service.delete_repo, github_service.cleanup):
+        try:
+            await asyncio.to_thread(cleanup, repo_id)
+        except Exception as e:
+            logger.error(f"Cleanup of deleted repository {repo_id} failed in {cleanup.__qualname__}: {e}")
+    return {"status": "deleted"}
@@ -0,0 +1,98 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from backend.config import config
+from backend.services.event_bus import event_bus
+from backend.services.query_cache import TTLCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+class AnswerCache:
+    """
+    Caches complete LLM answers (as the streamed chunks) per
+
+        (repo_id, model, index_version, context hash, history hash, message)
+
+    The context hash covers the ids and line ranges of the chunks sent to
+    the model, so an answer is only replayed for the same prompt. On an
+    exact miss, an earlier question with the same context and history whose
+    query embedding is at least ANSWER_CACHE_SIMILARITY similar also counts.
+    """
+
+    def __init__(self):
+        self.answers = TTLCache(config.ANSWER_CACHE_SIZE, config.ANSWER_CACHE_TTL)
+        self.similarity = config.ANSWER_CACHE_SIMILARITY
+        # (repo_id, model, version, context, history) -> {message: unit query vector}
+        self._questions: "OrderedDict[Tuple, OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.near_hits = 0
+        event_bus.subscribe(self._on_event)
+
+    def _on_event(self, event: Dict):
+        if event.get('type') in ('index_updated', 'repo_deleted'):
+            self.invalidate(event['repo_id'])
+
+    def key(self, repo_id: str, model: str, index_version: int, context: List[Dict],
+            message: str, history: List[Dict]) -> Tuple:
+        context_ids = [
+            (str(c['id']), c['metadata']['file_path'], c['metadata']['start_line'], c['metadata']['end_line'])
+            for c in context
+        ]
+        history_hash = _digest([(m['role'], m['content']) for m in history]) if history else ''
+        return (repo_id, model, index_version, _digest(context_ids), history_hash, normalize_query(message))
+
+    def get(self, key: Tuple, query_vector: Optional[np.ndarray] = None) -> Optional[List[str]]:
+        chunks = self.answers.get(key)
+        if chunks is not None or query_vector is None or self.similarity >= 1.0:
+            return chunks
+
+        with self._lock:
+            questions = self._questions.get(key[:-1])
+            if not questions:
+                return None
+            messages = list(questions)
+            matrix = np.stack([questions[m] for m in messages])
+        scores = matrix @ (query_vector / max(float(np.linalg.norm(query_vector)), 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        chunks = self.answers.get(key[:-1] + (messages[best],))
+        if chunks is not None:
+            self.near_hits += 1
+            logger.info(f"Answer cache near-duplicate hit ({scores[best]:.3f}): {messages[best]!r}")
+        return chunks
+
+    def set(self, key: Tuple, chunks: List[str], query_vector: Optional[np.ndarray] = None):
+        if not chunks:
+            return
+        self.answers.set(key, list(chunks))
+        if query_vector is None:
+            return
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            group = self._questions.setdefault(key[:-1], OrderedDict())
+            self._questions.move_to_end(key[:-1])
+            group[key[-1]] = vector
+            # Both levels are bounded the same way as the answers themselves
+            while len(group) > config.ANSWER_CACHE_SIZE:
+                group.popitem(last=False)
+            while len(self._questions) > config.ANSWER_CACHE_SIZE:
+                self._questions.popitem(last=False)
+
+    def invalidate(self, repo_id: str):
+        dropped = self.answers.invalidate(lambda key: key[0] == repo_id)
+        with self._lock:
+            for group in [g for g in self._questions if g[0] == repo_id]:
+                del self._questions[group]
+        if dropped:
+            logger.info(f"Dropped {dropped} cached answers for {repo_id}")
+
+answer_cache = AnswerCache()
@@ -0,0 +1,215 @@
+import logging
+import threading
+from typing import List, Optional, Tuple
+from backend.services.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    from tree_sitter_languages import get_parser
+except ImportError:
+    try:
+        from tree_sitter_language_pack import get_parser
+    except ImportError:
+        get_parser = None
+
+# A segment is an inclusive, 0-based line range plus the symbols it defines
+Segment = Tuple[int, int, List[str]]
+
+EXTENSION_LANGUAGES = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'tsx',
+    '.go': 'go',
+    '.rs': 'rust',
+    '.java': 'java',
+    '.cpp': 'cpp',
+    '.c': 'c',
+}
+
+# Node types that define a named symbol, per language
+DEFINITION_NODES = {
+    'python': {'function_definition', 'class_definition', 'decorated_definition'},
+    'javascript': {'function_declaration', 'generator_function_declaration', 'class_declaration',
+                   'method_definition', 'lexical_declaration', 'export_statement'},
+    'typescript': {'function_declaration', 'generator_function_declaration', 'class_declaration',
+                   'abstract_class_declaration', 'method_definition', 'lexical_declaration',
+                   'export_statement', 'interface_declaration', 'type_alias_declaration', 'enum_declaration'},
+    'go': {'function_declaration', 'method_declaration', 'type_declaration'},
+    'rust': {'function_item', 'impl_item', 'struct_item', 'enum_item', 'trait_item', 'mod_item'},
+    'java': {'class_declaration', 'interface_declaration', 'enum_declaration', 'record_declaration',
+             'method_declaration', 'constructor_declaration'},
+    'c': {'function_definition', 'struct_specifier', 'enum_specifier', 'type_definition'},
+    'cpp': {'function_definition', 'class_specifier', 'struct_specifier', 'enum_specifier',
+            'namespace_definition', 'template_declaration', 'type_definition'},
+}
+DEFINITION_NODES['tsx'] = DEFINITION_NODES['typescript']
+
+def _unique(symbols: List[str]) -> List[str]:
+    return list(dict.fromkeys(symbols))
+
+class LineChunker:
+    """
+    Fixed-size line windows with overlap. Used for files tree-sitter can't parse.
+    """
+
+    def __init__(self, chunk_size: int = 50, overlap: int = 10):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def chunk(self, content: str, extension: str) -> List[Segment]:
+        lines = content.split('\n')
+        segments = []
+        for i in range(0, len(lines), self.chunk_size - self.overlap):
+            end = min(i + self.chunk_size, len(lines))
+            segments.append((i, end - 1, []))
+            if end == len(lines):
+                break
+        return segments
+
+class SyntaxChunker:
+    """
+    Chunks along function/class/method boundaries using tree-sitter.
+
+    Top-level nodes become segments. Segments over the token budget are
+    split into their child definitions (e.g. a class into its methods) and,
+    failing that, into budget-sized line windows. Adjacent small segments
+    are then merged while they fit in the budget.
+    """
+
+    def __init__(self, token_budget: int, min_tokens: int, fallback: LineChunker):
+        self.token_budget = token_budget
+        self.min_tokens = min_tokens
+        self.fallback = fallback
+        # tree-sitter parsers are not thread-safe
+        self._local = threading.local()
+
+    @staticmethod
+    def available() -> bool:
+        return get_parser is not None
+
+    def _parser(self, language: str):
+        parsers = getattr(self._local, 'parsers', None)
+        if parsers is None:
+            parsers = self._local.parsers = {}
+        if language not in parsers:
+            parsers[language] = get_parser(language)
+        return parsers[language]
+
+    def chunk(self, content: str, extension: str) -> List[Segment]:
+        language = EXTENSION_LANGUAGES.get(extension)
+        if get_parser is None or language is None:
+            return self.fallback.chunk(content, extension)
+
+        try:
+            tree = self._parser(language).parse(content.encode('utf-8'))
+        except Exception as e:
+            logger.warning(f"tree-sitter failed for {language}: {e}; falling back to line windows")
+            return self.fallback.chunk(content, extension)
+
+        lines = content.split('\n')
+        line_tokens = [count_tokens(line) + 1 for line in lines]
+        segments = self._split(tree.root_node, lines, line_tokens, DEFINITION_NODES[language], prefix=None)
+        return self._merge(segments, line_tokens)
+
+    def _tokens(self, line_tokens: List[int], start: int, end: int) -> int:
+        return sum(line_tokens[start:end + 1])
+
+    def _symbol(self, node, prefix: Optional[str]) -> Optional[str]:
+        name = node.child_by_field_name('name')
+        if name is None:
+            # decorated_definition / export_statement / template_declaration wrap the real definition
+            inner = node.child_by_field_name('definition') or node.child_by_field_name('declaration')
+            if inner is None:
+                for child in node.named_children:
+                    if child.child_by_field_name('name') is not None:
+                        inner = child
+                        break
+            if inner is not None:
+                name = inner.child_by_field_name('name')
+            if name is None:
+                # e.g. `const handler = () => ...` keeps its name in a declarator
+                for child in node.named_children:
+                    name = child.child_by_field_name('name')
+                    if name is not None:
+                        break
+        if name is None:
+            return None
+        text = name.text.decode('utf-8', errors='ignore')
+        return f"{prefix}.{text}" if prefix else text
+
+    def _split(self, node, lines: List[str], line_tokens: List[int], definitions: set,
+               prefix: Optional[str]) -> List[Segment]:
+        segments: List[Segment] = []
+        cursor = node.start_point[0]
+
+        for child in node.named_children:
+            start, end = max(child.start_point[0], cursor), child.end_point[0]
+            if start > end:
+                continue  # several nodes on one line; already covered
+            symbol = self._symbol(child, prefix) if child.type in definitions else None
+            # Statements inside a definition belong to the enclosing symbol
+            owner = symbol or prefix
+
+            if self._tokens(line_tokens, start, end) <= self.token_budget:
+                segments.append((start, end, [owner] if owner else []))
+            else:
+                # Too big: descend into nested definitions (class -> methods),
+                # keeping the header lines before the first child with it
+                nested = self._split(child, lines, line_tokens, definitions, prefix=symbol or prefix) \
+                    if child.named_children else []
+                nested = [s for s in nested if s[0] >= start]
+                if len(nested) > 1:
+                    first_start, first_end, first_symbols = nested[0]
+                    nested[0] = (start, first_end, _unique(([symbol] if symbol else []) + first_symbols))
+                    last_start, _, last_symbols = nested[-1]
+                    nested[-1] = (last_start, end, last_symbols)
+                    segments.extend(nested)
+                else:
+                    segments.extend(self._split_lines(start, end, line_tokens, owner))
+            cursor = end + 1
+
+        # Attach uncovered trailing lines (closing braces, comments) to the last segment
+        last_row = node.end_point[0]
+        if segments and segments[-1][1] < last_row:
+            s, _, symbols = segments[-1]
+            segments[-1] = (s, last_row, symbols)
+        return segments
+
+    def _split_lines(self, start: int, end: int, line_tokens: List[int], symbol: Optional[str]) -> List[Segment]:
+        segments = []
+        window_start, tokens = start, 0
+        for row in range(start, end + 1):
+            if tokens and tokens + line_tokens[row] > self.token_budget:
+                segments.append((window_start, row - 1, [symbol] if symbol else []))
+                window_start, tokens = row, 0
+            tokens += line_tokens[row]
+        segments.append((window_start, end, [symbol] if symbol else []))
+        return segments
+
+    def _merge(self, segments: List[Segment], line_tokens: List[int]) -> List[Segment]:
+        merged: List[Segment] = []
+        merged_tokens: List[int] = []
+        for start, end, symbols in segments:
+            tokens = self._tokens(line_tokens, start, end)
+            if merged:
+                prev_start, prev_end, prev_symbols = merged[-1]
+                combined = self._tokens(line_tokens, prev_start, end)
+                small = merged_tokens[-1] < self.min_tokens or tokens < self.min_tokens
+                if small and combined <= self.token_budget:
+                    merged[-1] = (prev_start, end, _unique(prev_symbols + symbols))
+                    merged_tokens[-1] = combined
+                    continue
+            merged.append((start, end, symbols))
+            merged_tokens.append(tokens)
+        return merged
+
+def get_chunker(name: str, token_budget: int, min_tokens: int):
+    fallback = LineChunker()
+    if name == "lines":
+        return fallback
+    if not SyntaxChunker.available():
+        logger.warning("tree-sitter is not installed; using fixed line windows for chunking")
+        return fallback
+    return SyntaxChunker(token_budget, min_tokens, fallback)
@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional
+from backend.services.token_counter import count_tokens
+
+def format_snippet(hit: Dict) -> str:
+    """
+    How a chunk appears in the LLM prompt; also what the packer counts.
+    """
+    metadata = hit['metadata']
+    return (f"File: {metadata['file_path']}\nLines: {metadata['start_line']}-{metadata['end_line']}\n"
+            f"Content:\n{hit['text']}")
+
+def merge_ranges(hits: List[Dict]) -> List[Dict]:
+    """
+    Merges hits from the same file whose line ranges overlap or touch into
+    one hit, so no line is sent twice. Chunks are exact line slices of the
+    file, which lets overlapping texts be stitched together line by line.
+    The merged hit keeps the rank of its best part; input order is rank order.
+
+    Run it on the hits pack_context() selected, not on all candidates:
+    a merged hit is never longer than its parts together, so it still fits
+    the budget, and low-ranked neighbours can't pull a top hit out of it.
+    """
+    by_file: Dict[str, List[tuple]] = {}
+    for rank, hit in enumerate(hits):
+        by_file.setdefault(hit['metadata']['file_path'], []).append((rank, hit))
+
+    merged: List[tuple] = []
+    for parts in by_file.values():
+        parts.sort(key=lambda part: part[1]['metadata']['start_line'])
+        current_rank, current = parts[0]
+        current = _copy(current)
+        for rank, hit in parts[1:]:
+            meta, cur_meta = hit['metadata'], current['metadata']
+            if meta['start_line'] <= cur_meta['end_line'] + 1:
+                if meta['end_line'] > cur_meta['end_line']:
+                    skip = cur_meta['end_line'] - meta['start_line'] + 1
+                    tail = hit['text'].split('\n')[skip:]
+                    current['text'] = '\n'.join([current['text']] + tail)
+                    cur_meta['end_line'] = meta['end_line']
+                cur_meta['symbols'] = list(dict.fromkeys((cur_meta.get('symbols') or []) + (meta.get('symbols') or [])))
+                if rank < current_rank:
+                    current_rank = rank
+                    current['focus'] = (meta['start_line'], meta['end_line'])
+            else:
+                merged.append((current_rank, current))
+                current_rank, current = rank, _copy(hit)
+        merged.append((current_rank, current))
+
+    merged.sort(key=lambda item: item[0])
+    return [hit for _, hit in merged]
+
+def _copy(hit: Dict) -> Dict:
+    # 'focus' is the line range of the best-ranked part, which truncation keeps
+    meta = hit['metadata']
+    return {**hit, 'metadata': dict(meta), 'focus': hit.get('focus', (meta['start_line'], meta['end_line']))}
+
+def pack_context(hits: List[Dict], token_budget: int, min_partial_tokens: int = 64) -> List[Dict]:
+    """
+    Takes hits in rank order until token_budget (prompt tokens of the
+    formatted snippets) is used up. A hit that doesn't fit is cut to the
+    lines that fit, starting at its best-ranked part ('focus', set by
+    merge_ranges; otherwise its first line), if at least min_partial_tokens
+    of budget remain.
+    """
+    packed = []
+    remaining = token_budget
+    for hit in hits:
+        tokens = count_tokens(format_snippet(hit))
+        if tokens <= remaining:
+            packed.append(hit)
+            remaining -= tokens
+            continue
+        if remaining >= min_partial_tokens:
+            partial = _truncate(hit, remaining)
+            if partial is not None:
+                packed.append(partial)
+        break
+    return packed
+
+def _truncate(hit: Dict, budget: int) -> Optional[Dict]:
+    # Per-line counts (+1 for the newline) slightly overestimate, which is the safe side
+    lines = hit['text'].split('\n')
+    start_line = hit['metadata']['start_line']
+    focus_start = hit.get('focus', (start_line, start_line))[0]
+    first = min(max(focus_start - start_line, 0), len(lines) - 1)
+
+    used = count_tokens(format_snippet({**hit, 'text': ''}))
+    # Grow a window from the focus downwards, then upwards with what is left
+    end = first
+    while end < len(lines) and used + count_tokens(lines[end]) + 1 <= budget:
+        used += count_tokens(lines[end]) + 1
+        end += 1
+    if end == first:
+        return None
+    begin = first
+    while end == len(lines) and begin > 0 and used + count_tokens(lines[begin - 1]) + 1 <= budget:
+        begin -= 1
+        used += count_tokens(lines[begin]) + 1
+    return {**hit, 'text': '\n'.join(lines[begin:end]),
+            'metadata': {**hit['metadata'], 'start_line': start_line + begin, 'end_line': start_line + end - 1}}
@@ -0,0 +1,83 @@
+import re
+from typing import Dict, List
+from backend.config import config
+from backend.services.token_counter import count_tokens, truncate_tokens
+
+CODE_BLOCK = re.compile(r'```[^\n]*\n(.*?)```', re.S)
+
+# Per-message framing tokens in the chat format (role, separators)
+MESSAGE_OVERHEAD = 4
+
+def count_prompt_tokens(messages: List[Dict]) -> int:
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD for m in messages) + 2
+
+def _dedupe_code(content: str, context: List[Dict]) -> str:
+    """
+    Replaces code blocks that are already part of this turn's context with
+    a pointer to the snippet, so the same code isn't in the prompt twice.
+    """
+    def replace(match):
+        code = match.group(1).strip()
+        if len(code) >= 40:
+            for c in context:
+                if code in c['text']:
+                    m = c['metadata']
+                    return f"[code from {m['file_path']} lines {m['start_line']}-{m['end_line']}, see context]"
+        return match.group(0)
+    return CODE_BLOCK.sub(replace, content)
+
+def _brief(content: str, max_tokens: int) -> str:
+    text = CODE_BLOCK.sub('[code]', content)
+    text = re.sub(r'\s+', ' ', text).strip()
+    short = truncate_tokens(text, max_tokens)
+    return short if short == text else short.rstrip() + '...'
+
+def compact_history(history: List[Dict], context: List[Dict]) -> List[Dict]:
+    """
+    Fits the conversation into HISTORY_TOKEN_BUDGET: the most recent turns
+    are kept verbatim (minus code already in context), older ones become a
+    short extractive summary of at most HISTORY_SUMMARY_TOKENS, and
+    anything older than that is dropped.
+    """
+    messages = [{'role': m['role'], 'content': _dedupe_code(m['content'], context)} for m in history]
+
+    kept: List[Dict] = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(message['content']) + MESSAGE_OVERHEAD
+        if used + tokens > config.HISTORY_TOKEN_BUDGET:
+            if not kept:
+                # The latest turn alone is over budget: keep its beginning
+                room = config.HISTORY_TOKEN_BUDGET - MESSAGE_OVERHEAD
+                kept.append({'role': message['role'], 'content': truncate_tokens(message['content'], room)})
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages[:len(messages) - len(kept)]):
+        line = f"- {message['role']}: {_brief(message['content'], 60)}"
+        tokens = count_tokens(line) + 1
+        if used + tokens > config.HISTORY_SUMMARY_TOKENS:
+            break
+        lines.append(line)
+        used += tokens
+    if not lines:
+        return kept
+    summary = "Summary of earlier conversation turns:\n" + "\n".join(reversed(lines))
+    return [{'role': 'system', 'content': summary}] + kept
+
+def retrieval_query(message: str, history: List[Dict]) -> str:
+    """
+    Search query for a turn. Follow-ups ("and where is it called?") only
+    make sense with the previous question, so recent user turns are
+    appended after the message (which stays first, ahead of any truncation
+    by the embedding model).
+    """
+    turns = config.RETRIEVAL_HISTORY_TURNS
+    previous = [m['content'] for m in history if m['role'] == 'user'][-turns:] if turns > 0 else []
+    if not previous:
+        return message
+    return ' '.join([message] + [_brief(p, 64) for p in reversed(previous)])
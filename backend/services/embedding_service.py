@@ -1,31 +1,246 @@
+import os
+import atexit
+import asyncio
 import logging
-from typing import List
-from sentence_transformers import SentenceTransformer
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+import numpy as np
 from backend.config import config
+from backend.services.embedding_cache import EmbeddingCache
 
 logger = logging.getLogger(__name__)
 
+class QueryBatcher:
+    """
+    Micro-batches query embeddings off the event loop: queries submitted
+    within window_ms of each other are encoded together on a dedicated
+    thread, so concurrent chat requests share one encode call.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], window_ms: float, max_batch: int):
+        self._encode = encode
+        self.window = window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embed")
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        def _resolve(task: asyncio.Future):
+            # exception() raises CancelledError on a cancelled task (e.g. the
+            # loop shutting down), which would leave every caller waiting
+            cancelled = task.cancelled()
+            error = None if cancelled else task.exception()
+            for i, (_, future) in enumerate(batch):
+                if future.done():  # caller went away
+                    continue
+                if cancelled:
+                    future.cancel()
+                elif error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(task.result()[i])
+
+        task = loop.run_in_executor(self._executor, self._encode, [text for text, _ in batch])
+        task.add_done_callback(_resolve)
+
 class EmbeddingService:
+    """
+    Local sentence-transformers embeddings, run by torch or (EMBEDDING_BACKEND=onnx)
+    by ONNX Runtime. The model is loaded on first use or by warmup(), not at
+    import, so importing the app stays fast.
+    """
+
     def __init__(self):
         model_name = config.EMBEDDING_MODEL
         # Fallback if config points to an OpenAI model but we want local processing
         if "openai" in model_name.lower():
             logger.warning(f"Embedding model {model_name} looks like OpenAI. Falling back to local all-MiniLM-L6-v2.")
             model_name = "sentence-transformers/all-MiniLM-L6-v2"
-            
-        logger.info(f"Initializing embedding model: {model_name}")
+        self.model_name = model_name
+        # What actually encodes: "torch", or "onnx-int8"/"onnx-none" once an exported model loaded
+        self.backend = "torch"
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self.batch_size = config.EMBEDDING_BATCH_SIZE
+        # Each ingest worker process runs its own pool, so the automatic size
+        # splits the cores between them and leaves one for parsing and upserts
+        self.workers = max(1, config.EMBEDDING_WORKERS
+                           or (os.cpu_count() or 1) // max(1, config.INGEST_WORKERS) - 1)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Queries skip the on-disk cache: they rarely repeat across restarts, and
+        # retrieval already keeps recent ones in memory
+        self._query_batcher = QueryBatcher(
+            self._encode, config.QUERY_BATCH_WINDOW_MS, config.QUERY_BATCH_MAX_SIZE
+        )
+
+        self.cache = None
+        if config.EMBEDDING_CACHE_MAX_MB > 0:
+            self.cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+                    self._check_chunk_budget(self._model)
+        return self._model
+
+    @staticmethod
+    def _check_chunk_budget(model):
+        max_seq_length = getattr(model, "max_seq_length", None)
+        if max_seq_length and config.CHUNK_TOKEN_BUDGET > max_seq_length:
+            logger.warning(
+                f"CHUNK_TOKEN_BUDGET={config.CHUNK_TOKEN_BUDGET} exceeds the embedding model's "
+                f"max_seq_length of {max_seq_length} wordpieces; the end of larger chunks is not embedded"
+            )
+
+    def _load_model(self):
+        if config.EMBEDDING_BACKEND == "onnx":
+            model = self._load_onnx_model()
+            if model is not None:
+                return model
+
+        from sentence_transformers import SentenceTransformer
+        logger.info(f"Initializing embedding model: {self.model_name}")
         try:
-            self.model = SentenceTransformer(model_name)
+            return SentenceTransformer(self.model_name)
         except Exception as e:
-            logger.error(f"Failed to load model {model_name}: {e}. Trying fallback.")
-            self.model = SentenceTransformer("all-MiniLM-L6-v2")
+            logger.error(f"Failed to load model {self.model_name}: {e}. Trying fallback.")
+            self.model_name = "all-MiniLM-L6-v2"
+            return SentenceTransformer(self.model_name)
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _load_onnx_model(self):
+        from backend.services.onnx_embedder import OnnxEmbedder, export_dir
+        # One process per ingest worker plus the API encode at the same time
+        threads = config.ONNX_THREADS or max(1, (os.cpu_count() or 1) // (max(0, config.INGEST_WORKERS) + 1))
+        model_dir = export_dir(config.ONNX_MODEL_DIR, self.model_name)
+        logger.info(f"Initializing ONNX embedding model: {model_dir} ({config.ONNX_QUANTIZE}, {threads} threads)")
         try:
-            embeddings = self.model.encode(texts)
-            return embeddings.tolist()
+            model = OnnxEmbedder(model_dir, quantize=config.ONNX_QUANTIZE, threads=threads)
+        except Exception as e:
+            logger.error(f"Failed to load ONNX model from {model_dir}: {e}. "
+                         f"Run `python -m backend.export_onnx`; falling back to torch.")
+            return None
+        self.backend = f"onnx-{config.ONNX_QUANTIZE}"
+        return model
+
+    @property
+    def cache_key(self) -> str:
+        # Quantized vectors differ slightly from torch's, so they are cached apart
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def warmup(self):
+        """
+        Loads the model and runs one encode, so the first real request does neither.
+        """
+        self._encode(["def warm_up(): return None"])
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Split the cores between workers instead of letting every
+                # worker's torch grab all of them
+                threads = max(1, (os.cpu_count() or 1) // self.workers)
+                previous = os.environ.get("OMP_NUM_THREADS")
+                os.environ["OMP_NUM_THREADS"] = str(threads)
+                try:
+                    logger.info(f"Starting embedding pool: {self.workers} workers x {threads} threads")
+                    self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+                finally:
+                    if previous is None:
+                        os.environ.pop("OMP_NUM_THREADS", None)
+                    else:
+                        os.environ["OMP_NUM_THREADS"] = previous
+                atexit.register(self.close)
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # Sort by length so every batch holds similar-sized texts and pads
+        # little; character length is the same proxy sentence-transformers uses.
+        order = np.argsort([len(t) for t in texts], kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        # The pool only pays off once every worker gets a few full batches;
+        # ONNX Runtime spreads a batch over its own threads instead
+        if self.workers > 1 and self.backend == "torch" and len(texts) >= self.batch_size * self.workers * 2:
+            encoded = self.model.encode_multi_process(
+                sorted_texts,
+                self._get_pool(),
+                batch_size=self.batch_size,
+                chunk_size=max(self.batch_size, len(texts) // (self.workers * 4))
+            )
+        else:
+            encoded = self.model.encode(sorted_texts, batch_size=self.batch_size, convert_to_numpy=True)
+
+        embeddings = np.empty_like(encoded, dtype=np.float32)
+        embeddings[order] = encoded
+        return embeddings
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Returns a (len(texts), dimension) float32 array.
+        """
+        try:
+            # Loads the model on first use, which also settles the cache key
+            dimension = self.dimension
+            if not texts:
+                return np.empty((0, dimension), dtype=np.float32)
+            if self.cache is None:
+                return self._encode(texts)
+
+            # Only texts missing from the cache reach the model
+            cached = self.cache.get_many(self.cache_key, texts)
+            missing = [i for i, v in enumerate(cached) if v is None]
+            embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+            for i, vector in enumerate(cached):
+                if vector is not None:
+                    embeddings[i] = vector
+            if missing:
+                encoded = self._encode([texts[i] for i in missing])
+                self.cache.put_many(self.cache_key, [texts[i] for i in missing], encoded)
+                embeddings[missing] = encoded
+            return embeddings
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
 
+    async def embed_query(self, text: str) -> np.ndarray:
+        """
+        Embeds a single chat query without blocking the event loop. Not
+        stored in the embedding cache.
+        """
+        return await self._query_batcher.embed(text)
+
 embedding_service = EmbeddingService()
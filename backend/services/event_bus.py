@@ -0,0 +1,72 @@
+import logging
+import threading
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+Event = Dict
+Subscriber = Callable[[Event], None]
+
+_STOP = {'type': '__stop__'}
+
+class EventBus:
+    """
+    In-process publish/subscribe for index events. Ingestion workers run in
+    other processes: there, publish() forwards events over a multiprocessing
+    queue, and the API process re-publishes them to its local subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Subscriber] = []
+        self._lock = threading.Lock()
+        self._forward_queue = None
+
+    def subscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+    def forward_to(self, queue):
+        """
+        Called in worker processes: send every event to the parent instead.
+        """
+        self._forward_queue = queue
+
+    def publish(self, event: Event):
+        if self._forward_queue is not None:
+            try:
+                self._forward_queue.put_nowait(event)
+            except Exception as e:
+                logger.warning(f"Dropping event {event.get('type')}: {e}")
+            return
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                logger.error(f"Event subscriber failed on {event.get('type')}: {e}")
+
+    def listen(self, queue) -> threading.Thread:
+        """
+        Called in the API process: re-publish events arriving from workers.
+        """
+        def _run():
+            while True:
+                try:
+                    event = queue.get()
+                except (EOFError, OSError):
+                    return
+                if event == _STOP:
+                    return
+                self.publish(event)
+
+        thread = threading.Thread(target=_run, name="event-bus-listener", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def stop_listener(queue):
+        queue.put(_STOP)
+
+event_bus = EventBus()
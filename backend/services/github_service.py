@@ -1,12 +1,30 @@
 import os
+import json
 import shutil
 import stat
+import hashlib
 import logging
+import tarfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
 from git import Repo
 from backend.config import config
 
+try:
+    import fcntl
+except ImportError:  # Windows: mirrors are only locked within this process
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+# Written into archive checkouts, which have no .git of their own
+SOURCE_FILE = '.coderag-source.json'
+
+# Mirrors track branches only; `clone --mirror` would fetch every ref,
+# including the thousands of refs/pull/* heads on busy GitHub repositories
+HEADS_REFSPEC = '+refs/heads/*:refs/heads/*'
+
 def _on_error(func, path, exc_info):
     """
     Error handler for shutil.rmtree to handle read-only files (common in .git folders)
@@ -27,26 +45,307 @@ def _safe_rmtree(path):
         except Exception as e:
             logger.error(f"Failed to delete {path}: {e}")
 
+def _batches(items: List, size: int = 500):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 class GitHubService:
+    """
+    Materializes repositories under REPOS_DIR/<repo_id>.
+
+    With CLONE_STRATEGY=mirror (the default) every URL gets one bare, by
+    default blobless, clone of its branches under MIRRORS_DIR that is
+    shared by all repo_ids ingesting it, so re-ingesting a URL is a fetch rather than a
+    clone. Checkouts are either git worktrees of the mirror or, with
+    CHECKOUT_MODE=archive, plain directories holding only the files that
+    will be indexed, extracted from a `git archive` stream.
+    """
+
     def __init__(self):
         self.repos_dir = config.REPOS_DIR
+        self.mirrors_dir = config.MIRRORS_DIR
+        self.strategy = config.CLONE_STRATEGY
+        self.checkout_mode = config.CHECKOUT_MODE
+        if self.strategy not in ('mirror', 'shallow', 'full'):
+            raise ValueError(f"Unknown CLONE_STRATEGY: {self.strategy}")
+        if self.checkout_mode not in ('worktree', 'archive'):
+            raise ValueError(f"Unknown CHECKOUT_MODE: {self.checkout_mode}")
         os.makedirs(self.repos_dir, exist_ok=True)
+        os.makedirs(self.mirrors_dir, exist_ok=True)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def clone_repository(self, repo_url: str, repo_id: str,
+                         include: Optional[Callable[[str], bool]] = None) -> str:
+        """
+        Checks out the remote HEAD of repo_url at repo_path(repo_id). include
+        limits archive checkouts to the paths it accepts.
+        """
+        repo_path = self.repo_path(repo_id)
 
-    def clone_repository(self, repo_url: str, repo_id: str) -> str:
-        repo_path = os.path.join(self.repos_dir, repo_id)
-        
-        # Clean up existing directory if it exists
-        if os.path.exists(repo_path):
-            _safe_rmtree(repo_path)
-            
-        logger.info(f"Cloning {repo_url} to {repo_path}")
-        Repo.clone_from(repo_url, repo_path)
+        # Clean up existing checkout if it exists
+        self.cleanup(repo_id)
+
+        if self.strategy == 'mirror':
+            mirror = self._update_mirror(repo_url)
+            with self._mirror_lock(mirror):
+                sha = Repo(mirror).git.rev_parse('HEAD')
+                if self.checkout_mode == 'worktree':
+                    logger.info(f"Adding worktree {repo_path} at {sha[:12]} from {mirror}")
+                    Repo(mirror).git.worktree('add', '--detach', '--force', repo_path, sha)
+                else:
+                    os.makedirs(repo_path)
+                    paths = self._prefetch_blobs(mirror, sha, include)
+                    self._extract(mirror, sha, paths, repo_path)
+                    self._write_source(repo_path, mirror, sha)
+            return repo_path
+
+        logger.info(f"Cloning {repo_url} to {repo_path} ({self.strategy})")
+        if self.strategy == 'shallow':
+            Repo.clone_from(repo_url, repo_path, depth=1, no_tags=True)
+        else:
+            Repo.clone_from(repo_url, repo_path)
         return repo_path
 
+    def repo_path(self, repo_id: str) -> str:
+        return os.path.join(self.repos_dir, repo_id)
+
+    def mirror_path(self, repo_url: str) -> str:
+        normalized = repo_url.strip().rstrip('/')
+        if normalized.endswith('.git'):
+            normalized = normalized[:-4]
+        name = os.path.basename(normalized) or 'repo'
+        digest = hashlib.sha1(normalized.lower().encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.mirrors_dir, f"{name}-{digest}.git")
+
+    def has_checkout(self, repo_path: str) -> bool:
+        return os.path.exists(os.path.join(repo_path, '.git')) or os.path.exists(os.path.join(repo_path, SOURCE_FILE))
+
+    def head_commit(self, repo_path: str) -> str:
+        source = self._read_source(repo_path)
+        if source:
+            return source['sha']
+        return Repo(repo_path).head.commit.hexsha
+
+    def fetch_updates(self, repo_id: str, include: Optional[Callable[[str], bool]] = None) -> Tuple[str, str]:
+        """
+        Fetches new commits for an existing checkout and moves the working tree
+        to the remote HEAD. Returns (old_sha, new_sha).
+        """
+        repo_path = self.repo_path(repo_id)
+        mirror = self._mirror_of(repo_path)
+        if mirror is None:
+            return self._fetch_clone(repo_id)
+
+        old_sha = self.head_commit(repo_path)
+        logger.info(f"Fetching updates for {repo_id} into {mirror}")
+        with self._mirror_lock(mirror):
+            self._fetch_mirror(mirror)
+            new_sha = Repo(mirror).git.rev_parse('HEAD')
+            if old_sha == new_sha:
+                return old_sha, new_sha
+            source = self._read_source(repo_path)
+            if source is None:
+                Repo(repo_path).git.reset('--hard', new_sha)
+                return old_sha, new_sha
+
+            # Archive checkout: rewrite only the files that changed
+            changed, deleted = self.diff_files(repo_path, old_sha, new_sha)
+            for path in deleted + changed:
+                full_path = os.path.join(repo_path, path)
+                if os.path.exists(full_path):
+                    os.remove(full_path)
+            wanted = [p.replace(os.sep, '/') for p in changed if include is None or include(p)]
+            self._extract(mirror, new_sha, self._prefetch_blobs(mirror, new_sha, None, wanted), repo_path)
+            self._write_source(repo_path, mirror, new_sha)
+        return old_sha, new_sha
+
+    def _fetch_clone(self, repo_id: str) -> Tuple[str, str]:
+        repo = Repo(self.repo_path(repo_id))
+        old_sha = repo.head.commit.hexsha
+
+        origin = repo.remotes.origin
+        logger.info(f"Fetching updates for {repo_id}")
+        if repo.git.rev_parse('--is-shallow-repository') == 'true':
+            origin.fetch(depth=1)
+        else:
+            origin.fetch()
+
+        try:
+            target = repo.git.rev_parse("refs/remotes/origin/HEAD")
+        except Exception:
+            # origin/HEAD is missing on some clones; fall back to the tracked branch
+            tracking = repo.active_branch.tracking_branch()
+            target = tracking.commit.hexsha if tracking else old_sha
+
+        repo.git.reset("--hard", target)
+        return old_sha, repo.head.commit.hexsha
+
+    def diff_files(self, repo_path: str, old_sha: str, new_sha: str) -> Tuple[List[str], List[str]]:
+        """
+        Returns (changed, deleted) repository-relative paths between two commits.
+        Added and modified files count as changed; a rename is a delete plus an add.
+        """
+        changed, deleted = set(), set()
+        if old_sha == new_sha:
+            return [], []
+
+        # Archive checkouts are diffed in their mirror
+        repo = Repo(self._mirror_of(repo_path) if self._read_source(repo_path) else repo_path)
+        for diff in repo.commit(old_sha).diff(new_sha):
+            if diff.change_type == 'D':
+                deleted.add(diff.a_path)
+            elif diff.change_type == 'R':
+                deleted.add(diff.a_path)
+                changed.add(diff.b_path)
+            else:
+                changed.add(diff.b_path or diff.a_path)
+
+        # Payloads store OS-style relative paths (see ParserService.chunk_file)
+        return sorted(os.path.normpath(p) for p in changed), sorted(os.path.normpath(p) for p in deleted)
+
     def cleanup(self, repo_id: str):
-        repo_path = os.path.join(self.repos_dir, repo_id)
-        if os.path.exists(repo_path):
-            _safe_rmtree(repo_path)
-            logger.info(f"Cleaned up repository {repo_id}")
+        """
+        Removes the checkout of repo_id. Mirrors are kept for the next ingest of the same URL.
+        """
+        repo_path = self.repo_path(repo_id)
+        if not os.path.exists(repo_path):
+            return
+        mirror = self._mirror_of(repo_path)
+        _safe_rmtree(repo_path)
+        if mirror and os.path.isdir(mirror):
+            try:
+                Repo(mirror).git.worktree('prune')
+            except Exception as e:
+                logger.warning(f"Failed to prune worktrees of {mirror}: {e}")
+        logger.info(f"Cleaned up repository {repo_id}")
+
+    @contextmanager
+    def _mirror_lock(self, mirror: str):
+        """
+        Serializes fetches and checkouts of one mirror across threads and worker processes.
+        """
+        with self._locks_lock:
+            lock = self._locks.setdefault(mirror, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(mirror + '.lock', 'w') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _update_mirror(self, repo_url: str) -> str:
+        mirror = self.mirror_path(repo_url)
+        with self._mirror_lock(mirror):
+            if os.path.isdir(mirror):
+                logger.info(f"Fetching {repo_url} into existing mirror {mirror}")
+                self._fetch_mirror(mirror)
+            else:
+                logger.info(f"Mirroring {repo_url} to {mirror}")
+                options = {'bare': True}
+                if config.MIRROR_FILTER:
+                    # Servers without partial clone support ignore the filter (so does a
+                    # file:// source unless it sets uploadpack.allowFilter)
+                    options['filter'] = config.MIRROR_FILTER
+                try:
+                    # A bare clone fetches branches and tags but configures no refspec
+                    Repo.clone_from(repo_url, mirror, **options).git.config('remote.origin.fetch', HEADS_REFSPEC)
+                except Exception:
+                    _safe_rmtree(mirror)
+                    raise
+        return mirror
+
+    @staticmethod
+    def _fetch_mirror(mirror: str):
+        repo = Repo(mirror)
+        # Also narrows mirrors made by earlier versions with `clone --mirror`
+        repo.git.config('--replace-all', 'remote.origin.fetch', HEADS_REFSPEC)
+        repo.git.fetch('--prune', 'origin')
+
+    def _mirror_of(self, repo_path: str) -> Optional[str]:
+        """
+        The mirror behind a checkout, or None for a standalone clone.
+        """
+        source = self._read_source(repo_path)
+        if source:
+            return source['mirror']
+        if os.path.isfile(os.path.join(repo_path, '.git')):
+            # A worktree; its .git file points into the mirror
+            try:
+                common_dir = Repo(repo_path).git.rev_parse('--git-common-dir')
+                return os.path.normpath(os.path.join(repo_path, common_dir))
+            except Exception as e:
+                logger.warning(f"Could not resolve the mirror of {repo_path}: {e}")
+        return None
+
+    def _prefetch_blobs(self, mirror: str, sha: str, include: Optional[Callable[[str], bool]],
+                        paths: Optional[List[str]] = None) -> List[str]:
+        """
+        Fetches the blobs of the wanted paths at sha that a partial mirror
+        does not have yet, in a few batched requests instead of one lazy
+        fetch per file. Returns the wanted paths.
+        """
+        repo = Repo(mirror)
+        entries = {}
+        for line in repo.git.ls_tree('-r', '-z', sha).split('\0'):
+            if not line:
+                continue
+            meta, path = line.split('\t', 1)
+            _, kind, oid = meta.split()
+            if kind == 'blob':
+                entries[path] = oid
+        if paths is None:
+            paths = [p for p in entries if include is None or include(os.path.normpath(p))]
+        else:
+            paths = [p for p in paths if p in entries]
+
+        missing = {
+            line[1:] for line in repo.git.rev_list('--objects', '--no-walk', '--missing=print', sha).splitlines()
+            if line.startswith('?')
+        }
+        wanted = sorted({entries[p] for p in paths} & missing)
+        if wanted:
+            logger.info(f"Fetching {len(wanted)} of {len(missing)} missing blobs into {mirror}")
+            for batch in _batches(wanted, 1000):
+                repo.git(c='fetch.negotiationAlgorithm=noop').fetch(
+                    'origin', '--no-tags', '--no-write-fetch-head', '--filter=blob:none', *batch
+                )
+        return paths
+
+    def _extract(self, mirror: str, sha: str, paths: List[str], dest: str):
+        """
+        Streams `git archive` for the given paths into dest, skipping files over MAX_FILE_SIZE.
+        """
+        repo = Repo(mirror)
+        for batch in _batches(paths):
+            process = repo.git.archive('--format=tar', sha, '--', *batch, as_process=True,
+                                       env={'GIT_LITERAL_PATHSPECS': '1'})
+            try:
+                with tarfile.open(fileobj=process.stdout, mode='r|') as archive:
+                    for member in archive:
+                        if member.isfile() and member.size <= config.MAX_FILE_SIZE:
+                            archive.extract(member, dest, set_attrs=False)
+            finally:
+                # A failed archive shows up as a short tar stream; report git's error
+                # instead (closing stdout first so git cannot block writing to it)
+                process.stdout.close()
+                stderr = process.stderr.read().decode('utf-8', errors='replace').strip()
+                if process.proc.wait() != 0:
+                    raise RuntimeError(f"git archive of {sha[:12]} from {mirror} failed: {stderr}")
+
+    def _read_source(self, repo_path: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(repo_path, SOURCE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_source(self, repo_path: str, mirror: str, sha: str):
+        with open(os.path.join(repo_path, SOURCE_FILE), 'w') as f:
+            json.dump({'mirror': mirror, 'sha': sha}, f)
 
 github_service = GitHubService()
@@ -0,0 +1,237 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from backend.config import config
+from backend.services.parser_service import parser_service
+from backend.services.embedding_service import embedding_service
+from backend.services.vector_service import vector_service, point_id
+from backend.services.lexical_service import lexical_service
+from backend.services.metrics import metrics, StageTimer
+from backend.services.token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Called with (files_done, chunks_done) every time a batch lands in the vector store
+ProgressCallback = Callable[[int, int], None]
+# Called with the number of chunks embedded so far
+EmbeddedCallback = Callable[[int], None]
+
+class IngestionService:
+    """
+    Bounded walk -> chunk -> embed -> upsert pipeline.
+
+    Chunks are grouped into fixed-size batches and at most MAX_INFLIGHT_BATCHES
+    batches exist at any time, so peak memory depends on the batch settings and
+    not on the size of the repository.
+    """
+
+    def __init__(self):
+        self.batch_size = config.INGEST_BATCH_SIZE
+        self.upsert_batch_size = config.UPSERT_BATCH_SIZE
+        self.max_inflight = max(1, config.MAX_INFLIGHT_BATCHES)
+        # The model already uses every core; run one encode at a time and
+        # overlap it with chunking and Qdrant upserts instead.
+        self._encode_lock = threading.Lock()
+
+    @staticmethod
+    def _timed_chunks(files: List[str], repo_path: str, timer: StageTimer) -> Iterator[List[Dict]]:
+        # Time spent waiting for each file's chunks (read + parse, or the chunking pool)
+        file_chunks = parser_service.iter_chunks(files, repo_path)
+        while True:
+            with timer.span('chunk'):
+                chunks = next(file_chunks, None)
+            if chunks is None:
+                return
+            metrics.inc('coderag_ingest_files_total')
+            yield chunks
+
+    def iter_batches(self, files: List[str], repo_path: str,
+                     timer: Optional[StageTimer] = None) -> Iterator[Tuple[List[Dict], int]]:
+        """
+        Yields (chunks, files_done) where files_done is the number of leading
+        files whose chunks are all contained in this or earlier batches.
+        """
+        pending: List[Tuple[int, Dict]] = []
+        for i, file_chunks in enumerate(self._timed_chunks(files, repo_path, timer or StageTimer())):
+            pending.extend((i, chunk) for chunk in file_chunks)
+            while len(pending) >= self.batch_size:
+                batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                files_done = pending[0][0] if pending else i + 1
+                yield [chunk for _, chunk in batch], files_done
+        if pending:
+            yield [chunk for _, chunk in pending], len(files)
+
+    @staticmethod
+    def _count_chunks(chunks: List[Dict]):
+        metrics.inc('coderag_ingest_chunks_total', len(chunks))
+        metrics.inc('coderag_ingest_tokens_total', sum(count_tokens(c['text']) for c in chunks))
+        metrics.inc('coderag_ingest_bytes_total', sum(len(c['text'].encode('utf-8')) for c in chunks))
+
+    def _embed_and_upsert(self, repo_id: str, chunks: List[Dict], timer: StageTimer,
+                          on_embedded: Callable[[int], None]) -> int:
+        texts = [c['text'] for c in chunks]
+        payloads = [{**c['metadata'], 'text': c['text']} for c in chunks]
+
+        with self._encode_lock:
+            with timer.span('embed'):
+                embeddings = embedding_service.generate_embeddings(texts)
+            on_embedded(len(chunks))
+
+        # Point ids are derived from the payload, so replaying a batch is idempotent
+        ids = [point_id(repo_id, p) for p in payloads]
+        with timer.span('upsert'):
+            vector_service.upsert_vectors(repo_id, embeddings, payloads, ids=ids, batch_size=self.upsert_batch_size)
+            lexical_service.index_chunks(repo_id, ids, payloads)
+        self._count_chunks(chunks)
+        return len(chunks)
+
+    def run(self, repo_id: str, repo_path: str, files: List[str], on_progress: ProgressCallback,
+            start_file: int = 0, timer: Optional[StageTimer] = None,
+            on_embedded: Optional[EmbeddedCallback] = None) -> int:
+        """
+        Streams every file of the repository into the vector store.
+
+        files must be in a stable order. on_progress only ever reports a
+        files_done watermark below which every batch has been committed, so
+        a crashed ingest can be resumed with start_file=<last watermark>.
+        Returns the number of chunks indexed. Stage durations are added to timer.
+        """
+        timer = timer or StageTimer()
+        vector_service.ensure_collection(repo_id, vector_size=embedding_service.dimension)
+
+        total_chunks = 0
+        embedded = 0
+
+        def _embedded(n_chunks: int):
+            # Runs under the encode lock, one batch at a time
+            nonlocal embedded
+            embedded += n_chunks
+            if on_embedded is not None:
+                on_embedded(embedded)
+
+        # Batches can finish out of order; only advance past contiguous ones
+        finished: Dict[int, int] = {}
+        next_seq = 0
+        batch_files_done: Dict[int, int] = {}
+
+        def _collect(done):
+            nonlocal total_chunks, next_seq
+            for future in done:
+                seq, n_chunks = future.result()
+                finished[seq] = n_chunks
+            watermark = None
+            while next_seq in finished:
+                total_chunks += finished.pop(next_seq)
+                watermark = batch_files_done.pop(next_seq)
+                next_seq += 1
+            if watermark is not None:
+                on_progress(watermark, total_chunks)
+
+        def _job(seq: int, chunks: List[Dict]):
+            return seq, self._embed_and_upsert(repo_id, chunks, timer, _embedded)
+
+        with ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="ingest") as executor:
+            inflight = set()
+            for seq, (chunks, files_done) in enumerate(self.iter_batches(files[start_file:], repo_path, timer)):
+                # Back-pressure: don't chunk further ahead than the embed/upsert stages
+                if len(inflight) >= self.max_inflight:
+                    done, inflight = wait(inflight, return_when=FIRST_COMPLETED)
+                    _collect(done)
+
+                batch_files_done[seq] = start_file + files_done
+                inflight.add(executor.submit(_job, seq, chunks))
+
+            done, _ = wait(inflight)
+            _collect(done)
+
+        logger.info(f"Indexed {total_chunks} chunks from {len(files) - start_file} files for {repo_id}")
+        if embedding_service.cache is not None:
+            logger.info(f"Embedding cache: {embedding_service.cache.stats()}")
+        return total_chunks
+
+    def _iter_file_groups(self, files: List[str], repo_path: str,
+                          timer: StageTimer) -> Iterator[Tuple[List[str], List[Dict], int]]:
+        """
+        Like iter_batches, but never splits a file across groups so each group
+        can be diffed against the points already stored for its files.
+        Yields (relative_paths, chunks, files_done).
+        """
+        paths, chunks = [], []
+        for i, (file_path, file_chunks) in enumerate(zip(files, self._timed_chunks(files, repo_path, timer))):
+            paths.append(os.path.relpath(file_path, repo_path))
+            chunks.extend(file_chunks)
+            if len(chunks) >= self.batch_size:
+                yield paths, chunks, i + 1
+                paths, chunks = [], []
+        if paths:
+            yield paths, chunks, len(files)
+
+    def refresh(self, repo_id: str, repo_path: str, changed: List[str], deleted: List[str],
+                on_progress: ProgressCallback, timer: Optional[StageTimer] = None,
+                on_embedded: Optional[EmbeddedCallback] = None) -> int:
+        """
+        Re-indexes only the given repository-relative files. Chunks whose
+        content hash is already stored reuse their vector; everything else is
+        embedded. Returns the number of chunks that had to be embedded.
+        """
+        timer = timer or StageTimer()
+        vector_service.ensure_collection(repo_id, vector_size=embedding_service.dimension)
+
+        files, deleted = [], list(deleted)
+        for rel_path in changed:
+            full_path = os.path.join(repo_path, rel_path)
+            if os.path.isfile(full_path) and os.path.getsize(full_path) <= config.MAX_FILE_SIZE:
+                files.append(full_path)
+            else:
+                deleted.append(rel_path)  # grew past MAX_FILE_SIZE or isn't a regular file
+
+        # Deleted (or renamed-away) files simply lose their points
+        with timer.span('upsert'):
+            vector_service.delete_file_points(repo_id, deleted)
+            lexical_service.delete_file_chunks(repo_id, deleted)
+
+        embedded = 0
+        total_chunks = 0
+        for paths, chunks, files_done in self._iter_file_groups(files, repo_path, timer):
+            known = {
+                p['payload'].get('content_hash'): p['vector']
+                for p in vector_service.get_file_points(repo_id, paths)
+            }
+            missing = [c for c in chunks if c['metadata']['content_hash'] not in known]
+            if missing:
+                with self._encode_lock, timer.span('embed'):
+                    fresh = embedding_service.generate_embeddings([c['text'] for c in missing])
+                known.update((c['metadata']['content_hash'], v) for c, v in zip(missing, fresh))
+                embedded += len(missing)
+                if on_embedded is not None:
+                    on_embedded(embedded)
+
+            # Upsert the new generation first, then drop the old one, so the
+            # files never disappear from search in between.
+            payloads = [{**c['metadata'], 'text': c['text']} for c in chunks]
+            ids = [point_id(repo_id, p) for p in payloads]
+            with timer.span('upsert'):
+                vector_service.upsert_vectors(
+                    repo_id,
+                    [known[c['metadata']['content_hash']] for c in chunks],
+                    payloads,
+                    ids=ids,
+                    batch_size=self.upsert_batch_size
+                )
+                vector_service.delete_file_points(repo_id, paths, keep_ids=ids)
+                lexical_service.index_chunks(repo_id, ids, payloads)
+                lexical_service.delete_file_chunks(repo_id, paths, keep_ids=ids)
+            self._count_chunks(chunks)
+
+            total_chunks += len(chunks)
+            on_progress(files_done, total_chunks)
+
+        logger.info(
+            f"Refreshed {repo_id}: {len(files)} changed files, {len(deleted)} deleted, "
+            f"{embedded}/{total_chunks} chunks embedded"
+        )
+        return embedded
+
+ingestion_service = IngestionService()
@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import exists, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+from backend.config import config
+from backend.database import IngestJob, Repository, engine
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job whose row stopped being 'running' while it ran
+    (cancelled, or requeued after missing its heartbeats).
+    """
+
+class JobQueue:
+    """
+    Durable ingestion queue stored in the SQLite database, so queued work
+    survives restarts. Any number of worker processes can poll it; claims
+    are atomic conditional updates.
+    """
+
+    def enqueue(self, repo_id: str, kind: str = "ingest", priority: int = 0) -> IngestJob:
+        with Session(engine) as session:
+            job = IngestJob(repo_id=repo_id, kind=kind, priority=priority)
+            session.add(job)
+            repo = session.get(Repository, repo_id)
+            if repo:
+                repo.status = "queued"
+                session.add(repo)
+            session.commit()
+            session.refresh(job)
+            logger.info(f"Queued {kind} job {job.id} for {repo_id} (priority {priority})")
+            return job
+
+    def has_pending(self, repo_id: str) -> bool:
+        with Session(engine) as session:
+            return session.exec(
+                select(IngestJob.id).where(
+                    IngestJob.repo_id == repo_id,
+                    IngestJob.status.in_(("queued", "running"))
+                )
+            ).first() is not None
+
+    def claim(self, worker_id: str) -> Optional[IngestJob]:
+        """
+        Claims the highest-priority queued job whose repository is not
+        already being processed by another worker.
+        """
+        with Session(engine) as session:
+            busy = select(IngestJob.repo_id).where(IngestJob.status == "running")
+            candidates = session.exec(
+                select(IngestJob)
+                .where(IngestJob.status == "queued", IngestJob.repo_id.not_in(busy))
+                .order_by(IngestJob.priority.desc(), IngestJob.id)
+                .limit(5)
+            ).all()
+
+            running = aliased(IngestJob)
+            for job in candidates:
+                now = datetime.utcnow()
+                # Re-check both conditions inside the (serialized) write
+                claimed = session.execute(
+                    update(IngestJob)
+                    .where(
+                        IngestJob.id == job.id,
+                        IngestJob.status == "queued",
+                        ~exists().where(running.repo_id == job.repo_id, running.status == "running")
+                    )
+                    .values(status="running", worker_id=worker_id, started_at=now,
+                            heartbeat_at=now, attempts=IngestJob.attempts + 1)
+                )
+                session.commit()
+                if claimed.rowcount == 1:
+                    session.refresh(job)
+                    return job
+            return None
+
+    def heartbeat(self, job_id: int) -> bool:
+        """
+        Returns False once the job is no longer running, e.g. cancelled.
+        """
+        with Session(engine) as session:
+            beat = session.execute(
+                update(IngestJob)
+                .where(IngestJob.id == job_id, IngestJob.status == "running")
+                .values(heartbeat_at=datetime.utcnow())
+            )
+            session.commit()
+            return beat.rowcount == 1
+
+    def finish(self, job_id: int, error: Optional[str] = None):
+        with Session(engine) as session:
+            session.execute(
+                # A cancelled job keeps its status
+                update(IngestJob).where(IngestJob.id == job_id, IngestJob.status == "running").values(
+                    status="failed" if error else "done",
+                    finished_at=datetime.utcnow(),
+                    error=error
+                )
+            )
+            session.commit()
+
+    def cancel(self, repo_id: str):
+        """
+        Cancels the queued and running jobs of a repository (e.g. when it is
+        deleted). A running job notices at its next heartbeat and stops after
+        the batch it is working on.
+        """
+        with Session(engine) as session:
+            session.execute(
+                update(IngestJob)
+                .where(IngestJob.repo_id == repo_id, IngestJob.status.in_(("queued", "running")))
+                .values(status="cancelled", finished_at=datetime.utcnow())
+            )
+            session.commit()
+
+    def requeue_stale(self) -> int:
+        """
+        Puts running jobs whose worker stopped sending heartbeats (crash,
+        restart) back on the queue. Interrupted ingests resume from their
+        checkpoint instead of starting over.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=config.JOB_STALE_SECONDS)
+        with Session(engine) as session:
+            stale = session.exec(
+                select(IngestJob).where(IngestJob.status == "running", IngestJob.heartbeat_at < cutoff)
+            ).all()
+            for job in stale:
+                if job.attempts >= config.JOB_MAX_ATTEMPTS:
+                    job.status = "failed"
+                    job.error = "Worker stopped responding"
+                    job.finished_at = datetime.utcnow()
+                    repo = session.get(Repository, job.repo_id)
+                    if repo:
+                        repo.status = "failed"
+                        repo.error = job.error
+                        session.add(repo)
+                else:
+                    job.status = "queued"
+                    job.worker_id = None
+                    if job.kind == "ingest":
+                        job.kind = "resume"
+                session.add(job)
+            session.commit()
+            if stale:
+                logger.warning(f"Requeued {len(stale)} stale ingestion jobs")
+            return len(stale)
+
+job_queue = JobQueue()
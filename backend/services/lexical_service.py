@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+import numpy as np
+from backend.config import config
+from backend.services.vector_service import to_hit
+
+logger = logging.getLogger(__name__)
+
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+CAMEL_PARTS = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+# Too common in code (or in questions about it) to say anything about a chunk
+STOPWORDS = {
+    'the', 'and', 'for', 'not', 'def', 'self', 'this', 'return', 'import', 'from', 'if', 'else',
+    'in', 'is', 'of', 'to', 'or', 'none', 'null', 'true', 'false', 'var', 'let', 'const', 'new',
+    'function', 'public', 'private', 'static', 'void', 'int', 'str', 'as', 'with', 'what', 'where',
+    'how', 'does', 'do', 'are', 'which', 'code',
+}
+
+def tokenize(text: str) -> List[str]:
+    """
+    Identifiers are indexed whole (process_repository) and by their
+    snake_case / camelCase parts (process, repository).
+    """
+    tokens = []
+    for identifier in IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        parts = [p.lower() for piece in identifier.split('_') for p in CAMEL_PARTS.findall(piece)]
+        if len(lowered) > 1 and lowered not in STOPWORDS:
+            tokens.append(lowered)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if len(p) > 1 and p not in STOPWORDS)
+    return tokens
+
+class _LoadedIndex:
+    """
+    Read-optimized snapshot of one repo's postings in CSR form: for term id
+    t, rows[offsets[t]:offsets[t + 1]] are the chunks containing it and
+    weights[...] their precomputed BM25 contributions, so a query is a
+    few scatter-adds. Payloads stay on disk and are fetched for hits only.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, k1: float, b: float):
+        self.vocab: Dict[str, int] = dict(conn.execute("SELECT term, id FROM terms"))
+        self.ids: List[str] = []
+        term_blobs, tf_blobs = [], []
+        for doc_id, term_ids, tfs in conn.execute("SELECT id, term_ids, tfs FROM docs"):
+            self.ids.append(doc_id)
+            term_blobs.append(term_ids)
+            tf_blobs.append(tfs)
+        self.n_docs = len(self.ids)
+
+        counts = np.fromiter((len(blob) // 4 for blob in term_blobs), dtype=np.int64, count=self.n_docs)
+        terms = np.frombuffer(b''.join(term_blobs), dtype=np.int32)
+        tf = np.frombuffer(b''.join(tf_blobs), dtype=np.float32)
+        rows = np.repeat(np.arange(self.n_docs, dtype=np.int32), counts)
+
+        doc_len = np.bincount(rows, weights=tf, minlength=self.n_docs)
+        avgdl = max(float(doc_len.mean()), 1e-6) if self.n_docs else 1.0
+        weights = tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[rows] / avgdl))
+
+        order = np.argsort(terms, kind='stable')
+        terms = terms[order]
+        df = np.bincount(terms, minlength=max(self.vocab.values(), default=0) + 1)
+        idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+        self.offsets = np.concatenate([[0], np.cumsum(df)])
+        self.rows = rows[order]
+        self.weights = (weights[order] * idf[terms]).astype(np.float32)
+
+    def search(self, query: str, limit: int) -> List[tuple]:
+        """
+        Returns [(chunk_id, score)] for the best matches.
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or not self.n_docs:
+            return []
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.rows[start:end]] += self.weights[start:end]
+        k = min(limit, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
+
+class _Slot:
+    """
+    One repo's loaded index and the connection its payloads are read from.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()  # guards conn; held while the first load runs
+        self.conn: Optional[sqlite3.Connection] = None
+        self.index: Optional[_LoadedIndex] = None
+        self.inode = None
+        self.version = None
+        self.checked_at = 0.0
+        self.used_at = 0.0
+        self.reloading = False
+
+class LexicalService:
+    """
+    Per-repo BM25 index over chunk identifiers and tokens, persisted as one
+    SQLite file per repo. Ingestion workers write it; the API process keeps
+    a read-optimized copy in memory and rebuilds it in the background when
+    the file changes, serving the previous copy meanwhile. Copies unused for
+    LEXICAL_IDLE_TIMEOUT seconds, or beyond the LEXICAL_MAX_LOADED most
+    recently used, are dropped.
+    """
+
+    def __init__(self):
+        self.index_dir = config.LEXICAL_INDEX_DIR
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.k1 = 1.2
+        self.b = 0.75
+        self._write_lock = threading.Lock()
+        self._loaded: Dict[str, _Slot] = {}
+        self._load_lock = threading.Lock()  # guards _loaded only
+
+    def _path(self, repo_id: str) -> str:
+        return os.path.join(self.index_dir, f"{repo_id}.db")
+
+    def _connect(self, repo_id: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path(repo_id), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE)")
+        # term_ids (int32) and tfs (float32) are parallel arrays: the chunk's term frequencies
+        conn.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, file_path TEXT, "
+                     "term_ids BLOB, tfs BLOB, payload TEXT)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_docs_file ON docs(file_path)")
+        return conn
+
+    @staticmethod
+    def _term_ids(conn: sqlite3.Connection, terms: List[str]) -> Dict[str, int]:
+        conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", [(t,) for t in terms])
+        term_ids = {}
+        for i in range(0, len(terms), 500):
+            part = terms[i:i + 500]
+            placeholders = ','.join('?' * len(part))
+            term_ids.update(conn.execute(f"SELECT term, id FROM terms WHERE term IN ({placeholders})", part))
+        return term_ids
+
+    def index_chunks(self, repo_id: str, ids: List[Any], payloads: List[Dict]):
+        """
+        Adds or replaces the given chunks (payloads as stored in the vector store).
+        """
+        # Symbol names count as part of the chunk even if only in the payload
+        counters = [
+            Counter(tokenize(p.get('text', '') + ' ' + ' '.join(p.get('symbols') or [])))
+            for p in payloads
+        ]
+        with self._write_lock:
+            conn = self._connect(repo_id)
+            try:
+                with conn:
+                    term_ids = self._term_ids(conn, list(set().union(*counters)))
+                    conn.executemany("INSERT OR REPLACE INTO docs VALUES (?, ?, ?, ?, ?)", [
+                        (
+                            str(pid),
+                            payload.get('file_path', ''),
+                            np.array([term_ids[t] for t in counts], dtype=np.int32).tobytes(),
+                            np.array(list(counts.values()), dtype=np.float32).tobytes(),
+                            json.dumps(payload)
+                        )
+                        for pid, payload, counts in zip(ids, payloads, counters)
+                    ])
+            finally:
+                conn.close()
+
+    def delete_file_chunks(self, repo_id: str, file_paths: List[str], keep_ids: Optional[List[Any]] = None):
+        if not file_paths or not os.path.exists(self._path(repo_id)):
+            return
+        keep = {str(k) for k in (keep_ids or [])}
+        with self._write_lock:
+            conn = self._connect(repo_id)
+            try:
+                with conn:
+                    stale = [
+                        (doc_id,)
+                        for path in file_paths
+                        for (doc_id,) in conn.execute("SELECT id FROM docs WHERE file_path = ?", (path,))
+                        if doc_id not in keep
+                    ]
+                    conn.executemany("DELETE FROM docs WHERE id = ?", stale)
+            finally:
+                conn.close()
+
+    def delete_repo(self, repo_id: str):
+        with self._load_lock:
+            slot = self._loaded.pop(repo_id, None)
+        if slot is not None:
+            self._close(slot)
+        for suffix in ('', '-wal', '-shm'):
+            path = self._path(repo_id) + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    @staticmethod
+    def _close(slot: _Slot):
+        with slot.lock:
+            if slot.conn is not None:
+                slot.conn.close()
+            slot.conn = slot.index = None
+
+    def _evict(self, now: float):
+        with self._load_lock:
+            by_use = sorted(self._loaded.items(), key=lambda item: item[1].used_at, reverse=True)
+            evicted = [
+                (repo_id, slot) for i, (repo_id, slot) in enumerate(by_use)
+                if i >= config.LEXICAL_MAX_LOADED or now - slot.used_at > config.LEXICAL_IDLE_TIMEOUT
+            ]
+            for repo_id, _ in evicted:
+                del self._loaded[repo_id]
+        for repo_id, slot in evicted:
+            self._close(slot)
+            logger.info(f"Unloaded lexical index for {repo_id}")
+
+    def _build(self, repo_id: str) -> tuple:
+        """
+        Opens a new connection and reads the whole index into memory.
+        """
+        inode = os.stat(self._path(repo_id)).st_ino
+        conn = self._connect(repo_id)
+        try:
+            started = time.perf_counter()
+            conn.execute("BEGIN")  # read terms and docs from one snapshot
+            try:
+                index = _LoadedIndex(conn, self.k1, self.b)
+            finally:
+                conn.execute("COMMIT")
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+        except Exception:
+            conn.close()
+            raise
+        logger.info(f"Loaded lexical index for {repo_id}: {index.n_docs} chunks in {time.perf_counter() - started:.2f}s")
+        return conn, inode, version, index
+
+    def _install(self, slot: _Slot, built: tuple):
+        old = slot.conn
+        slot.conn, slot.inode, slot.version, slot.index = built
+        slot.checked_at = time.monotonic()
+        if old is not None:
+            old.close()
+
+    def _reload(self, repo_id: str, slot: _Slot):
+        try:
+            built = self._build(repo_id)
+        except Exception as e:
+            logger.error(f"Error reloading lexical index for {repo_id}: {e}")
+            built = None
+        with slot.lock:
+            slot.reloading = False
+            if built is None:
+                return
+            if self._loaded.get(repo_id) is not slot:  # evicted or deleted meanwhile
+                built[0].close()
+                return
+            self._install(slot, built)
+
+    def _index(self, repo_id: str) -> Optional[_Slot]:
+        try:
+            inode = os.stat(self._path(repo_id)).st_ino
+        except FileNotFoundError:
+            return None
+        now = time.monotonic()
+        with self._load_lock:
+            slot = self._loaded.setdefault(repo_id, _Slot())
+            slot.used_at = now
+        self._evict(now)
+
+        with slot.lock:
+            if slot.index is None:
+                # Nothing to serve yet; only this repo's searches wait for it
+                self._install(slot, self._build(repo_id))
+                return slot
+            if slot.reloading or now - slot.checked_at < config.LEXICAL_RELOAD_INTERVAL:
+                return slot
+            slot.checked_at = now
+            # A new inode means a full re-ingest deleted and rebuilt the file;
+            # data_version changes when any other connection commits
+            if slot.inode != inode or slot.conn.execute("PRAGMA data_version").fetchone()[0] != slot.version:
+                slot.reloading = True
+                threading.Thread(target=self._reload, args=(repo_id, slot),
+                                 name=f"lexical-reload-{repo_id}", daemon=True).start()
+            return slot
+
+    def search(self, repo_id: str, query: str, limit: int = 20) -> List[Dict]:
+        try:
+            slot = self._index(repo_id)
+            if slot is None:
+                return []
+            index = slot.index
+            ranked = index.search(query, limit) if index is not None else []
+            if not ranked:
+                return []
+            placeholders = ','.join('?' * len(ranked))
+            with slot.lock:
+                if slot.conn is None:  # unloaded meanwhile
+                    return []
+                payloads = dict(slot.conn.execute(
+                    f"SELECT id, payload FROM docs WHERE id IN ({placeholders})", [pid for pid, _ in ranked]
+                ))
+            # A chunk deleted since the snapshot was loaded is simply skipped
+            return [to_hit(pid, score, json.loads(payloads[pid])) for pid, score in ranked if pid in payloads]
+        except Exception as e:
+            logger.error(f"Error in lexical search: {e}")
+            return []
+
+lexical_service = LexicalService()
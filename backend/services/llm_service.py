@@ -1,22 +1,134 @@
+import time
+import asyncio
 import logging
 import json
+import importlib.util
 import httpx
-from typing import List, Dict, Any, AsyncGenerator
+from typing import List, Dict, Any, AsyncGenerator, Callable, Optional
 from backend.config import config
+from backend.services.context_packer import format_snippet
+from backend.services.conversation import compact_history, count_prompt_tokens
+from backend.services.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
 class LLMService:
+    """
+    Streams chat completions from OpenRouter over one long-lived client,
+    so requests reuse pooled keep-alive (HTTP/2 when h2 is installed)
+    connections instead of paying a TCP + TLS handshake each time.
+    """
+
     def __init__(self):
         self.api_key = config.OPENROUTER_API_KEY
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.base_url = config.OPENROUTER_BASE_URL.rstrip('/')
         self.model = config.DEFAULT_LLM_MODEL
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        self.stats = {'requests': 0, 'retries': 0, 'errors': 0, 'tcp_connects': 0, 'tls_handshakes': 0,
+                      'prompt_tokens': 0}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self.http2 = config.LLM_HTTP2 and importlib.util.find_spec("h2") is not None
+            if config.LLM_HTTP2 and not self.http2:
+                logger.warning("h2 is not installed; OpenRouter client falls back to HTTP/1.1")
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=config.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=config.LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(
+                    connect=config.LLM_CONNECT_TIMEOUT,
+                    read=config.LLM_READ_TIMEOUT,  # max gap between streamed chunks
+                    write=config.LLM_WRITE_TIMEOUT,
+                    pool=config.LLM_POOL_TIMEOUT
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "X-Title": "CodeBase RAG",
+                }
+            )
+        return self._client
+
+    async def warmup(self):
+        """
+        Opens a pooled connection (TCP + TLS) so the first chat request doesn't
+        pay for it. The response status doesn't matter, only the connection.
+        """
+        response = await self._get_client().head("/models", extensions={"trace": self._trace})
+        logger.info(f"LLM connection warmed up ({response.http_version}, status {response.status_code})")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
-    async def chat_stream(self, message: str, context: List[Dict], history: List[Dict]) -> AsyncGenerator[str, None]:
-        context_str = "\n\n".join([
-            f"File: {c['metadata']['file_path']}\nLines: {c['metadata']['start_line']}-{c['metadata']['end_line']}\nContent:\n{c['text']}"
-            for c in context
-        ])
+    async def _trace(self, event_name: str, info: Dict):
+        # httpcore trace hook: counts the handshakes that pooling saves
+        if event_name == "connection.connect_tcp.complete":
+            self.stats['tcp_connects'] += 1
+        elif event_name == "connection.start_tls.complete":
+            self.stats['tls_handshakes'] += 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        connections = []
+        if self._client is not None:
+            # httpx has no public pool introspection; read the httpcore pool
+            pool = getattr(self._client._transport, '_pool', None)
+            connections = list(getattr(pool, 'connections', []))
+        stats.update(
+            base_url=self.base_url,
+            http2=self.http2,
+            connections=len(connections),
+            idle_connections=sum(1 for c in connections if c.is_idle()),
+            active_connections=sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+        )
+        return stats
+
+    async def _open_stream(self, payload: Dict) -> httpx.Response:
+        """
+        Sends the request and returns the streaming response once its status
+        is known. 429/5xx and connection failures are retried with
+        exponential backoff; nothing has been streamed to the caller yet.
+        """
+        client = self._get_client()
+        for attempt in range(config.LLM_MAX_RETRIES + 1):
+            last_try = attempt == config.LLM_MAX_RETRIES
+            delay = config.LLM_RETRY_BACKOFF * (2 ** attempt)
+            try:
+                request = client.build_request("POST", "/chat/completions", json=payload,
+                                               extensions={"trace": self._trace})
+                response = await client.send(request, stream=True)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError) as e:
+                if last_try:
+                    raise
+                logger.warning(f"OpenRouter connection failed ({e}); retrying in {delay:.1f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES or last_try:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await response.aread()  # read to the end so the connection goes back to the pool
+                await response.aclose()
+                logger.warning(f"OpenRouter returned {response.status_code}; retrying in {delay:.1f}s")
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    async def chat_stream(self, message: str, context: List[Dict], history: List[Dict],
+                          on_complete: Optional[Callable[[List[str]], None]] = None) -> AsyncGenerator[str, None]:
+        """
+        Yields the answer as it streams. on_complete receives all chunks,
+        but only if the answer finished cleanly (no error, timeout or disconnect).
+        """
+        context_str = "\n\n".join([format_snippet(c) for c in context])
         
         system_prompt = f"""You are an expert software engineer assistant. Answer questions about the codebase using the provided context.
 If the context doesn't contain the answer, say you don't know based on the provided code but try to offer general advice if possible.
@@ -27,38 +139,62 @@ Context:
 """
         
         messages = [{"role": "system", "content": system_prompt}]
-        for msg in history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
+        messages.extend(compact_history(history, context))
         messages.append({"role": "user", "content": message})
 
+        prompt_tokens = count_prompt_tokens(messages)
+        logger.info(
+            f"Prompt: {prompt_tokens} tokens ({count_prompt_tokens(messages[:1])} system + context, "
+            f"{len(messages) - 2} history messages from {len(history)} turns)"
+        )
+        self.stats['requests'] += 1
+        self.stats['prompt_tokens'] += prompt_tokens
+        started = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                async with client.stream(
-                    "POST",
-                    self.base_url,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "X-Title": "CodeBase RAG",
-                    },
-                    json={
-                        "model": self.model,
-                        "messages": messages,
-                        "stream": True,
-                    }
-                ) as response:
-                    async for line in response.aiter_lines():
-                        if line.startswith("data: "):
-                            data_str = line[6:]
-                            if data_str == "[DONE]":
-                                break
-                            try:
-                                data = json.loads(data_str)
-                                chunk = data["choices"][0]["delta"].get("content", "")
-                                if chunk:
-                                    yield chunk
-                            except json.JSONDecodeError:
-                                continue
+            response = await self._open_stream({
+                "model": self.model,
+                "messages": messages,
+                "stream": True,
+            })
+            try:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode('utf-8', errors='ignore')
+                    raise RuntimeError(f"OpenRouter returned {response.status_code}: {body[:200]}")
+
+                deadline = time.monotonic() + config.LLM_STREAM_TIMEOUT
+                finished = False
+                chunks = []
+                async for line in response.aiter_lines():
+                    # After [DONE], keep reading to the end of the body; closing a
+                    # half-read response would drop the connection from the pool
+                    if finished:
+                        continue
+                    if time.monotonic() > deadline:
+                        logger.warning(f"LLM stream exceeded {config.LLM_STREAM_TIMEOUT}s; stopping")
+                        break
+                    if line.startswith("data: "):
+                        data_str = line[6:]
+                        if data_str == "[DONE]":
+                            finished = True
+                            continue
+                        try:
+                            data = json.loads(data_str)
+                            chunk = data["choices"][0]["delta"].get("content", "")
+                            if chunk:
+                                if not chunks:
+                                    metrics.observe('coderag_stage_seconds', time.perf_counter() - started,
+                                                    stage='llm_ttft')
+                                chunks.append(chunk)
+                                yield chunk
+                        except json.JSONDecodeError:
+                            continue
+            finally:
+                await response.aclose()
+            metrics.observe('coderag_stage_seconds', time.perf_counter() - started, stage='llm_total')
+            if on_complete is not None and finished:
+                on_complete(chunks)
         except Exception as e:
+            self.stats['errors'] += 1
             logger.error(f"Error in LLM chat stream: {e}")
             yield f"Error: {e}"
 
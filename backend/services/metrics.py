@@ -0,0 +1,176 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from backend.services.event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# Seconds; wide enough for a query embedding and for cloning a large repository
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+COUNTERS = {
+    'coderag_ingest_files_total': 'Files chunked by ingestion jobs',
+    'coderag_ingest_chunks_total': 'Chunks written to the index',
+    'coderag_ingest_tokens_total': 'Tokens of the chunks written to the index',
+    'coderag_ingest_bytes_total': 'UTF-8 bytes of the chunks written to the index',
+    'coderag_ingest_jobs_total': 'Finished ingestion jobs by kind and status',
+    'coderag_chat_requests_total': 'Chat requests by answer cache result',
+}
+HISTOGRAMS = {
+    'coderag_stage_seconds': 'Duration of pipeline stages (clone, discover, chunk, embed, upsert, '
+                             'query_embed, search, rerank, llm_ttft, ...)',
+}
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escape = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+def _number(value: float) -> str:
+    # Not :g, which rounds large counters to 6 significant digits
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class StageTimer:
+    """
+    Sums the time one job spends in each stage. Pipeline stages overlap
+    (chunking runs ahead of embedding), so the stages can add up to more
+    than the job's wall time.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def span(self, stage: str, **labels):
+        return metrics.span(stage, timer=self, **labels)
+
+    def rounded(self) -> Dict[str, float]:
+        with self._lock:
+            return {stage: round(seconds, 3) for stage, seconds in self.durations.items()}
+
+class Metrics:
+    """
+    Counters and histograms rendered in the Prometheus text format.
+
+    Ingestion workers are separate processes: they record into their own
+    registry and flush() the increments since the last flush over the event
+    bus, where the API process merges them into the registry /metrics serves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {name: {} for name in COUNTERS}
+        # Per label set: [count per bucket (last is +Inf)..., sum]
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = {name: {} for name in HISTOGRAMS}
+        # Increments not yet sent to the API process (worker processes only)
+        self._pending_counters: Dict[Tuple[str, Labels], float] = {}
+        self._pending_histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._forwarding = False
+        event_bus.subscribe(self._on_event)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+            if self._forwarding:
+                pending = self._pending_counters
+                pending[(name, key)] = pending.get((name, key), 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._observe(self._histograms[name].setdefault(key, [0] * (len(BUCKETS) + 2)), value)
+            if self._forwarding:
+                self._observe(self._pending_histograms.setdefault((name, key), [0] * (len(BUCKETS) + 2)), value)
+
+    def value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters[name].get(_labels(labels), 0)
+
+    @staticmethod
+    def _observe(series: List[float], value: float):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                series[i] += 1
+                break
+        else:
+            series[len(BUCKETS)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def span(self, stage: str, timer: Optional[StageTimer] = None, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe('coderag_stage_seconds', elapsed, stage=stage, **labels)
+            if timer is not None:
+                timer.add(stage, elapsed)
+
+    def forward(self):
+        """
+        Called in worker processes: keep recording locally, but remember what
+        flush() has to send to the API process.
+        """
+        self._forwarding = True
+
+    def flush(self):
+        with self._lock:
+            counters, self._pending_counters = self._pending_counters, {}
+            histograms, self._pending_histograms = self._pending_histograms, {}
+        if counters or histograms:
+            event_bus.publish({
+                'type': 'metrics',
+                'counters': list(counters.items()),
+                'histograms': list(histograms.items()),
+            })
+
+    def _on_event(self, event: Dict):
+        if event.get('type') != 'metrics' or self._forwarding:
+            return
+        with self._lock:
+            for (name, key), value in event['counters']:
+                series = self._counters[name]
+                series[key] = series.get(key, 0) + value
+            for (name, key), delta in event['histograms']:
+                series = self._histograms[name].setdefault(key, [0] * (len(BUCKETS) + 2))
+                for i, value in enumerate(delta):
+                    series[i] += value
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f'{name}{_format_labels(key)} {_number(value)}')
+            for name, help_text in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, series in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS + ('+Inf',), series[:-1]):
+                        cumulative += count
+                        le = bound if isinstance(bound, str) else f'{bound:g}'
+                        lines.append(f'{name}_bucket{_format_labels(key, ("le", le))} {_number(cumulative)}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {series[-1]:.6f}')
+                    lines.append(f'{name}_count{_format_labels(key)} {_number(cumulative)}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
@@ -0,0 +1,309 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set
+import numpy as np
+from backend.config import config
+from backend.services.vector_service import VectorStore, Vector, point_id, to_hit
+
+logger = logging.getLogger(__name__)
+
+# Collections with fewer dead rows than this are never rewritten
+COMPACT_MIN_DEAD = 1024
+
+class _Collection:
+    """
+    One repository's vectors on disk:
+
+        meta.json    {"dim": 384}
+        vectors.f32  append-only float32 rows, L2-normalized (vectors.<n>.f32
+                     after the n-th compaction)
+        points.jsonl append-only log of {"row", "id", "payload"} upserts and
+                     {"delete": [ids]} records; a compacted log starts with
+                     {"vectors": "vectors.<n>.f32"}
+
+    Overwriting or deleting a point only appends to the log, so writers
+    never rewrite data that readers in other processes may be mapping.
+    Readers replay the log tail whenever the file has grown. Once more than
+    compact_ratio of the rows are dead, the writer copies the live ones into
+    a new vectors file and atomically replaces the log; readers see the new
+    log inode and load it from the start.
+    """
+
+    def __init__(self, path: str, dim: int, compact_ratio: float = 0.5):
+        self.path = path
+        self.dim = dim
+        self.compact_ratio = compact_ratio
+        self.log_path = os.path.join(path, 'points.jsonl')
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.vectors_file = 'vectors.f32'
+        self.ids: List[Any] = []
+        self.payloads: List[Dict] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.id_to_row: Dict[Any, int] = {}
+        self.file_rows: Dict[str, Set[int]] = {}  # file_path -> its alive rows
+        self.matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self.log_offset = 0
+        self.log_inode = None
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, self.vectors_file)
+
+    def _set_alive(self, row: int, alive: bool):
+        if self.alive[row] == alive:
+            return
+        self.alive[row] = alive
+        file_path = self.payloads[row].get('file_path')
+        if alive:
+            self.file_rows.setdefault(file_path, set()).add(row)
+        else:
+            rows = self.file_rows.get(file_path)
+            if rows is not None:
+                rows.discard(row)
+                if not rows:
+                    del self.file_rows[file_path]
+
+    def refresh(self):
+        """
+        Catches up with rows and log records appended by any process.
+        """
+        with self.lock:
+            try:
+                stat = os.stat(self.log_path)
+            except FileNotFoundError:
+                if self.ids:
+                    self._reset()
+                return
+            if stat.st_ino != self.log_inode or stat.st_size < self.log_offset:
+                self._reset()
+                self.log_inode = stat.st_ino
+            if stat.st_size == self.log_offset:
+                return
+
+            with open(self.log_path, 'rb') as f:
+                f.seek(self.log_offset)
+                data = f.read()
+            # Ignore a trailing partial line from a concurrent writer
+            end = data.rfind(b'\n') + 1
+            records = [json.loads(line) for line in data[:end].splitlines()]
+            for record in records:
+                if 'vectors' in record:
+                    self.vectors_file = record['vectors']
+
+            # Rows are written before their log records, so sizing the map
+            # after reading the log covers every row the log mentions
+            try:
+                n_rows = os.path.getsize(self.vectors_path) // (4 * self.dim)
+            except FileNotFoundError:
+                # Compacted away since the stat; the next refresh loads the new log
+                self._reset()
+                return
+            if n_rows:
+                self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(n_rows, self.dim))
+
+            max_row = max((r['row'] for r in records if 'row' in r), default=-1)
+            if max_row >= len(self.ids):
+                grow = max_row + 1 - len(self.ids)
+                self.ids.extend([None] * grow)
+                self.payloads.extend([{}] * grow)
+                self.alive = np.concatenate([self.alive, np.zeros(grow, dtype=bool)])
+
+            for record in records:
+                if 'delete' in record:
+                    for pid in record['delete']:
+                        row = self.id_to_row.pop(pid, None)
+                        if row is not None:
+                            self._set_alive(row, False)
+                    continue
+                if 'row' not in record:
+                    continue
+                row = record['row']
+                previous = self.id_to_row.get(record['id'])
+                if previous is not None:
+                    self._set_alive(previous, False)
+                self.ids[row] = record['id']
+                self.payloads[row] = record['payload']
+                self._set_alive(row, True)
+                self.id_to_row[record['id']] = row
+            self.log_offset += end
+
+    def append(self, ids: List[Any], vectors: np.ndarray, payloads: List[Dict]):
+        with self.lock:
+            self.refresh()
+            first_row = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+            # Vectors first: a log record must never point at a missing row
+            with open(self.vectors_path, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for i, (pid, payload) in enumerate(zip(ids, payloads)):
+                    f.write(json.dumps({'row': first_row + i, 'id': pid, 'payload': payload}) + '\n')
+            self.refresh()
+            self._maybe_compact()
+
+    def delete(self, ids: List[Any]):
+        if not ids:
+            return
+        with self.lock:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'delete': ids}) + '\n')
+            self.refresh()
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = len(self.alive) - int(np.count_nonzero(self.alive))
+        if dead >= COMPACT_MIN_DEAD and dead > self.compact_ratio * len(self.alive):
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrites the live rows into the next vectors file and a fresh log.
+        Only the collection's writer may call this.
+        """
+        with self.lock:
+            self.refresh()
+            live = np.flatnonzero(self.alive)
+            dead = len(self.alive) - len(live)
+            stem = self.vectors_file[:-len('.f32')]
+            generation = int(stem.split('.')[1]) + 1 if '.' in stem else 1
+            vectors_file = f"vectors.{generation}.f32"
+            with open(os.path.join(self.path, vectors_file), 'wb') as f:
+                for start in range(0, len(live), 4096):
+                    f.write(np.ascontiguousarray(self.matrix[live[start:start + 4096]], dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            tmp_path = self.log_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'vectors': vectors_file}) + '\n')
+                for new_row, row in enumerate(live):
+                    f.write(json.dumps({'row': new_row, 'id': self.ids[row], 'payload': self.payloads[row]}) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            old_path = self.vectors_path
+            os.replace(tmp_path, self.log_path)
+            self._reset()
+            self.refresh()
+            try:
+                os.remove(old_path)
+            except OSError:  # still mapped by a reader on Windows
+                logger.warning(f"Could not remove {old_path} after compaction")
+            logger.info(f"Compacted {self.path}: dropped {dead} dead rows, kept {len(live)}")
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector store: one memory-mapped float32 matrix per repository
+    and exact cosine top-k with NumPy. Needs no external service and answers
+    small and medium repos in well under a millisecond.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self._collections: Dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+
+    def _dir(self, collection_name: str) -> str:
+        return os.path.join(self.root_dir, collection_name)
+
+    def _get(self, collection_name: str) -> Optional[_Collection]:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                meta_path = os.path.join(self._dir(collection_name), 'meta.json')
+                if not os.path.exists(meta_path):
+                    return None
+                with open(meta_path) as f:
+                    dim = json.load(f)['dim']
+                collection = self._collections[collection_name] = _Collection(
+                    self._dir(collection_name), dim, config.VECTOR_STORE_COMPACT_RATIO
+                )
+        collection.refresh()
+        return collection
+
+    def ensure_collection(self, collection_name: str, vector_size: int = 384):
+        path = self._dir(collection_name)
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            logger.info(f"Creating local collection: {collection_name} with size {vector_size}")
+            os.makedirs(path, exist_ok=True)
+            with open(meta_path, 'w') as f:
+                json.dump({'dim': vector_size}, f)
+
+    def upsert_vectors(self, collection_name: str, vectors: Sequence[Vector], payloads: List[Dict],
+                       ids: Optional[List[Any]] = None, batch_size: Optional[int] = None):
+        collection = self._get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection {collection_name} does not exist")
+        if ids is None:
+            ids = [point_id(collection_name, payload) for payload in payloads]
+
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(payloads), collection.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+        collection.append(list(ids), matrix, payloads)
+
+    def delete_collection(self, collection_name: str):
+        with self._lock:
+            self._collections.pop(collection_name, None)
+        path = self._dir(collection_name)
+        if os.path.exists(path):
+            logger.info(f"Deleting local collection: {collection_name}")
+            shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _file_rows(collection: _Collection, file_paths: List[str]) -> List[int]:
+        return [row for path in dict.fromkeys(file_paths) for row in sorted(collection.file_rows.get(path, ()))]
+
+    def get_file_points(self, collection_name: str, file_paths: List[str]) -> List[Dict]:
+        collection = self._get(collection_name)
+        if collection is None:
+            return []
+        with collection.lock:
+            return [
+                {
+                    'id': collection.ids[row],
+                    'vector': np.array(collection.matrix[row]),
+                    'payload': collection.payloads[row]
+                }
+                for row in self._file_rows(collection, file_paths)
+            ]
+
+    def delete_file_points(self, collection_name: str, file_paths: List[str], keep_ids: Optional[List[Any]] = None):
+        if not file_paths:
+            return
+        collection = self._get(collection_name)
+        if collection is None:
+            return
+        keep = set(keep_ids or [])
+        with collection.lock:
+            stale = [collection.ids[row] for row in self._file_rows(collection, file_paths)
+                     if collection.ids[row] not in keep]
+            collection.delete(stale)
+
+    def search(self, collection_name: str, query_vector: Vector, limit: int = 5) -> List[Dict]:
+        try:
+            collection = self._get(collection_name)
+            if collection is None:
+                return []
+            with collection.lock:
+                n_rows = len(collection.alive)
+                if not n_rows or not collection.alive.any():
+                    return []
+                query = np.asarray(query_vector, dtype=np.float32)
+                query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+                scores = collection.matrix[:n_rows] @ query
+                scores[~collection.alive] = -np.inf
+                k = min(limit, int(collection.alive.sum()))
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                return [to_hit(collection.ids[row], float(scores[row]), collection.payloads[row]) for row in top]
+        except Exception as e:
+            logger.error(f"Error searching vectors: {e}")
+            return []
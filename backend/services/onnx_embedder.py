@@ -0,0 +1,86 @@
+import os
+import json
+import logging
+from typing import Dict, List
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "coderag-onnx.json"
+MODEL_FILES = {"none": "model.onnx", "int8": "model_int8.onnx"}
+
+def export_dir(root: str, model_name: str) -> str:
+    return os.path.join(root, model_name.replace("/", "__"))
+
+def read_meta(model_dir: str) -> Dict:
+    with open(os.path.join(model_dir, META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+class OnnxEmbedder:
+    """
+    Sentence embeddings from a transformer exported by backend.export_onnx,
+    run on ONNX Runtime. Tokenization (tokenizers) and the pooling and
+    normalization sentence-transformers would apply (numpy) happen here, so
+    neither torch nor transformers is imported.
+
+    Mirrors the parts of the SentenceTransformer API EmbeddingService uses.
+    """
+
+    def __init__(self, model_dir: str, quantize: str = "int8", threads: int = 1, check_parity: bool = True):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.meta = read_meta(model_dir)
+        parity = self.meta.get("parity", {}).get(quantize)
+        threshold = self.meta.get("threshold")
+        if check_parity and (parity is None or threshold is None or parity < threshold):
+            raise ValueError(f"{MODEL_FILES[quantize]} in {model_dir} did not pass the parity check "
+                             f"(min cosine {parity}, threshold {threshold}); re-run backend.export_onnx")
+
+        self.max_seq_length = self.meta["max_seq_length"]
+        self.pooling = self.meta["pooling"]
+        self.normalize = self.meta["normalize"]
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.max_seq_length)
+        # Pads to the longest text of each batch
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_token_id"], pad_token=self.meta["pad_token"])
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, MODEL_FILES[quantize]), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.meta["dimension"]
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self.pooling == "max":
+            pooled = np.where(mask[..., None] > 0, hidden, -1e9).max(axis=1)
+        else:  # mean
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32, copy=False)
+
+    def encode(self, sentences: List[str], batch_size: int = 32, **kwargs) -> np.ndarray:
+        if not sentences:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        out = []
+        for start in range(0, len(sentences), batch_size):
+            encodings = self.tokenizer.encode_batch(sentences[start:start + batch_size])
+            features = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {name: features[name] for name in self.input_names})[0]
+            out.append(self._pool(hidden, features["attention_mask"]))
+        return np.concatenate(out)
@@ -1,56 +1,164 @@
 import os
+import hashlib
 import logging
-from typing import List, Dict
-from backend.models.schemas import CodeReference
+import subprocess
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import List, Dict, Iterator, Optional
+from backend.config import config
+from backend.services.chunkers import get_chunker
 
 logger = logging.getLogger(__name__)
 
+# Generated or vendored files that add noise but no answers
+GENERATED_SUFFIXES = ('.min.js', '.bundle.js', '.pb.go', '_pb2.py', '_pb2_grpc.py', '.generated.ts', '.gen.go')
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8', errors='ignore')).hexdigest()
+
+def _chunk_file_worker(args) -> List[Dict]:
+    # Entry point for process pools: each child uses its own parser_service
+    file_path, repo_root = args
+    return parser_service.chunk_file(file_path, repo_root)
+
 class ParserService:
     def __init__(self):
         self.supported_extensions = {'.py', '.js', '.ts', '.tsx', '.go', '.rs', '.java', '.cpp', '.c'}
+        self.ignored_dirs = {'.git', 'node_modules', 'venv', '__pycache__', '.next'}
+        self.chunker = get_chunker(config.CHUNKER, config.CHUNK_TOKEN_BUDGET, config.CHUNK_MIN_TOKENS)
+        self.workers = max(1, config.PARSER_WORKERS)
+
+    def is_indexable(self, path: str) -> bool:
+        parts = os.path.normpath(path).split(os.sep)
+        if any(part in self.ignored_dirs for part in parts[:-1]):
+            return False
+        filename = parts[-1]
+        if filename.endswith(GENERATED_SUFFIXES):
+            return False
+        _, ext = os.path.splitext(filename)
+        return ext in self.supported_extensions
+
+    def _git_files(self, repo_path: str) -> Optional[List[str]]:
+        """
+        Tracked plus untracked-but-not-ignored files, i.e. .gitignore is honored.
+        Returns None when repo_path is not a git checkout.
+        """
+        if not os.path.exists(os.path.join(repo_path, '.git')):
+            return None
+        try:
+            output = subprocess.run(
+                ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+                cwd=repo_path, capture_output=True, check=True
+            ).stdout
+        except Exception as e:
+            logger.warning(f"git ls-files failed in {repo_path}: {e}; walking the tree instead")
+            return None
+        return [p for p in output.decode('utf-8', errors='ignore').split('\0') if p]
+
+    def _walk_files(self, repo_path: str) -> List[str]:
+        paths = []
+        for root, dirs, filenames in os.walk(repo_path):
+            # Prune in place so ignored trees are never descended into
+            dirs[:] = [d for d in dirs if d not in self.ignored_dirs]
+            rel_root = os.path.relpath(root, repo_path)
+            for filename in filenames:
+                paths.append(filename if rel_root == '.' else os.path.join(rel_root, filename))
+        return paths
 
     def get_repo_files(self, repo_path: str) -> List[str]:
+        candidates = self._git_files(repo_path)
+        if candidates is None:
+            candidates = self._walk_files(repo_path)
+
         files_to_index = []
-        for root, _, filenames in os.walk(repo_path):
-            if any(ignored in root for ignored in {'.git', 'node_modules', 'venv', '__pycache__', '.next'}):
+        skipped_large = 0
+        for rel_path in candidates:
+            if not self.is_indexable(rel_path):
                 continue
-            for filename in filenames:
-                _, ext = os.path.splitext(filename)
-                if ext in self.supported_extensions:
-                    files_to_index.append(os.path.join(root, filename))
+            full_path = os.path.join(repo_path, rel_path)
+            try:
+                if os.path.getsize(full_path) > config.MAX_FILE_SIZE:
+                    skipped_large += 1
+                    continue
+            except OSError:
+                continue  # deleted, broken symlink, submodule
+            files_to_index.append(full_path)
+
+        if skipped_large:
+            logger.info(f"Skipped {skipped_large} files larger than {config.MAX_FILE_SIZE} bytes")
         return files_to_index
 
+    @staticmethod
+    def _looks_unindexable(content: str) -> bool:
+        # Binary (NUL bytes) or minified (very long lines) content
+        if '\0' in content[:8192]:
+            return True
+        lines = content.count('\n') + 1
+        return len(content) / lines > 300 or max((len(l) for l in content.split('\n')), default=0) > 5000
+
     def chunk_file(self, file_path: str, repo_root: str) -> List[Dict]:
         try:
             with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                 content = f.read()
-            
+            if self._looks_unindexable(content):
+                logger.debug(f"Skipping binary or minified file {file_path}")
+                return []
+
             relative_path = os.path.relpath(file_path, repo_root)
-            
-            # Simplified chunking for now (by fixed lines)
-            # In a full implementation, this uses tree-sitter
+            _, ext = os.path.splitext(file_path)
+
             lines = content.split('\n')
             chunks = []
-            chunk_size = 50
-            overlap = 10
-            
-            for i in range(0, len(lines), chunk_size - overlap):
-                end = min(i + chunk_size, len(lines))
-                snippet = '\n'.join(lines[i:end])
+            for start, end, symbols in self.chunker.chunk(content, ext):
+                snippet = '\n'.join(lines[start:end + 1])
                 if snippet.strip():
                     chunks.append({
                         'text': snippet,
                         'metadata': {
                             'file_path': relative_path,
-                            'start_line': i + 1,
-                            'end_line': end
+                            'start_line': start + 1,
+                            'end_line': end + 1,
+                            'content_hash': content_hash(snippet),
+                            'symbols': symbols
                         }
                     })
-                if end == len(lines):
-                    break
             return chunks
         except Exception as e:
             logger.error(f"Error chunking file {file_path}: {e}")
             return []
 
+    def iter_chunks(self, files: List[str], repo_root: str) -> Iterator[List[Dict]]:
+        """
+        Chunks files on a pool and yields each file's chunks in input order.
+        Only a bounded number of files is read ahead of the consumer.
+        """
+        if self.workers == 1 or len(files) < 32:
+            for file_path in files:
+                yield self.chunk_file(file_path, repo_root)
+            return
+
+        # Chunking is mostly Python-level tree walking, so processes scale
+        # where threads would serialize on the GIL
+        if config.PARSER_EXECUTOR == "process":
+            executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            submit = lambda path: executor.submit(_chunk_file_worker, (path, repo_root))
+        else:
+            executor = ThreadPoolExecutor(self.workers, thread_name_prefix="chunk")
+            submit = lambda path: executor.submit(self.chunk_file, path, repo_root)
+
+        with executor:
+            pending = deque()
+            remaining = iter(files)
+            for file_path in remaining:
+                pending.append(submit(file_path))
+                if len(pending) >= self.workers * 4:
+                    break
+            while pending:
+                chunks = pending.popleft().result()
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append(submit(next_path))
+                yield chunks
+
 parser_service = ParserService()
@@ -0,0 +1,184 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlmodel import Session, select
+from backend.config import config
+from backend.database import Repository, engine
+from backend.services.event_bus import event_bus
+
+logger = logging.getLogger(__name__)
+
+TERMINAL = ("completed", "failed")
+
+class ProgressService:
+    """
+    Repository status for the status routes and progress streams, served
+    from memory.
+
+    Ingestion jobs publish 'progress' events (workers forward them to the
+    API process over the event bus) and only write to the database every
+    PROGRESS_WRITE_INTERVAL seconds. Here the events are laid over the
+    repository rows, which are reloaded from the database at most every
+    STATUS_CACHE_TTL seconds however many clients poll.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._rows: Dict[str, Dict] = {}  # as of the last reload
+        self._live: Dict[str, Dict] = {}  # latest fields from progress events, with their time in 'at'
+        self._loaded_at = float('-inf')
+        self._watchers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        event_bus.subscribe(self._on_event)
+
+    def publish(self, repo_id: str, stage: str, **fields):
+        event_bus.publish({'type': 'progress', 'repo_id': repo_id, 'stage': stage, 'at': time.time(), **fields})
+
+    def invalidate(self, repo_id: Optional[str] = None):
+        """
+        Called after the API itself changed a repository (new ingest, refresh,
+        resume): the next read reloads from the database.
+        """
+        with self._lock:
+            if repo_id is not None:
+                self._live.pop(repo_id, None)
+            self._loaded_at = float('-inf')
+        if repo_id is not None:
+            self._notify(repo_id)
+
+    def _on_event(self, event: Dict):
+        kind = event.get('type')
+        if kind == 'progress':
+            fields = {k: v for k, v in event.items() if k not in ('type', 'repo_id')}
+            with self._lock:
+                self._live.setdefault(event['repo_id'], {}).update(fields)
+        elif kind == 'index_updated':
+            # The job bumped index_version in the database before publishing
+            with self._lock:
+                self._loaded_at = float('-inf')
+            return
+        elif kind == 'repo_deleted':
+            with self._lock:
+                self._rows.pop(event['repo_id'], None)
+                self._live.pop(event['repo_id'], None)
+        else:
+            return
+        self._notify(event['repo_id'])
+
+    @staticmethod
+    def _row(repo: Repository) -> Dict:
+        return {
+            'repo_id': repo.id,
+            'repo_url': repo.repo_url,
+            'status': repo.status,
+            'progress': repo.progress,
+            'total_files': repo.total_files,
+            'processed_files': repo.processed_files,
+            'created_at': repo.created_at,
+            'completed_at': repo.completed_at,
+            'error': repo.error,
+            'stage_timings': json.loads(repo.stage_timings) if repo.stage_timings else None,
+            'index_version': repo.index_version,
+        }
+
+    def _reload(self):
+        if time.monotonic() - self._loaded_at < config.STATUS_CACHE_TTL:
+            return
+        with self._reload_lock:
+            if time.monotonic() - self._loaded_at < config.STATUS_CACHE_TTL:
+                return
+            started = time.time()
+            with Session(engine) as session:
+                rows = {r.id: self._row(r) for r in session.exec(select(Repository)).all()}
+            with self._lock:
+                self._rows = rows
+                for repo_id, live in list(self._live.items()):
+                    # Final states are committed before they are published, so the
+                    # rows have them; events that stopped coming belong to a dead job
+                    if repo_id not in rows or live['at'] < started and (
+                            live.get('status') in TERMINAL or started - live['at'] > config.JOB_STALE_SECONDS):
+                        del self._live[repo_id]
+                self._loaded_at = time.monotonic()
+
+    def _merged(self, repo_id: str) -> Optional[Dict]:
+        row = self._rows.get(repo_id)
+        if row is None:
+            return None
+        live = self._live.get(repo_id, {})
+        return {**row, **{k: v for k, v in live.items() if k != 'at'}}
+
+    def get(self, repo_id: str) -> Optional[Dict]:
+        self._reload()
+        with self._lock:
+            snapshot = self._merged(repo_id)
+        if snapshot is not None:
+            return snapshot
+        # Created since the last reload, e.g. through another API process
+        with Session(engine) as session:
+            repo = session.get(Repository, repo_id)
+            if repo is None:
+                return None
+            with self._lock:
+                self._rows[repo_id] = self._row(repo)
+                return self._merged(repo_id)
+
+    def index_version(self, repo_id: str) -> int:
+        """
+        The repository's index_version as of the last reload (0 if unknown).
+        """
+        snapshot = self.get(repo_id)
+        return snapshot['index_version'] if snapshot else 0
+
+    def list_repositories(self) -> List[Dict]:
+        self._reload()
+        with self._lock:
+            return [self._merged(repo_id) for repo_id in self._rows]
+
+    def _notify(self, repo_id: str):
+        with self._lock:
+            watchers = list(self._watchers.get(repo_id, ()))
+        for loop, changed in watchers:
+            try:
+                loop.call_soon_threadsafe(changed.set)
+            except RuntimeError:  # loop already closed
+                pass
+
+    async def watch(self, repo_id: str) -> AsyncIterator[Optional[Dict]]:
+        """
+        Yields the repository's status now and after every change, until the
+        job finishes or the repository is deleted. Yields None when nothing
+        changed for STATUS_CACHE_TTL seconds (standalone workers don't send
+        events; their progress only shows up through the database).
+        """
+        changed = asyncio.Event()
+        watcher = (asyncio.get_running_loop(), changed)
+        with self._lock:
+            self._watchers.setdefault(repo_id, []).append(watcher)
+        try:
+            last = None
+            while True:
+                changed.clear()
+                snapshot = await asyncio.to_thread(self.get, repo_id)
+                if snapshot is None:
+                    return
+                if snapshot != last:
+                    yield snapshot
+                    last = snapshot
+                else:
+                    yield None
+                if snapshot['status'] in TERMINAL:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=config.STATUS_CACHE_TTL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._lock:
+                self._watchers[repo_id].remove(watcher)
+                if not self._watchers[repo_id]:
+                    del self._watchers[repo_id]
+
+progress_service = ProgressService()
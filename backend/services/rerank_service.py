@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from backend.config import config
+
+logger = logging.getLogger(__name__)
+
+class RerankService:
+    """
+    Rescores retrieved chunks with a small CPU cross-encoder, which reads
+    query and chunk together and orders candidates far better than either
+    the bi-encoder or BM25 alone. The model is loaded on first use.
+    """
+
+    def __init__(self):
+        self.model_name = config.RERANK_MODEL
+        self.batch_size = config.RERANK_BATCH_SIZE
+        self._model = None
+        self._failed = False
+        self._lock = threading.Lock()
+        # One scoring call at a time; the model already uses every core
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None and not self._failed:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading rerank model: {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+                except Exception as e:
+                    logger.error(f"Failed to load rerank model {self.model_name}: {e}; keeping retrieval order")
+                    self._failed = True
+            return self._model
+
+    def rerank(self, query: str, hits: List[Dict]) -> List[Dict]:
+        """
+        Returns hits ordered by cross-encoder score (stored as 'rerank_score').
+        Falls back to the incoming order if the model is unavailable.
+        """
+        if len(hits) < 2:
+            return list(hits)
+        model = self._get_model()
+        if model is None:
+            return list(hits)
+        try:
+            scores = model.predict([(query, hit['text']) for hit in hits], batch_size=self.batch_size,
+                                   show_progress_bar=False)
+        except Exception as e:
+            logger.error(f"Error reranking: {e}")
+            return list(hits)
+        ranked = sorted(zip(scores, range(len(hits))), key=lambda pair: -pair[0])
+        return [{**hits[i], 'rerank_score': float(score)} for score, i in ranked]
+
+    def warmup(self):
+        self.rerank("warm up", [{'text': "def warm_up(): return None"}, {'text': "warm_up()"}])
+
+    async def arerank(self, query: str, hits: List[Dict]) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.rerank, query, hits)
+
+rerank_service = RerankService()
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+from typing import Dict, List
+from backend.config import config
+from backend.services.embedding_service import embedding_service
+from backend.services.vector_service import vector_service
+from backend.services.lexical_service import lexical_service
+from backend.services.rerank_service import rerank_service
+from backend.services.context_packer import merge_ranges, pack_context
+from backend.services.event_bus import event_bus
+from backend.services.metrics import metrics
+from backend.services.progress_service import progress_service
+from backend.services.query_cache import TTLCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+class RetrievalService:
+    """
+    Query path for chat: query text -> embedding -> search hits, with a
+    two-level cache in front. Level 1 maps normalized query text to its
+    embedding (shared by all repos); level 2 maps (repo_id, index_version,
+    query, limit) to the hits. index_version comes from the repository rows
+    (reloaded every STATUS_CACHE_TTL seconds), so updates by standalone
+    workers, which send no events, still miss the cache; events from the
+    API's own workers drop the stale entries right away.
+
+    With HYBRID_SEARCH, dense and BM25 searches run concurrently and are
+    merged with reciprocal rank fusion, so exact identifiers that the
+    embedding model blurs still make it into the context.
+
+    retrieve_context() is what chat uses: it over-fetches candidates,
+    reranks them with a cross-encoder, packs the best ones into
+    CONTEXT_TOKEN_BUDGET prompt tokens and merges overlapping line ranges.
+    """
+
+    def __init__(self):
+        self.embeddings = TTLCache(config.QUERY_CACHE_SIZE, config.QUERY_CACHE_TTL)
+        self.results = TTLCache(config.QUERY_CACHE_SIZE, config.QUERY_CACHE_TTL)
+        event_bus.subscribe(self._on_event)
+
+    def _on_event(self, event: Dict):
+        if event.get('type') in ('index_updated', 'repo_deleted'):
+            self.invalidate(event['repo_id'])
+
+    def invalidate(self, repo_id: str):
+        dropped = self.results.invalidate(lambda key: key[0] == repo_id)
+        if dropped:
+            logger.info(f"Dropped {dropped} cached searches for {repo_id}")
+
+    async def embed_query(self, query: str):
+        key = normalize_query(query)
+        vector = self.embeddings.get(key)
+        if vector is None:
+            with metrics.span('query_embed'):
+                vector = await embedding_service.embed_query(key)
+            self.embeddings.set(key, vector)
+        return vector
+
+    @staticmethod
+    async def _index_version(repo_id: str) -> int:
+        return await asyncio.to_thread(progress_service.index_version, repo_id)
+
+    async def retrieve(self, repo_id: str, query: str, limit: int = 5) -> List[Dict]:
+        return await self._retrieve(repo_id, query, limit, await self._index_version(repo_id))
+
+    async def _retrieve(self, repo_id: str, query: str, limit: int, index_version: int) -> List[Dict]:
+        key = (repo_id, index_version, normalize_query(query), limit)
+        hits = self.results.get(key)
+        if hits is not None:
+            return list(hits)
+
+        if config.HYBRID_SEARCH:
+            hits = await self._hybrid_search(repo_id, query, limit)
+        else:
+            hits = await self._dense_search(repo_id, query, limit)
+        # Empty results are usually a repo that is still indexing; don't pin them
+        if hits:
+            self.results.set(key, hits)
+        return list(hits)
+
+    async def retrieve_context(self, repo_id: str, query: str) -> List[Dict]:
+        index_version = await self._index_version(repo_id)
+        key = (repo_id, index_version, normalize_query(query), 'context')
+        context = self.results.get(key)
+        if context is not None:
+            return list(context)
+
+        candidates = await self._retrieve(repo_id, query, config.RETRIEVAL_CANDIDATES, index_version)
+        if config.RERANK_ENABLED:
+            with metrics.span('rerank'):
+                candidates = await rerank_service.arerank(query, candidates)
+        # Merge only what was selected, so neighbours of a hit don't crowd it out
+        context = merge_ranges(pack_context(candidates, config.CONTEXT_TOKEN_BUDGET))
+        if context:
+            self.results.set(key, context)
+        return list(context)
+
+    async def _dense_search(self, repo_id: str, query: str, limit: int) -> List[Dict]:
+        query_vector = await self.embed_query(query)
+        with metrics.span('search'):
+            return await vector_service.async_search(repo_id, query_vector, limit=limit)
+
+    async def _hybrid_search(self, repo_id: str, query: str, limit: int) -> List[Dict]:
+        candidates = max(limit, config.HYBRID_CANDIDATES)
+        dense, lexical = await asyncio.gather(
+            self._dense_search(repo_id, query, candidates),
+            asyncio.to_thread(self._lexical_search, repo_id, query, candidates)
+        )
+        return fuse_rankings([dense, lexical], limit, config.RRF_K)
+
+    @staticmethod
+    def _lexical_search(repo_id: str, query: str, limit: int) -> List[Dict]:
+        with metrics.span('lexical_search'):
+            return lexical_service.search(repo_id, query, limit)
+
+def fuse_rankings(rankings: List[List[Dict]], limit: int, k: int = 60) -> List[Dict]:
+    """
+    Reciprocal rank fusion: score(hit) = sum over rankings of 1 / (k + rank).
+    Only ranks matter, so BM25 and cosine scores need no normalization.
+    """
+    fused: Dict[str, float] = {}
+    hits: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            key = str(hit['id'])
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(key, hit)
+    ordered = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [{**hits[key], 'score': fused[key]} for key in ordered]
+
+retrieval_service = RetrievalService()
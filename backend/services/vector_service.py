@@ -1,77 +1,347 @@
+import uuid
+import asyncio
+import threading
 import logging
-from typing import List, Dict, Any
-from qdrant_client import QdrantClient
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Optional, Sequence, Union
+import numpy as np
+from qdrant_client import QdrantClient, AsyncQdrantClient
 from qdrant_client.http import models
 from backend.config import config
 
 logger = logging.getLogger(__name__)
 
-class VectorService:
+# Embeddings arrive as float32 NumPy rows; vectors read back from Qdrant are lists
+Vector = Union[List[float], np.ndarray]
+
+# Fixed namespace so the same chunk always maps to the same point id
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3b0e-6a43-4c55-9d0e-5f3f2c1a9b7d")
+
+def point_id(repo_id: str, payload: Dict) -> str:
+    """
+    Content-addressed point id: re-upserting the same chunk (retries, resumed
+    ingests, refreshes) overwrites the existing point instead of duplicating it.
+    """
+    key = f"{repo_id}:{payload['file_path']}:{payload['start_line']}:{payload['end_line']}:{payload.get('content_hash', '')}"
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, key))
+
+def to_hit(pid: Any, score: float, payload: Dict) -> Dict:
+    return {
+        'id': pid,
+        'score': score,
+        'text': payload.get('text', ''),
+        'metadata': {
+            'file_path': payload.get('file_path', ''),
+            'start_line': payload.get('start_line', 0),
+            'end_line': payload.get('end_line', 0),
+            'symbols': payload.get('symbols', [])
+        }
+    }
+
+class VectorStore(ABC):
+    """
+    Interface shared by the vector backends. One collection per repository.
+    """
+
+    @abstractmethod
+    def ensure_collection(self, collection_name: str, vector_size: int = 384):
+        ...
+
+    @abstractmethod
+    def upsert_vectors(self, collection_name: str, vectors: Sequence[Vector], payloads: List[Dict],
+                       ids: Optional[List[Any]] = None, batch_size: Optional[int] = None):
+        ...
+
+    @abstractmethod
+    def delete_collection(self, collection_name: str):
+        ...
+
+    @abstractmethod
+    def get_file_points(self, collection_name: str, file_paths: List[str]) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def delete_file_points(self, collection_name: str, file_paths: List[str], keep_ids: Optional[List[Any]] = None):
+        ...
+
+    @abstractmethod
+    def search(self, collection_name: str, query_vector: Vector, limit: int = 5) -> List[Dict]:
+        ...
+
+    async def async_search(self, collection_name: str, query_vector: Vector, limit: int = 5) -> List[Dict]:
+        # Backends without a native async client search on a worker thread
+        return await asyncio.to_thread(self.search, collection_name, query_vector, limit)
+
+    def warmup(self):
+        """
+        Opens clients and connections ahead of the first request.
+        """
+
+class QdrantVectorStore(VectorStore):
+    """
+    Qdrant backend. Callers always address a repository by its repo_id.
+
+    With VECTOR_LAYOUT=per_repo each repository is its own collection.
+    With VECTOR_LAYOUT=shared all repositories live in SHARED_COLLECTION,
+    every point carries a repo_id payload field (indexed as the tenant
+    key), and each operation is restricted to the repository by a filter.
+    """
+
     def __init__(self):
-        self.client = QdrantClient(
-            url=config.QDRANT_URL,
-            api_key=config.QDRANT_API_KEY,
-            timeout=300  # Increased timeout for cloud stability
-        )
+        # Clients are created on first use: constructing one contacts the server
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
         self.vector_size = 384  # Dimension for all-MiniLM-L6-v2
+        self.shared = config.VECTOR_LAYOUT == "shared"
+        if config.VECTOR_LAYOUT not in ("per_repo", "shared"):
+            raise ValueError(f"Unknown VECTOR_LAYOUT: {config.VECTOR_LAYOUT}")
+        # Collections known to exist, so ingestion doesn't ask Qdrant per batch
+        self._existing = set()
+
+    @property
+    def client(self) -> QdrantClient:
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = QdrantClient(
+                        url=config.QDRANT_URL,
+                        api_key=config.QDRANT_API_KEY,
+                        timeout=300  # Increased timeout for cloud stability
+                    )
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncQdrantClient:
+        # Used by the chat path so searches never block the event loop
+        if self._async_client is None:
+            with self._client_lock:
+                if self._async_client is None:
+                    self._async_client = AsyncQdrantClient(
+                        url=config.QDRANT_URL,
+                        api_key=config.QDRANT_API_KEY,
+                        timeout=300
+                    )
+        return self._async_client
+
+    def warmup(self):
+        self.client.get_collections()
+
+    @staticmethod
+    def collection_params(vector_size: int, quantization: str = None, on_disk: bool = None,
+                          hnsw_m: int = None, hnsw_ef_construct: int = None) -> Dict[str, Any]:
+        """
+        create_collection() arguments for the configured memory/accuracy
+        trade-off. Quantized vectors always stay in RAM; with on_disk the
+        float32 originals are memory-mapped and only read for rescoring.
+        """
+        quantization = quantization or config.VECTOR_QUANTIZATION
+        on_disk = config.VECTOR_ON_DISK if on_disk is None else on_disk
+        if quantization == "scalar":
+            quantization_config = models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            ))
+        elif quantization == "binary":
+            quantization_config = models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        elif quantization == "none":
+            quantization_config = None
+        else:
+            raise ValueError(f"Unknown VECTOR_QUANTIZATION: {quantization}")
+        return {
+            'vectors_config': models.VectorParams(size=vector_size, distance=models.Distance.COSINE, on_disk=on_disk),
+            'hnsw_config': models.HnswConfigDiff(
+                m=hnsw_m or config.HNSW_M,
+                ef_construct=hnsw_ef_construct or config.HNSW_EF_CONSTRUCT,
+                on_disk=config.HNSW_ON_DISK
+            ),
+            'quantization_config': quantization_config,
+        }
+
+    @staticmethod
+    def search_params(hnsw_ef: int = None, rescore: bool = None, oversampling: float = None) -> models.SearchParams:
+        return models.SearchParams(
+            hnsw_ef=hnsw_ef or config.SEARCH_HNSW_EF,
+            # Ignored by Qdrant for collections without quantization
+            quantization=models.QuantizationSearchParams(
+                rescore=config.SEARCH_RESCORE if rescore is None else rescore,
+                oversampling=oversampling or config.SEARCH_OVERSAMPLING
+            )
+        )
+
+    def _collection(self, repo_id: str) -> str:
+        return config.SHARED_COLLECTION if self.shared else repo_id
+
+    def _repo_conditions(self, repo_id: str) -> List:
+        if not self.shared:
+            return []
+        return [models.FieldCondition(key='repo_id', match=models.MatchValue(value=repo_id))]
+
+    def _repo_filter(self, repo_id: str) -> Optional[models.Filter]:
+        conditions = self._repo_conditions(repo_id)
+        return models.Filter(must=conditions) if conditions else None
+
+    def _files_filter(self, repo_id: str, file_paths: List[str], keep_ids: Optional[List[Any]] = None) -> models.Filter:
+        return models.Filter(
+            must=self._repo_conditions(repo_id) + [
+                models.FieldCondition(key='file_path', match=models.MatchAny(any=file_paths))
+            ],
+            must_not=[models.HasIdCondition(has_id=keep_ids)] if keep_ids else None
+        )
 
     def ensure_collection(self, collection_name: str, vector_size: int = 384):
+        collection = self._collection(collection_name)
+        if collection in self._existing:
+            return
         try:
-            collections = self.client.get_collections().collections
-            exists = any(c.name == collection_name for c in collections)
-            
-            if not exists:
-                logger.info(f"Creating collection: {collection_name} with size {vector_size}")
+            if not self.client.collection_exists(collection):
+                logger.info(
+                    f"Creating collection: {collection} with size {vector_size} "
+                    f"(quantization={config.VECTOR_QUANTIZATION}, on_disk={config.VECTOR_ON_DISK})"
+                )
                 self.client.create_collection(
-                    collection_name=collection_name,
-                    vectors_config=models.VectorParams(
-                        size=vector_size,
-                        distance=models.Distance.COSINE
-                    )
+                    collection_name=collection,
+                    **self.collection_params(vector_size)
                 )
+                if self.shared:
+                    # Tenant index: points of one repo are stored together and
+                    # filtered searches don't scan other repositories
+                    self.client.create_payload_index(
+                        collection, 'repo_id',
+                        field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True)
+                    )
+                self.client.create_payload_index(collection, 'file_path', field_schema=models.PayloadSchemaType.KEYWORD)
+            self._existing.add(collection)
         except Exception as e:
             logger.error(f"Error ensuring collection: {e}")
             raise
 
-    def upsert_vectors(self, collection_name: str, vectors: List[List[float]], payloads: List[Dict]):
+    def upsert_vectors(self, collection_name: str, vectors: Sequence[Vector], payloads: List[Dict],
+                       ids: Optional[List[Any]] = None, batch_size: Optional[int] = None):
         try:
+            if ids is None:
+                ids = [point_id(collection_name, payload) for payload in payloads]
+            if self.shared:
+                payloads = [{**payload, 'repo_id': collection_name} for payload in payloads]
             points = [
                 models.PointStruct(
-                    id=i,
-                    vector=vector,
+                    id=pid,
+                    vector=vector.tolist() if hasattr(vector, 'tolist') else vector,
                     payload=payload
                 )
-                for i, (vector, payload) in enumerate(zip(vectors, payloads))
+                for pid, vector, payload in zip(ids, vectors, payloads)
             ]
             
-            self.client.upsert(
-                collection_name=collection_name,
-                points=points
-            )
+            # Split into several requests so a single call never carries the whole corpus
+            batch_size = batch_size or config.UPSERT_BATCH_SIZE
+            for start in range(0, len(points), batch_size):
+                self.client.upsert(
+                    collection_name=self._collection(collection_name),
+                    points=points[start:start + batch_size]
+                )
         except Exception as e:
             logger.error(f"Error upserting vectors: {e}")
             raise
 
-    def search(self, collection_name: str, query_vector: List[float], limit: int = 5) -> List[Dict]:
+    def delete_collection(self, collection_name: str):
+        """
+        Removes every point of the repository (the whole collection in the
+        per-repo layout, a filtered bulk delete in the shared one).
+        """
+        try:
+            if self.shared:
+                if self.client.collection_exists(config.SHARED_COLLECTION):
+                    logger.info(f"Deleting points of {collection_name} from {config.SHARED_COLLECTION}")
+                    self.client.delete(
+                        collection_name=config.SHARED_COLLECTION,
+                        points_selector=models.FilterSelector(filter=self._repo_filter(collection_name))
+                    )
+                return
+            if self.client.collection_exists(collection_name):
+                logger.info(f"Deleting collection: {collection_name}")
+                self.client.delete_collection(collection_name)
+            self._existing.discard(collection_name)
+        except Exception as e:
+            logger.error(f"Error deleting collection: {e}")
+            raise
+
+    def get_file_points(self, collection_name: str, file_paths: List[str]) -> List[Dict]:
+        """
+        Returns id, vector and payload of every point belonging to the given files.
+        """
         try:
-            results = self.client.search(
-                collection_name=collection_name,
-                query_vector=query_vector,
-                limit=limit
+            points, offset = [], None
+            while True:
+                records, offset = self.client.scroll(
+                    collection_name=self._collection(collection_name),
+                    scroll_filter=self._files_filter(collection_name, file_paths),
+                    with_payload=True,
+                    with_vectors=True,
+                    limit=256,
+                    offset=offset
+                )
+                points.extend({'id': r.id, 'vector': r.vector, 'payload': r.payload} for r in records)
+                if offset is None:
+                    return points
+        except Exception as e:
+            logger.error(f"Error fetching points for files: {e}")
+            raise
+
+    def delete_file_points(self, collection_name: str, file_paths: List[str], keep_ids: Optional[List[Any]] = None):
+        """
+        Deletes every point of the given files, except for keep_ids.
+        """
+        if not file_paths:
+            return
+        try:
+            self.client.delete(
+                collection_name=self._collection(collection_name),
+                points_selector=models.FilterSelector(filter=self._files_filter(collection_name, file_paths, keep_ids))
             )
-            return [
-                {
-                    'text': r.payload.get('text', ''),
-                    'metadata': {
-                        'file_path': r.payload.get('file_path', ''),
-                        'start_line': r.payload.get('start_line', 0),
-                        'end_line': r.payload.get('end_line', 0)
-                    }
-                }
-                for r in results
-            ]
+        except Exception as e:
+            logger.error(f"Error deleting points for files: {e}")
+            raise
+
+    @staticmethod
+    def _to_hits(results) -> List[Dict]:
+        return [to_hit(r.id, r.score, r.payload) for r in results]
+
+    def search(self, collection_name: str, query_vector: Vector, limit: int = 5) -> List[Dict]:
+        try:
+            results = self.client.query_points(
+                collection_name=self._collection(collection_name),
+                query=query_vector.tolist() if hasattr(query_vector, 'tolist') else query_vector,
+                query_filter=self._repo_filter(collection_name),
+                limit=limit,
+                search_params=self.search_params(),
+                with_payload=True
+            )
+            return self._to_hits(results.points)
         except Exception as e:
             logger.error(f"Error searching vectors: {e}")
             return []
 
-vector_service = VectorService()
+    async def async_search(self, collection_name: str, query_vector: Vector, limit: int = 5) -> List[Dict]:
+        try:
+            results = await self.async_client.query_points(
+                collection_name=self._collection(collection_name),
+                query=query_vector.tolist() if hasattr(query_vector, 'tolist') else query_vector,
+                query_filter=self._repo_filter(collection_name),
+                limit=limit,
+                search_params=self.search_params(),
+                with_payload=True
+            )
+            return self._to_hits(results.points)
+        except Exception as e:
+            logger.error(f"Error searching vectors: {e}")
+            return []
+
+def create_vector_service() -> VectorStore:
+    backend = config.VECTOR_BACKEND
+    if backend == "numpy":
+        from backend.services.numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(config.VECTOR_STORE_DIR)
+    if backend != "qdrant":
+        raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+    return QdrantVectorStore()
+
+vector_service = create_vector_service()
@@ -0,0 +1,63 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict
+from backend.config import config
+from backend.services.embedding_service import embedding_service
+from backend.services.vector_service import vector_service
+from backend.services.rerank_service import rerank_service
+from backend.services.llm_service import llm_service
+
+logger = logging.getLogger(__name__)
+
+class WarmupService:
+    """
+    Services load models and open clients on first use. Warm-up does that
+    work up front, in the background after startup, so /health answers at
+    once while /ready only succeeds once the first chat request will not
+    pay for a model load or a handshake.
+    """
+
+    def __init__(self):
+        self.enabled = config.WARMUP_ON_STARTUP
+        self.state = "pending"  # pending | running | done | failed | skipped
+        self.components: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.state in ("done", "skipped")
+
+    async def _step(self, name: str, step, blocking: bool = True) -> bool:
+        started = time.perf_counter()
+        try:
+            if blocking:
+                await asyncio.to_thread(step)
+            else:
+                await step()
+            self.components[name] = {'status': 'ok', 'seconds': round(time.perf_counter() - started, 3)}
+            return True
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {e}")
+            self.components[name] = {'status': 'failed', 'error': str(e)}
+            return False
+
+    async def run(self):
+        if not self.enabled:
+            self.state = "skipped"
+            return
+        self.state = "running"
+        started = time.perf_counter()
+        ok = await self._step('embedding', embedding_service.warmup)
+        ok = await self._step('vector_store', vector_service.warmup) and ok
+        if config.RERANK_ENABLED:
+            # Falls back to retrieval order without a model, so never blocks readiness
+            await self._step('rerank', rerank_service.warmup)
+        # An unreachable LLM endpoint shouldn't keep the API out of rotation either
+        await self._step('llm', llm_service.warmup, blocking=False)
+        self.state = "done" if ok else "failed"
+        logger.info(f"Warm-up {self.state} in {time.perf_counter() - started:.1f}s: {self.components}")
+
+    def status(self) -> Dict[str, Any]:
+        return {'status': 'ready' if self.ready else self.state, 'components': self.components}
+
+warmup_service = WarmupService()
@@ -0,0 +1,347 @@
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import update
+from sqlmodel import Session
+from backend.config import config
+from backend.database import Repository, engine, create_db_and_tables
+from backend.services.job_queue import JobCancelled, job_queue
+from backend.services.event_bus import event_bus
+from backend.services.github_service import github_service
+from backend.services.parser_service import parser_service
+from backend.services.ingestion_service import ingestion_service
+from backend.services.embedding_service import embedding_service
+from backend.services.vector_service import vector_service
+from backend.services.lexical_service import lexical_service
+from backend.services.metrics import metrics, StageTimer
+from backend.services.progress_service import progress_service
+
+logger = logging.getLogger(__name__)
+
+def _record_timings(repo: Repository, timer: StageTimer, started: float):
+    timings = timer.rounded()
+    timings['total'] = round(time.perf_counter() - started, 3)
+    repo.stage_timings = json.dumps(timings)
+    logger.info(f"Stage timings for {repo.id}: {timings}")
+
+class JobProgress:
+    """
+    Publishes every progress update of a job on the progress bus at once, but
+    commits the repository row at most every PROGRESS_WRITE_INTERVAL seconds
+    (status changes always), so big ingests don't keep taking SQLite's write lock.
+    """
+
+    def __init__(self, session: Session, repo: Repository, cancelled: Optional[threading.Event] = None):
+        self.session = session
+        self.repo = repo
+        self.cancelled = cancelled  # set by the job's heartbeat thread
+        self.counters = {'chunks_embedded': 0, 'vectors_upserted': 0}
+        self._written = float('-inf')
+        self._lock = threading.Lock()
+
+    def update(self, stage: str, commit: bool = False, **counters):
+        # Only from the job's own thread: the session is not thread-safe
+        if commit or time.monotonic() - self._written >= config.PROGRESS_WRITE_INTERVAL:
+            self.session.add(self.repo)
+            self.session.commit()
+            self._written = time.monotonic()
+        self.publish(stage, **counters)
+
+    def check_cancelled(self):
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise JobCancelled(f"Job for {self.repo.id} was cancelled")
+
+    def publish(self, stage: str, **counters):
+        repo = self.repo
+        with self._lock:
+            self.counters.update(counters)
+            progress_service.publish(
+                repo.id, stage, status=repo.status, progress=repo.progress, total_files=repo.total_files,
+                processed_files=repo.processed_files, completed_at=repo.completed_at, error=repo.error,
+                **self.counters
+            )
+
+@contextmanager
+def _tracked_run(session: Session, repo: Repository, cancelled: Optional[threading.Event], action: str):
+    """
+    Wraps one ingest or refresh of repo: marks it processing, then records the
+    stage timings and marks it completed (if the body returns) or failed.
+    Yields the job's progress reporter and stage timer.
+    """
+    timer = StageTimer()
+    started = time.perf_counter()
+    job = JobProgress(session, repo, cancelled)
+    try:
+        repo.status = "processing"
+        repo.error = None
+        job.update('started', commit=True)
+        
+        yield job, timer
+        
+        _record_timings(repo, timer, started)
+        repo.progress = 1.0
+        repo.status = "completed"
+        repo.completed_at = datetime.utcnow()
+        job.update('completed', commit=True)
+        
+    except JobCancelled:
+        # The row is left alone: it is deleted, or another worker owns the job now
+        logger.info(f"Stopped {action} {repo.id}: job cancelled")
+        raise
+    except Exception as e:
+        logger.error(f"Error {action} repo {repo.id}: {e}")
+        _record_timings(repo, timer, started)
+        repo.status = "failed"
+        repo.error = str(e)
+        job.update('failed', commit=True)
+        raise
+
+def process_repository(repo_id: str, repo_url: str, resume: bool = False,
+                       cancelled: Optional[threading.Event] = None):
+    # Rows stay loaded after commits, so progress updates don't re-read them
+    with Session(engine, expire_on_commit=False) as session:
+        repo = session.get(Repository, repo_id)
+        if not repo: return
+        
+        with _tracked_run(session, repo, cancelled, 'processing') as (job, timer):
+            # 1. Clone, unless a resumable checkout is still on disk
+            repo_path = github_service.repo_path(repo_id)
+            start_file = 0
+            if resume and repo.checkpoint_sha and github_service.has_checkout(repo_path) \
+                    and github_service.head_commit(repo_path) == repo.checkpoint_sha:
+                start_file = repo.checkpoint_files
+                logger.info(f"Resuming {repo_id} from file {start_file}")
+            else:
+                with timer.span('clone'):
+                    repo_path = github_service.clone_repository(repo_url, repo_id, include=parser_service.is_indexable)
+                # Start from an empty collection so no points of an older index survive
+                vector_service.delete_collection(repo_id)
+                lexical_service.delete_repo(repo_id)
+                repo.checkpoint_sha = github_service.head_commit(repo_path)
+                repo.checkpoint_files = 0
+                job.publish('cloned')
+            
+            # 2. Parse (sorted so a checkpoint always refers to the same files)
+            with timer.span('discover'):
+                files = sorted(parser_service.get_repo_files(repo_path))
+            repo.total_files = len(files)
+            repo.processed_files = start_file
+            job.update('discovered', commit=True)
+            
+            # 3. Chunk, embed and upsert in bounded batches
+            def on_progress(files_done: int, chunks_done: int):
+                job.check_cancelled()  # once per batch
+                repo.processed_files = files_done
+                repo.checkpoint_files = files_done
+                repo.progress = files_done / len(files) if files else 1.0
+                job.update('upserted', vectors_upserted=chunks_done)
+            
+            # Called from the pipeline's threads: publish only
+            on_embedded = lambda chunks: job.publish('embedded', chunks_embedded=chunks)
+            ingestion_service.run(repo_id, repo_path, files, on_progress, start_file=start_file, timer=timer,
+                                  on_embedded=on_embedded)
+            
+            repo.commit_sha = repo.checkpoint_sha
+            repo.checkpoint_sha = None
+            repo.checkpoint_files = 0
+
+def refresh_repository(repo_id: str, cancelled: Optional[threading.Event] = None):
+    with Session(engine, expire_on_commit=False) as session:
+        repo = session.get(Repository, repo_id)
+        if not repo: return
+        
+        repo_path = github_service.repo_path(repo_id)
+        if not repo.commit_sha or not github_service.has_checkout(repo_path):
+            # Nothing to diff against; fall back to a full ingest
+            session.close()
+            process_repository(repo_id, repo.repo_url, cancelled=cancelled)
+            return
+        
+        repo.progress = 0.0
+        with _tracked_run(session, repo, cancelled, 'refreshing') as (job, timer):
+            # 1. Fetch and diff against the last indexed commit
+            with timer.span('fetch'):
+                _, new_sha = github_service.fetch_updates(repo_id, include=parser_service.is_indexable)
+                changed, deleted = github_service.diff_files(repo_path, repo.commit_sha, new_sha)
+            changed = [p for p in changed if parser_service.is_indexable(p)]
+            deleted = [p for p in deleted if parser_service.is_indexable(p)]
+            job.publish('fetched')
+            
+            # 2. Re-embed only what changed
+            def on_progress(files_done: int, chunks_done: int):
+                job.check_cancelled()
+                repo.progress = files_done / len(changed) if changed else 1.0
+                job.update('upserted', vectors_upserted=chunks_done)
+            
+            on_embedded = lambda chunks: job.publish('embedded', chunks_embedded=chunks)
+            ingestion_service.refresh(repo_id, repo_path, changed, deleted, on_progress, timer=timer,
+                                      on_embedded=on_embedded)
+            
+            repo.commit_sha = new_sha
+
+def _drop_if_deleted(repo_id: str):
+    """
+    The delete route cleans up while a running job may still be writing its
+    last batch; clean up again once the job has stopped.
+    """
+    with Session(engine) as session:
+        if session.get(Repository, repo_id) is not None:
+            return
+    vector_service.delete_collection(repo_id)
+    lexical_service.delete_repo(repo_id)
+    github_service.cleanup(repo_id)
+
+def bump_index_version(repo_id: str):
+    with Session(engine) as session:
+        session.execute(
+            update(Repository).where(Repository.id == repo_id).values(index_version=Repository.index_version + 1)
+        )
+        session.commit()
+
+def run_job(job, cancelled: Optional[threading.Event] = None) -> None:
+    if job.kind == "refresh":
+        refresh_repository(job.repo_id, cancelled)
+        return
+
+    with Session(engine) as session:
+        repo = session.get(Repository, job.repo_id)
+        if not repo:
+            logger.warning(f"Job {job.id}: repository {job.repo_id} no longer exists")
+            return
+        repo_url = repo.repo_url
+    process_repository(job.repo_id, repo_url, resume=job.kind == "resume", cancelled=cancelled)
+
+def _heartbeat(job_id: int, stop: threading.Event, cancelled: threading.Event):
+    interval = max(1.0, config.JOB_STALE_SECONDS / 4)
+    while not stop.wait(interval):
+        try:
+            if not job_queue.heartbeat(job_id):
+                logger.info(f"Job {job_id} is no longer running; stopping it after the current batch")
+                cancelled.set()
+                return
+        except Exception as e:
+            logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+        metrics.flush()  # long jobs show up in /metrics while they run
+
+def run_worker(worker_id: str, stop: threading.Event = None):
+    """
+    Polls the job queue and runs one job at a time until stop is set.
+    """
+    stop = stop or threading.Event()
+    logger.info(f"Ingestion worker {worker_id} started (pid {os.getpid()})")
+    last_sweep = 0.0
+    while not stop.is_set():
+        try:
+            if time.monotonic() - last_sweep > config.JOB_STALE_SECONDS / 2:
+                job_queue.requeue_stale()
+                last_sweep = time.monotonic()
+
+            job = job_queue.claim(worker_id)
+            if job is None:
+                stop.wait(config.JOB_POLL_INTERVAL)
+                continue
+
+            logger.info(f"Worker {worker_id} picked up {job.kind} job {job.id} for {job.repo_id}")
+            beat_stop, cancelled = threading.Event(), threading.Event()
+            threading.Thread(target=_heartbeat, args=(job.id, beat_stop, cancelled), daemon=True).start()
+            status = "failed"
+            try:
+                run_job(job, cancelled)
+                job_queue.finish(job.id)
+                status = "done"
+            except JobCancelled:
+                pass
+            except Exception as e:
+                job_queue.finish(job.id, error=str(e))
+            finally:
+                beat_stop.set()
+                # Writes into a just-deleted repository can also fail before the check
+                if cancelled.is_set():
+                    status = "cancelled"
+                    _drop_if_deleted(job.repo_id)
+                # Even a failed job may have touched the index; drop cached searches and answers
+                bump_index_version(job.repo_id)
+                event_bus.publish({'type': 'index_updated', 'repo_id': job.repo_id})
+                metrics.inc('coderag_ingest_jobs_total', kind=job.kind, status=status)
+                metrics.flush()
+        except Exception as e:
+            logger.error(f"Worker {worker_id} error: {e}")
+            stop.wait(config.JOB_POLL_INTERVAL)
+    logger.info(f"Ingestion worker {worker_id} stopped")
+
+def _worker_main(worker_id: str, events=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if events is not None:
+        event_bus.forward_to(events)
+        metrics.forward()
+    if config.WARMUP_ON_STARTUP:
+        # Load the model before claiming a job, so job timings don't include it
+        try:
+            embedding_service.warmup()
+        except Exception as e:
+            logger.error(f"Embedding warm-up failed: {e}")
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    run_worker(worker_id, stop)
+
+class WorkerPool:
+    """
+    Runs ingestion workers in separate processes so clone/parse/encode work
+    never competes with the API event loop.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.processes: List[multiprocessing.Process] = []
+        self.events = None
+
+    def start(self):
+        # spawn, not fork: children must not inherit the parent's model, clients or threads
+        ctx = multiprocessing.get_context("spawn")
+        # Workers report index changes back to this process's event bus
+        self.events = ctx.Queue()
+        event_bus.listen(self.events)
+        for i in range(self.size):
+            worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+            # Not a daemon: the embedding engine may start its own process pool
+            process = ctx.Process(target=_worker_main, args=(worker_id, self.events), name=f"ingest-worker-{i}", daemon=False)
+            process.start()
+            self.processes.append(process)
+        logger.info(f"Started {self.size} ingestion worker processes")
+
+    def stop(self, timeout: float = 10.0):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+        self.processes = []
+        if self.events is not None:
+            event_bus.stop_listener(self.events)
+            self.events = None
+
+if __name__ == "__main__":
+    # Standalone workers: python -m backend.worker [count]
+    create_db_and_tables()
+    pool = WorkerPool(int(sys.argv[1]) if len(sys.argv) > 1 else max(1, config.INGEST_WORKERS))
+    pool.start()
+    try:
+        for process in pool.processes:
+            process.join()
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,347 @@
+"""
+End-to-end ingestion and chat latency, offline and reproducible.
+
+Generates fixture repositories of several sizes (or takes local ones),
+ingests them through the real clone -> parse -> embed -> store pipeline
+via file:// URLs into the in-process numpy vector store, then drives
+/api/chat/stream with N concurrent clients against a local stub of
+OpenRouter:
+
+    python -m benchmarks.end_to_end --sizes small medium --concurrency 1 8 32 --requests 200
+
+Reports files/sec, chunks/sec and peak RSS per repository, and query
+(references event), time-to-first-token and total latency percentiles
+per concurrency level. Everything runs in a scratch directory; only the
+embedding model must already be in the local Hugging Face cache. Answer
+and query caches are off unless --cache is given.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from benchmarks.stub_llm import StubLLMServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# name -> number of source files
+SIZES = {'small': 50, 'medium': 500, 'large': 2000}
+
+NOUNS = ['session', 'token', 'cache', 'request', 'config', 'user', 'repository', 'chunk', 'index', 'event',
+         'payload', 'worker', 'queue', 'vector', 'query', 'file', 'commit', 'batch', 'model', 'stream']
+VERBS = ['load', 'parse', 'build', 'validate', 'fetch', 'store', 'merge', 'resolve', 'encode', 'flush',
+         'render', 'compute', 'refresh', 'collect', 'dispatch']
+
+def _python_module(rng: random.Random, index: int) -> str:
+    lines = [f'"""Module {index}: {rng.choice(NOUNS)} {rng.choice(NOUNS)} helpers."""', 'import os', 'import json', '']
+    class_name = f"{rng.choice(NOUNS).title()}{rng.choice(NOUNS).title()}{index}"
+    lines += [f"class {class_name}:", f'    """Keeps {rng.choice(NOUNS)} state for {rng.choice(NOUNS)}s."""', '',
+              '    def __init__(self, limit=10):', '        self.limit = limit', '        self.items = []', '']
+    for _ in range(rng.randint(3, 8)):
+        verb, noun = rng.choice(VERBS), rng.choice(NOUNS)
+        lines += [f"    def {verb}_{noun}(self, {noun}, retries=3):",
+                  f'        """{verb.title()} a {noun} and record it."""']
+        for step in range(rng.randint(6, 18)):
+            other = rng.choice(NOUNS)
+            lines.append(f"        {other}_{step} = self.items[{step} % max(1, len(self.items))] "
+                         f"if self.items else {noun}")
+        lines += [f"        self.items.append({noun})", f"        return {noun}", '']
+    return '\n'.join(lines) + '\n'
+
+def _typescript_module(rng: random.Random, index: int) -> str:
+    lines = []
+    for _ in range(rng.randint(2, 5)):
+        verb, noun = rng.choice(VERBS), rng.choice(NOUNS)
+        lines += [f"export function {verb}{noun.title()}{index}({noun}: string, limit = 10): string[] {{",
+                  "  const out: string[] = [];"]
+        for step in range(rng.randint(4, 12)):
+            lines.append(f"  if ({noun}.length > {step}) out.push({noun}.slice({step}, limit));")
+        lines += ["  return out;", "}", ""]
+    return '\n'.join(lines) + '\n'
+
+def make_fixture(root: str, name: str, n_files: int, seed: int = 0) -> str:
+    """
+    Deterministic repository with n_files source files (90% Python, 10%
+    TypeScript) in a single commit. Reused if it already exists.
+    """
+    path = os.path.join(root, name)
+    if os.path.isdir(os.path.join(path, '.git')):
+        return path
+    rng = random.Random(f"{seed}-{name}-{n_files}")
+    for i in range(n_files):
+        package = os.path.join(path, f"pkg{i // 25}")
+        os.makedirs(package, exist_ok=True)
+        if i % 10 == 9:
+            filename, text = f"module_{i}.ts", _typescript_module(rng, i)
+        else:
+            filename, text = f"module_{i}.py", _python_module(rng, i)
+        with open(os.path.join(package, filename), 'w') as f:
+            f.write(text)
+    env = {**os.environ, 'GIT_AUTHOR_NAME': 'bench', 'GIT_AUTHOR_EMAIL': 'bench@localhost',
+           'GIT_COMMITTER_NAME': 'bench', 'GIT_COMMITTER_EMAIL': 'bench@localhost'}
+    # allowFilter makes file:// clones partial, as GitHub's are; without it the filter is ignored
+    for command in (['git', 'init', '-q'], ['git', 'config', 'uploadpack.allowFilter', 'true'],
+                    ['git', 'add', '-A'], ['git', 'commit', '-q', '-m', 'fixture']):
+        subprocess.run(command, cwd=path, env=env, check=True)
+    return path
+
+def make_queries(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    templates = ['How does {verb}_{noun} handle retries?', 'Where is the {noun} {noun2} cache validated?',
+                 'What calls {verb}_{noun} and what does it return?', 'Explain how {noun}s are {verb}ed']
+    return [
+        rng.choice(templates).format(verb=rng.choice(VERBS), noun=rng.choice(NOUNS), noun2=rng.choice(NOUNS))
+        + f" ({i})"  # distinct text, so caches (if enabled) only help across identical runs
+        for i in range(n)
+    ]
+
+def peak_rss_mb() -> Dict[str, float]:
+    if resource is None:
+        return {}
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1),
+        'peak_rss_children_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale / 2 ** 20, 1),
+    }
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)), 1) for p in (50, 95, 99)}
+
+def ingest(name: str, path: str) -> Dict:
+    from sqlmodel import Session
+    from backend.database import Repository, engine
+    from backend.worker import process_repository
+    from backend.services.metrics import metrics
+
+    repo_id = f"bench-{name}"
+    url = 'file://' + os.path.abspath(path).replace(os.sep, '/')
+    with Session(engine) as session:
+        session.merge(Repository(id=repo_id, repo_url=url))
+        session.commit()
+
+    chunks_before = metrics.value('coderag_ingest_chunks_total')
+    started = time.perf_counter()
+    process_repository(repo_id, url)
+    elapsed = time.perf_counter() - started
+    chunks = metrics.value('coderag_ingest_chunks_total') - chunks_before
+
+    with Session(engine) as session:
+        repo = session.get(Repository, repo_id)
+        files, stage_timings = repo.total_files, json.loads(repo.stage_timings or '{}')
+    result = {
+        'fixture': name,
+        'repo_id': repo_id,
+        'files': files,
+        'chunks': int(chunks),
+        'seconds': round(elapsed, 2),
+        'files_per_sec': round(files / elapsed, 1),
+        'chunks_per_sec': round(chunks / elapsed, 1),
+        'stage_timings': stage_timings,
+        **peak_rss_mb(),
+    }
+    print(f"Ingested {name}: {files} files, {int(chunks)} chunks in {elapsed:.1f}s", file=sys.stderr)
+    return result
+
+def start_api():
+    import uvicorn
+    from backend.main import app, limiter
+    limiter.enabled = False  # /api/chat/stream allows 60 requests/minute per client
+    logging.getLogger('httpx').setLevel(logging.WARNING)  # one line per request otherwise
+
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=0, log_level='warning'))
+    thread = threading.Thread(target=server.run, name="api", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("API server failed to start")
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    # Measure a warmed-up server, as a load balancer would only route to it once ready
+    import httpx
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        status = httpx.get(f"{base_url}/ready").json()
+        if status['status'] in ('ready', 'failed'):
+            if status['status'] == 'failed':
+                print(f"Warm-up failed: {status['components']}", file=sys.stderr)
+            break
+        time.sleep(0.2)
+    return server, thread, base_url
+
+async def _chat_once(client, repo_id: str, question: str) -> Dict:
+    started = time.perf_counter()
+    sample = {'query_ms': None, 'ttft_ms': None, 'error': None}
+    async with client.stream('POST', '/api/chat/stream', json={'repo_id': repo_id, 'message': question}) as response:
+        if response.status_code != 200:
+            sample['error'] = f"HTTP {response.status_code}"
+            await response.aread()
+            return sample
+        async for line in response.aiter_lines():
+            if not line.startswith('data: '):
+                continue
+            event = json.loads(line[6:])
+            now = (time.perf_counter() - started) * 1000
+            if event['type'] == 'references' and sample['query_ms'] is None:
+                sample['query_ms'] = now
+            elif event['type'] == 'content':
+                if event['data'].startswith('Error:'):
+                    sample['error'] = event['data'][:200]
+                elif sample['ttft_ms'] is None:
+                    sample['ttft_ms'] = now
+    sample['total_ms'] = (time.perf_counter() - started) * 1000
+    return sample
+
+async def run_chat(base_url: str, repo_id: str, questions: List[str], concurrency: int) -> Dict:
+    import httpx
+    pending = iter(questions)
+    samples = []
+
+    async def client_loop(client):
+        for question in pending:
+            try:
+                samples.append(await _chat_once(client, repo_id, question))
+            except Exception as e:
+                samples.append({'error': str(e)})
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ok = [s for s in samples if not s.get('error')]
+    errors = [s['error'] for s in samples if s.get('error')]
+    result = {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'requests_per_sec': round(len(samples) / elapsed, 1),
+        'query_ms': percentiles([s['query_ms'] for s in ok if s['query_ms'] is not None]),
+        'ttft_ms': percentiles([s['ttft_ms'] for s in ok if s['ttft_ms'] is not None]),
+        'total_ms': percentiles([s['total_ms'] for s in ok]),
+    }
+    if errors:
+        result['first_error'] = errors[0]
+    return result
+
+def environment() -> Dict:
+    from backend.config import config
+    settings = {
+        name: value for name, value in vars(type(config)).items()
+        if name.isupper() and isinstance(value, (str, int, float, bool))
+        and not any(secret in name for secret in ('KEY', 'TOKEN'))
+    }
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=package_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': settings,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='*', default=['small', 'medium'], choices=list(SIZES))
+    parser.add_argument('--repo', action='append', default=[], help='also ingest this local git repository')
+    parser.add_argument('--concurrency', nargs='*', type=int, default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=100, help='chat requests per concurrency level')
+    parser.add_argument('--first-token-ms', type=float, default=200, help='stub LLM delay before its first token')
+    parser.add_argument('--tokens', type=int, default=50, help='tokens per stub LLM answer')
+    parser.add_argument('--cache', action='store_true', help='keep query and answer caches enabled')
+    parser.add_argument('--rerank', action='store_true', help='rerank with RERANK_MODEL (must be cached locally)')
+    parser.add_argument('--workdir', help='scratch directory (default: a temporary one, removed afterwards)')
+    parser.add_argument('--output', help='results JSON (default: benchmark-<timestamp>.json)')
+    args = parser.parse_args(argv)
+
+    started_at = datetime.utcnow().isoformat() + 'Z'
+    output = os.path.abspath(args.output or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json")
+    repos = [(os.path.basename(os.path.abspath(p)), os.path.abspath(p)) for p in args.repo]
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='coderag-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    original_cwd = os.getcwd()
+
+    stub = StubLLMServer(first_token_ms=args.first_token_ms, tokens=args.tokens).start()
+    # Everything the backend writes (database, repos, vectors) lands in workdir;
+    # must be set before backend modules are imported
+    os.chdir(workdir)
+    os.environ.update({
+        'VECTOR_BACKEND': 'numpy',
+        'VECTOR_STORE_DIR': os.path.join(workdir, 'vector_store'),
+        'LEXICAL_INDEX_DIR': os.path.join(workdir, 'lexical_index'),
+        'MIRRORS_DIR': os.path.join(workdir, 'mirrors'),
+        'EMBEDDING_CACHE_PATH': os.path.join(workdir, 'embedding_cache.db'),
+        'EMBEDDING_CACHE_MAX_MB': '0',  # measure embedding, not cache lookups
+        'INGEST_WORKERS': '0',  # ingestion runs in this process
+        'OPENROUTER_BASE_URL': stub.base_url,
+        'OPENROUTER_API_KEY': 'benchmark',
+        'RERANK_ENABLED': 'true' if args.rerank else 'false',
+    })
+    if not args.cache:
+        os.environ.update({'QUERY_CACHE_SIZE': '0', 'ANSWER_CACHE_SIZE': '0'})
+
+    server = None
+    try:
+        from backend.database import create_db_and_tables
+        create_db_and_tables()
+
+        fixtures = [(size, make_fixture(os.path.join(workdir, 'fixtures'), size, SIZES[size])) for size in args.sizes]
+        ingest_results = [ingest(name, path) for name, path in fixtures + repos]
+
+        chat_results = []
+        if ingest_results and args.concurrency:
+            # Chat against the largest repository ingested
+            target = max(ingest_results, key=lambda r: r['chunks'])
+            server, thread, base_url = start_api()
+            questions = make_queries(args.requests)
+            asyncio.run(run_chat(base_url, target['repo_id'], questions[:min(8, len(questions))], 1))  # warm-up
+            for concurrency in args.concurrency:
+                chat_results.append(asyncio.run(run_chat(base_url, target['repo_id'], questions, concurrency)))
+                print(f"Chat x{concurrency}: {chat_results[-1]}", file=sys.stderr)
+
+        results = {
+            'started_at': started_at,
+            'environment': environment(),
+            'stub_llm': {'first_token_ms': args.first_token_ms, 'tokens': args.tokens},
+            'ingest': ingest_results,
+            'chat': chat_results,
+        }
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(10)
+        stub.stop()
+        os.chdir(original_cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Memory / latency / recall@k trade-off of the Qdrant collection layouts.
+
+Copies the vectors of already indexed repositories into temporary
+collections, one per layout, and queries each with vectors sampled from
+the repository itself against exact (brute-force) ground truth:
+
+    python -m benchmarks.quantization <repo_id> [<repo_id> ...] --k 10 --queries 200
+
+Memory is estimated from the layout (Qdrant does not report per-collection
+RAM): resident vector bytes plus HNSW links.
+"""
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from qdrant_client.http import models
+from backend.services.vector_service import QdrantVectorStore
+
+# name -> (quantization, originals on disk)
+LAYOUTS = {
+    'float32': ('none', False),
+    'float32-on-disk': ('none', True),
+    'int8': ('scalar', False),
+    'int8-on-disk': ('scalar', True),
+    'binary': ('binary', False),
+    'binary-on-disk': ('binary', True),
+}
+
+def load_repository(store: QdrantVectorStore, repo_id: str):
+    """
+    The repository's point ids and vectors, from its own collection or, with
+    VECTOR_LAYOUT=shared, filtered out of SHARED_COLLECTION.
+    """
+    ids, vectors, offset = [], [], None
+    while True:
+        records, offset = store.client.scroll(collection_name=store._collection(repo_id),
+                                              scroll_filter=store._repo_filter(repo_id), with_vectors=True,
+                                              with_payload=False, limit=1024, offset=offset)
+        for record in records:
+            ids.append(record.id)
+            vectors.append(record.vector)
+        if offset is None:
+            return ids, np.asarray(vectors, dtype=np.float32)
+
+def estimated_ram(n: int, dim: int, quantization: str, on_disk: bool, m: int) -> int:
+    resident = 0 if on_disk else n * dim * 4
+    if quantization == 'scalar':
+        resident += n * dim
+    elif quantization == 'binary':
+        resident += n * dim // 8
+    return resident + n * m * 2 * 4  # level-0 links dominate the graph
+
+def wait_indexed(store: QdrantVectorStore, collection: str, timeout: float = 600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = store.client.get_collection(collection)
+        if info.status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(0.5)
+
+def run_layout(store: QdrantVectorStore, name: str, ids, vectors, queries, truth, k: int, args) -> dict:
+    quantization, on_disk = LAYOUTS[name]
+    collection = f"bench_{name.replace('-', '_')}"
+    if store.client.collection_exists(collection):
+        store.client.delete_collection(collection)
+    store.client.create_collection(
+        collection_name=collection,
+        **store.collection_params(vectors.shape[1], quantization, on_disk, args.hnsw_m, args.ef_construct)
+    )
+    try:
+        for start in range(0, len(ids), 512):
+            store.client.upsert(collection_name=collection, points=models.Batch(
+                ids=ids[start:start + 512], vectors=vectors[start:start + 512].tolist()
+            ))
+        wait_indexed(store, collection)
+
+        params = store.search_params(args.ef, rescore=not args.no_rescore, oversampling=args.oversampling)
+        latencies, recalls = [], []
+        for (query_row, query), expected in zip(queries, truth):
+            started = time.perf_counter()
+            result = store.client.query_points(collection_name=collection, query=query.tolist(), limit=k + 1,
+                                               search_params=params, with_payload=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+            found = [p.id for p in result.points if p.id != ids[query_row]][:k]
+            recalls.append(len(set(found) & expected) / k)
+
+        return {
+            'layout': name,
+            'points': len(ids),
+            'ram_mb_estimated': round(estimated_ram(len(ids), vectors.shape[1], quantization, on_disk,
+                                                    args.hnsw_m) / 2 ** 20, 2),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+            f'recall@{k}': round(float(np.mean(recalls)), 4),
+        }
+    finally:
+        store.client.delete_collection(collection)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('repo_ids', nargs='+', help='indexed repositories to read vectors from')
+    parser.add_argument('--layouts', nargs='+', default=list(LAYOUTS), choices=list(LAYOUTS))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--ef', type=int, default=None, help='search hnsw_ef (default: SEARCH_HNSW_EF)')
+    parser.add_argument('--hnsw-m', type=int, default=16)
+    parser.add_argument('--ef-construct', type=int, default=100)
+    parser.add_argument('--oversampling', type=float, default=None)
+    parser.add_argument('--no-rescore', action='store_true')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    store = QdrantVectorStore()
+    ids, vectors = [], []
+    for repo_id in args.repo_ids:
+        repo_ids, repo_vectors = load_repository(store, repo_id)
+        ids.extend(repo_ids)
+        vectors.append(repo_vectors)
+    vectors = np.concatenate(vectors)
+    print(f"Loaded {len(ids)} vectors of dim {vectors.shape[1]} from {len(args.repo_ids)} repositories",
+          file=sys.stderr)
+
+    # Exact top-k by brute force, excluding the query point itself
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    queries, truth = [], []
+    for row in rows:
+        scores = normalized @ normalized[row]
+        scores[row] = -np.inf
+        top = np.argpartition(-scores, args.k)[:args.k]
+        queries.append((row, vectors[row]))
+        truth.append({ids[i] for i in top})
+
+    results = [run_layout(store, name, ids, vectors, queries, truth, args.k, args) for name in args.layouts]
+
+    header = list(results[0])
+    print(' | '.join(header))
+    for result in results:
+        print(' | '.join(str(result[h]) for h in header))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
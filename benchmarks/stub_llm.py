@@ -0,0 +1,119 @@
+"""
+Local stand-in for OpenRouter's streaming chat completions endpoint.
+
+Answers every POST with an OpenAI-style SSE stream after a fixed delay,
+so chat benchmarks measure this service rather than a remote model:
+
+    python -m benchmarks.stub_llm --port 8765 --first-token-ms 200 --tokens 50
+"""
+import json
+import asyncio
+import argparse
+import threading
+from typing import Optional
+
+class StubLLMServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, chunked responses) run on its own
+    event loop thread, so it never competes with the benchmark clients.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, first_token_ms: float = 200,
+                 tokens: int = 50, token_interval_ms: float = 10):
+        self.host = host
+        self.port = port
+        self.first_token_ms = first_token_ms
+        self.tokens = tokens
+        self.token_interval_ms = token_interval_ms
+        self.requests = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/v1"
+
+    def start(self):
+        started = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="stub-llm", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                method = head.split(b' ', 1)[0]
+                headers = {}
+                for line in head.decode('latin-1').split('\r\n')[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers.get('content-length', 0)))
+                if method != b'POST':
+                    # e.g. the API's connection warm-up (HEAD /models)
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n')
+                    await writer.drain()
+                    continue
+                self.requests += 1
+                await self._respond(writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter):
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                     b'Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n')
+
+        def send(data: str):
+            payload = f"data: {data}\n\n".encode('utf-8')
+            writer.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for i in range(self.tokens):
+            send(json.dumps({'choices': [{'delta': {'content': f"token{i} "}}]}))
+            await writer.drain()
+            if self.token_interval_ms:
+                await asyncio.sleep(self.token_interval_ms / 1000)
+        send('[DONE]')
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--first-token-ms', type=float, default=200)
+    parser.add_argument('--tokens', type=int, default=50)
+    parser.add_argument('--token-interval-ms', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    server = StubLLMServer(args.host, args.port, args.first_token_ms, args.tokens, args.token_interval_ms).start()
+    print(f"Stub OpenRouter listening on {server.base_url} (set OPENROUTER_BASE_URL to this)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
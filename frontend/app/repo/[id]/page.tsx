@@ -31,14 +31,15 @@ export default function RepoPage() {
 
     useEffect(() => {
         loadRepoStatus();
-        const interval = setInterval(() => {
-            if (repo?.status === 'processing' || repo?.status === 'queued') {
-                loadRepoStatus();
-            }
-        }, 2000);
+    }, [repoId]);
+
+    const isIngesting = repo?.status === 'processing' || repo?.status === 'queued';
 
-        return () => clearInterval(interval);
-    }, [repoId, repo?.status]);
+    useEffect(() => {
+        // Progress is pushed by the server while the repository is being indexed
+        if (!isIngesting) return;
+        return apiClient.watchRepoStatus(repoId, setRepo);
+    }, [repoId, isIngesting]);
 
     const loadRepoStatus = async () => {
         try {
@@ -41,6 +41,21 @@ export class ApiClient {
         return response.json();
     }
 
+    // Pushes the repository's status on every ingestion progress update; returns a function that closes the stream
+    watchRepoStatus(repoId: string, onUpdate: (repo: Repository) => void): () => void {
+        const source = new EventSource(`${this.baseUrl}/api/repos/status/${repoId}/stream`);
+
+        source.onmessage = (event) => {
+            const repo: Repository = JSON.parse(event.data);
+            onUpdate(repo);
+            if (repo.status === 'completed' || repo.status === 'failed') {
+                source.close(); // otherwise EventSource reconnects when the server ends the stream
+            }
+        };
+
+        return () => source.close();
+    }
+
     async listRepositories(): Promise<{ repositories: Repository[] }> {
         const response = await fetch(`${this.baseUrl}/api/repos/list`);
 
@@ -8,6 +8,9 @@ export interface Repository {
     created_at: string;
     completed_at?: string;
     error?: string;
+    stage?: string;
+    chunks_embedded?: number;
+    vectors_upserted?: number;
 }
 
 export interface ChatMessage {
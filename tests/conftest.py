@@ -0,0 +1,59 @@
+import os
+import sys
+import pytest
+from git import Actor, Repo
+from sqlmodel import SQLModel, create_engine
+from backend import database
+from backend.config import config
+from backend.services.github_service import GitHubService
+
+AUTHOR = Actor("Test", "test@example.com")
+
+class SourceRepo:
+    """
+    A local repository to clone from over file://.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.repo = Repo.init(self.path, initial_branch='main')
+        self.url = f"file://{self.path}"
+
+    def commit(self, files=None, deleted=(), renamed=None, message="change") -> str:
+        for name, text in (files or {}).items():
+            full_path = os.path.join(self.path, name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as f:
+                f.write(text)
+            self.repo.index.add([name])
+        if deleted:
+            self.repo.index.remove(list(deleted), working_tree=True)
+        for old, new in (renamed or {}).items():
+            self.repo.index.move([old, new])
+        return self.repo.index.commit(message, author=AUTHOR, committer=AUTHOR).hexsha
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    A fresh SQLite database, swapped in for every loaded module that imported the engine.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    original = database.engine
+    for module in list(sys.modules.values()):
+        if getattr(module, 'engine', None) is original:
+            monkeypatch.setattr(module, 'engine', engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def source_repo(tmp_path):
+    return SourceRepo(tmp_path / 'source')
+
+@pytest.fixture
+def git_service(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'REPOS_DIR', str(tmp_path / 'repos'))
+    monkeypatch.setattr(config, 'MIRRORS_DIR', str(tmp_path / 'mirrors'))
+    monkeypatch.setattr(config, 'CLONE_STRATEGY', 'mirror')
+    monkeypatch.setattr(config, 'CHECKOUT_MODE', 'worktree')
+    return GitHubService()
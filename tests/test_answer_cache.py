@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sqlmodel import Session
+from backend.config import config
+from backend.database import Repository
+from backend.services import answer_cache as answer_cache_module
+from backend.services import progress_service as progress_module
+from backend.services.answer_cache import AnswerCache
+from backend.services.event_bus import EventBus
+from backend.services.progress_service import ProgressService
+from backend.worker import bump_index_version
+
+CONTEXT = [{'id': 'p1', 'text': 'def main(): ...',
+            'metadata': {'file_path': 'main.py', 'start_line': 1, 'end_line': 10}}]
+
+@pytest.fixture
+def bus(monkeypatch):
+    """
+    A private event bus, so the caches made here don't stay subscribed to the global one.
+    """
+    bus = EventBus()
+    monkeypatch.setattr(answer_cache_module, 'event_bus', bus)
+    monkeypatch.setattr(progress_module, 'event_bus', bus)
+    return bus
+
+def key(cache, version, message="What does main do?", repo_id='repo'):
+    return cache.key(repo_id, 'model', version, CONTEXT, message, [])
+
+def test_new_index_version_misses(bus, monkeypatch):
+    monkeypatch.setattr(config, 'ANSWER_CACHE_SIMILARITY', 0.9)
+    cache = AnswerCache()
+    query = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+    cache.set(key(cache, 1), ["main ", "starts the server"], query)
+    assert cache.get(key(cache, 1)) == ["main ", "starts the server"]
+    assert cache.get(key(cache, 1, "what does main do"), query) == ["main ", "starts the server"]
+
+    # Neither the exact question nor a near-duplicate is replayed over a newer index
+    assert cache.get(key(cache, 2)) is None
+    assert cache.get(key(cache, 2, "What does main() do?"), query) is None
+
+def test_reindexing_invalidates_cached_answers(db, bus):
+    with Session(db) as session:
+        session.add(Repository(id='repo', repo_url='https://example.com/repo.git'))
+        session.commit()
+    progress = ProgressService()
+    cache = AnswerCache()
+    version = progress.index_version('repo')
+    cache.set(key(cache, version), ["cached"])
+    cache.set(key(cache, 0, repo_id='other'), ["kept"])
+
+    # What a worker does after every job
+    bump_index_version('repo')
+    bus.publish({'type': 'index_updated', 'repo_id': 'repo'})
+
+    assert progress.index_version('repo') == version + 1
+    assert cache.get(key(cache, version + 1)) is None
+    assert cache.get(key(cache, version)) is None  # dropped, not just unreachable
+    assert cache.get(key(cache, 0, repo_id='other')) == ["kept"]
+
+def test_deleting_a_repository_drops_its_answers(bus):
+    cache = AnswerCache()
+    cache.set(key(cache, 3), ["cached"])
+    bus.publish({'type': 'repo_deleted', 'repo_id': 'repo'})
+    assert cache.get(key(cache, 3)) is None
@@ -0,0 +1,68 @@
+from backend.services.context_packer import format_snippet, merge_ranges, pack_context
+from backend.services.token_counter import count_tokens
+
+def make_hit(file_path, start, end, symbols=None):
+    text = '\n'.join(f"line_{n} = compute({n})" for n in range(start, end + 1))
+    return {'id': f"{file_path}:{start}", 'text': text, 'score': 1.0,
+            'metadata': {'file_path': file_path, 'start_line': start, 'end_line': end, 'symbols': symbols or []}}
+
+def lines_of(hit):
+    return hit['metadata']['start_line'], hit['metadata']['end_line']
+
+def tokens(hits):
+    return sum(count_tokens(format_snippet(h)) for h in hits)
+
+def test_merge_ranges_stitches_overlapping_hits():
+    merged = merge_ranges([make_hit('a.py', 10, 30, ['f']), make_hit('a.py', 20, 40, ['g'])])
+    assert len(merged) == 1
+    assert lines_of(merged[0]) == (10, 40)
+    assert merged[0]['text'] == make_hit('a.py', 10, 40)['text']
+    assert merged[0]['metadata']['symbols'] == ['f', 'g']
+
+def test_merge_ranges_keeps_separate_files_and_gaps_apart():
+    hits = [make_hit('a.py', 1, 10), make_hit('b.py', 1, 10), make_hit('a.py', 20, 30)]
+    assert [lines_of(h) for h in merge_ranges(hits)] == [(1, 10), (1, 10), (20, 30)]
+
+def test_merge_ranges_takes_rank_and_focus_of_best_part():
+    hits = [make_hit('b.py', 1, 5), make_hit('a.py', 101, 160), make_hit('a.py', 1, 100)]
+    merged = merge_ranges(hits)
+    assert [h['metadata']['file_path'] for h in merged] == ['b.py', 'a.py']
+    assert lines_of(merged[1]) == (1, 160)
+    assert merged[1]['focus'] == (101, 160)
+
+def test_pack_context_respects_budget():
+    hits = [make_hit(f"f{i}.py", 1, 20) for i in range(10)]
+    budget = tokens(hits[:3]) + 10
+    packed = pack_context(hits, budget, min_partial_tokens=1000)
+    assert [h['id'] for h in packed] == [h['id'] for h in hits[:3]]
+
+def test_pack_context_truncates_to_leading_lines_of_a_single_hit():
+    hit = make_hit('a.py', 1, 100)
+    packed = pack_context([hit], tokens([hit]) // 2)
+    assert len(packed) == 1
+    start, end = lines_of(packed[0])
+    assert start == 1 and 1 < end < 100
+    assert tokens(packed) <= tokens([hit]) // 2
+
+def test_truncation_of_merged_hit_keeps_best_part():
+    merged = merge_ranges([make_hit('a.py', 101, 160), make_hit('a.py', 1, 100)])
+    budget = tokens([make_hit('a.py', 101, 160)]) + 50
+    packed = pack_context(merged, budget)
+    # Per-line token counts overestimate a little, so the window may stop short
+    start, end = lines_of(packed[0])
+    assert start == 101 and end > 140
+    assert tokens(packed) <= budget
+
+def test_top_hit_survives_low_ranked_neighbour():
+    # The top hit (rank 0) sits right below a rank-40 neighbour in the same
+    # file; merging all candidates first used to pack only the neighbour's lines
+    top = make_hit('a.py', 101, 160)
+    fillers = [make_hit(f"other{i}.py", 1, 10) for i in range(39)]
+    neighbour = make_hit('a.py', 1, 100)
+    candidates = [top] + fillers + [neighbour]
+    budget = tokens([top]) + 200
+
+    context = merge_ranges(pack_context(candidates, budget))
+    assert lines_of(context[0]) == (101, 160)
+    assert context[0]['text'] == top['text']
+    assert tokens(context) <= budget
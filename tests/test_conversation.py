@@ -0,0 +1,70 @@
+import pytest
+from backend.config import config
+from backend.services.conversation import MESSAGE_OVERHEAD, compact_history, retrieval_query
+from backend.services.token_counter import count_tokens
+
+SNIPPET = "def load_settings(path):\n    with open(path) as f:\n        return parse(f.read())\n"
+CONTEXT = [{'id': 'p1', 'text': SNIPPET, 'metadata': {'file_path': 'settings.py', 'start_line': 3, 'end_line': 6}}]
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(config, 'HISTORY_TOKEN_BUDGET', 300)
+    monkeypatch.setattr(config, 'HISTORY_SUMMARY_TOKENS', 80)
+
+def turns(n):
+    history = []
+    for i in range(n):
+        history.append({'role': 'user', 'content': f"Question {i}: how does module_{i} handle retries? " * 3})
+        history.append({'role': 'assistant', 'content': f"Answer {i}: module_{i} retries with backoff. " * 5})
+    return history
+
+def tokens(messages):
+    return sum(count_tokens(m['content']) + MESSAGE_OVERHEAD for m in messages)
+
+def test_short_history_is_kept_verbatim(budget):
+    history = turns(2)
+    assert compact_history(history, []) == history
+
+def test_long_history_fits_the_budget_and_keeps_the_latest_turns(budget):
+    history = turns(20)
+    compacted = compact_history(history, [])
+    summary, kept = compacted[0], compacted[1:]
+
+    assert tokens(kept) <= config.HISTORY_TOKEN_BUDGET
+    # The most recent messages, unchanged and in order
+    assert len(kept) >= 2
+    assert kept == history[-len(kept):]
+    # and no more of them would have fitted
+    assert tokens(history[-len(kept) - 1:]) > config.HISTORY_TOKEN_BUDGET
+
+    assert summary['role'] == 'system'
+    lines = summary['content'].split('\n')[1:]
+    assert sum(count_tokens(line) + 1 for line in lines) <= config.HISTORY_SUMMARY_TOKENS
+    # Summarizes the turns just before the kept ones, oldest first
+    dropped = history[:len(history) - len(kept)]
+    assert lines[-1].startswith(f"- {dropped[-1]['role']}: {dropped[-1]['content'][:20]}")
+    assert 'Question 0:' not in summary['content']
+
+def test_oversized_latest_turn_is_truncated(budget):
+    history = turns(1) + [{'role': 'user', 'content': "word " * 2000}]
+    compacted = compact_history(history, [])
+    assert compacted[-1]['content'].startswith("word word")
+    assert tokens(compacted[-1:]) <= config.HISTORY_TOKEN_BUDGET
+    assert compacted[0]['role'] == 'system'  # the earlier turn is summarized
+
+def test_code_already_in_context_is_replaced_by_a_pointer(budget):
+    history = [{'role': 'user', 'content': "Why is this slow?"},
+               {'role': 'assistant', 'content': f"Here:\n```python\n{SNIPPET}```\nIt reads the file each call."}]
+    compacted = compact_history(history, CONTEXT)
+    assert compacted[1]['content'] == ("Here:\n[code from settings.py lines 3-6, see context]\n"
+                                       "It reads the file each call.")
+    # Code that is not in context stays
+    assert compact_history(history, []) == history
+
+def test_retrieval_query_adds_the_previous_question(monkeypatch):
+    history = [{'role': 'user', 'content': "Where is load_settings defined?"},
+               {'role': 'assistant', 'content': "In settings.py."}]
+    assert retrieval_query("And who calls it?", history) == "And who calls it? Where is load_settings defined?"
+    assert retrieval_query("And who calls it?", []) == "And who calls it?"
+    monkeypatch.setattr(config, 'RETRIEVAL_HISTORY_TURNS', 0)
+    assert retrieval_query("And who calls it?", history) == "And who calls it?"
@@ -0,0 +1,56 @@
+import itertools
+import numpy as np
+import pytest
+from backend.services import embedding_cache
+from backend.services.embedding_cache import EmbeddingCache
+
+MODEL = 'all-MiniLM-L6-v2'
+DIM = 4  # 16 bytes per vector
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A strictly increasing clock, so every access has its own LRU position.
+    """
+    ticks = itertools.count(1)
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: float(next(ticks)))
+
+def vector(seed):
+    return np.full(DIM, seed, dtype=np.float32)
+
+def cached(cache, texts):
+    return [t for t, v in zip(texts, cache.get_many(MODEL, texts)) if v is not None]
+
+def test_hit_and_miss(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'), max_bytes=1 << 20)
+    assert cache.get_many(MODEL, ['def a(): pass']) == [None]
+
+    cache.put_many(MODEL, ['def a(): pass', 'def b(): pass'], [vector(1), vector(2)])
+    found = cache.get_many(MODEL, ['def b(): pass', 'def c(): pass', 'def a(): pass', 'def b(): pass'])
+    assert np.array_equal(found[0], vector(2))
+    assert found[1] is None
+    assert np.array_equal(found[2], vector(1))
+    assert np.array_equal(found[3], vector(2))
+
+    # The key covers the model and the exact text
+    assert cache.get_many('other-model', ['def a(): pass']) == [None]
+    assert cache.get_many(MODEL, ['def a():  pass']) == [None]
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['bytes']) == (3, 4, 2 * DIM * 4)
+
+    # Entries persist for other processes
+    reopened = EmbeddingCache(str(tmp_path / 'cache.db'), max_bytes=1 << 20)
+    assert np.array_equal(reopened.get_many(MODEL, ['def a(): pass'])[0], vector(1))
+    assert reopened.stats()['bytes'] == 2 * DIM * 4
+
+def test_evicts_least_recently_used_at_capacity(tmp_path, clock):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'), max_bytes=4 * DIM * 4)
+    texts = ['a', 'b', 'c', 'd']
+    for i, text in enumerate(texts):
+        cache.put_many(MODEL, [text], [vector(i)])
+    assert cached(cache, ['a']) == ['a']  # now the most recently used
+
+    # Over capacity: the oldest entries go until the cache is back under 90%
+    cache.put_many(MODEL, ['e'], [vector(4)])
+    assert cached(cache, texts + ['e']) == ['a', 'd', 'e']
+    assert cache.stats()['bytes'] == 3 * DIM * 4
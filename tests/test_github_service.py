@@ -0,0 +1,74 @@
+import os
+import pytest
+from git import Repo
+from backend.config import config
+from backend.services.github_service import GitHubService, SOURCE_FILE
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def test_mirror_worktree_clone_fetch_and_cleanup(source_repo, git_service):
+    old_sha = source_repo.commit({'a.py': 'a = 1\n', 'b.py': 'b = 2\n', 'pkg/c.py': 'c = 3\n'})
+    path = git_service.clone_repository(source_repo.url, 'one')
+    mirror = git_service.mirror_path(source_repo.url)
+    assert Repo(mirror).bare
+    assert os.path.isfile(os.path.join(path, '.git'))  # a worktree of the mirror
+    assert git_service.head_commit(path) == old_sha
+
+    new_sha = source_repo.commit({'a.py': 'a = 10\n', 'd.py': 'd = 4\n'}, deleted=['b.py'])
+    renamed_sha = source_repo.commit(renamed={'pkg/c.py': 'pkg/e.py'})
+    assert git_service.fetch_updates('one') == (old_sha, renamed_sha)
+    assert read(os.path.join(path, 'a.py')) == 'a = 10\n'
+    assert not os.path.exists(os.path.join(path, 'b.py'))
+
+    assert git_service.diff_files(path, old_sha, new_sha) == (['a.py', 'd.py'], ['b.py'])
+    changed, deleted = git_service.diff_files(path, new_sha, renamed_sha)
+    assert (changed, deleted) == ([os.path.join('pkg', 'e.py')], [os.path.join('pkg', 'c.py')])
+    assert git_service.diff_files(path, new_sha, new_sha) == ([], [])
+
+    git_service.cleanup('one')
+    assert not os.path.exists(path)
+    assert os.path.isdir(mirror)  # kept for the next ingest of the URL
+    assert path not in Repo(mirror).git.worktree('list')
+
+def test_ingesting_a_url_again_reuses_its_mirror(source_repo, git_service, tmp_path):
+    source_repo.commit({'a.py': 'a = 1\n'})
+    git_service.clone_repository(source_repo.url, 'one')
+    sha = source_repo.commit({'a.py': 'a = 2\n'})
+    path = git_service.clone_repository(source_repo.url + '/', 'two')
+    mirrors = [name for name in os.listdir(tmp_path / 'mirrors') if name.endswith('.git')]
+    assert mirrors == [os.path.basename(git_service.mirror_path(source_repo.url))]
+    assert git_service.head_commit(path) == sha
+    assert read(os.path.join(path, 'a.py')) == 'a = 2\n'
+
+def test_archive_checkout_holds_only_included_files(source_repo, git_service, monkeypatch):
+    monkeypatch.setattr(git_service, 'checkout_mode', 'archive')
+    old_sha = source_repo.commit({'a.py': 'a = 1\n', 'b.py': 'b = 2\n', 'notes.txt': 'skip'})
+    include = lambda p: p.endswith('.py')
+    path = git_service.clone_repository(source_repo.url, 'one', include=include)
+    assert sorted(os.listdir(path)) == sorted(['a.py', 'b.py', SOURCE_FILE])
+    assert git_service.head_commit(path) == old_sha
+
+    new_sha = source_repo.commit({'a.py': 'a = 10\n', 'c.py': 'c = 3\n', 'more.txt': 'skip'}, deleted=['b.py'])
+    assert git_service.fetch_updates('one', include=include) == (old_sha, new_sha)
+    assert sorted(os.listdir(path)) == sorted(['a.py', 'c.py', SOURCE_FILE])
+    assert read(os.path.join(path, 'a.py')) == 'a = 10\n'
+    assert git_service.diff_files(path, old_sha, new_sha) == (['a.py', 'c.py', 'more.txt'], ['b.py'])
+
+    git_service.cleanup('one')
+    assert not os.path.exists(path)
+
+def test_shallow_clone_fetches_updates(source_repo, git_service, monkeypatch):
+    monkeypatch.setattr(git_service, 'strategy', 'shallow')
+    old_sha = source_repo.commit({'a.py': 'a = 1\n'})
+    path = git_service.clone_repository(source_repo.url, 'one')
+    assert os.path.isdir(os.path.join(path, '.git'))
+    new_sha = source_repo.commit({'a.py': 'a = 2\n'})
+    assert git_service.fetch_updates('one') == (old_sha, new_sha)
+    assert read(os.path.join(path, 'a.py')) == 'a = 2\n'
+
+def test_unknown_strategy_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, 'CLONE_STRATEGY', 'sparse')
+    with pytest.raises(ValueError):
+        GitHubService()
@@ -0,0 +1,105 @@
+import threading
+from datetime import datetime, timedelta
+from sqlmodel import Session
+from backend.config import config
+from backend.database import IngestJob, Repository
+from backend.services.job_queue import job_queue
+
+def add_repo(db, repo_id):
+    with Session(db) as session:
+        session.add(Repository(id=repo_id, repo_url=f"https://example.com/{repo_id}.git"))
+        session.commit()
+
+def load(db, model, key):
+    with Session(db) as session:
+        return session.get(model, key)
+
+def expire_lease(db, job_id, seconds):
+    with Session(db) as session:
+        job = session.get(IngestJob, job_id)
+        job.heartbeat_at = datetime.utcnow() - timedelta(seconds=seconds)
+        session.add(job)
+        session.commit()
+
+def test_claim_takes_priority_order_and_one_job_per_repo(db):
+    add_repo(db, 'a')
+    add_repo(db, 'b')
+    first = job_queue.enqueue('a')
+    second = job_queue.enqueue('a', kind='refresh', priority=5)
+    other = job_queue.enqueue('b')
+    assert load(db, Repository, 'a').status == 'queued'
+
+    claimed = job_queue.claim('w1')
+    assert (claimed.id, claimed.status, claimed.worker_id, claimed.attempts) == (second.id, 'running', 'w1', 1)
+    # 'a' is busy until its running job finishes
+    assert job_queue.claim('w2').id == other.id
+    assert job_queue.claim('w2') is None
+
+    job_queue.finish(claimed.id)
+    assert load(db, IngestJob, claimed.id).status == 'done'
+    assert job_queue.claim('w2').id == first.id
+
+def test_concurrent_claims_hand_out_a_job_once(db):
+    add_repo(db, 'a')
+    job = job_queue.enqueue('a')
+    claims = []
+    barrier = threading.Barrier(8)
+
+    def claim(worker_id):
+        barrier.wait()
+        claims.append(job_queue.claim(worker_id))
+
+    threads = [threading.Thread(target=claim, args=(f"w{i}",)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    winners = [c for c in claims if c is not None]
+    assert [w.id for w in winners] == [job.id]
+    assert load(db, IngestJob, job.id).worker_id == winners[0].worker_id
+
+def test_cancel_stops_queued_and_running_jobs(db):
+    add_repo(db, 'a')
+    running = job_queue.enqueue('a')
+    queued = job_queue.enqueue('a', kind='refresh')
+    job_queue.claim('w1')
+    assert job_queue.has_pending('a')
+
+    job_queue.cancel('a')
+    assert not job_queue.has_pending('a')
+    assert load(db, IngestJob, queued.id).status == 'cancelled'
+    # The running job's worker learns at its next heartbeat, and finishing keeps the status
+    assert job_queue.heartbeat(running.id) is False
+    job_queue.finish(running.id)
+    assert load(db, IngestJob, running.id).status == 'cancelled'
+    assert job_queue.claim('w2') is None
+
+def test_requeue_stale_resumes_jobs_whose_lease_expired(db):
+    add_repo(db, 'a')
+    job = job_queue.enqueue('a')
+    job_queue.claim('w1')
+    assert job_queue.heartbeat(job.id)
+    assert job_queue.requeue_stale() == 0  # lease still fresh
+
+    expire_lease(db, job.id, config.JOB_STALE_SECONDS + 1)
+    assert job_queue.requeue_stale() == 1
+    requeued = load(db, IngestJob, job.id)
+    assert (requeued.status, requeued.kind, requeued.worker_id) == ('queued', 'resume', None)
+    # The old worker's heartbeat no longer renews the job
+    assert job_queue.heartbeat(job.id) is False
+
+    claimed = job_queue.claim('w2')
+    assert (claimed.id, claimed.worker_id, claimed.attempts) == (job.id, 'w2', 2)
+
+def test_requeue_stale_gives_up_after_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(config, 'JOB_MAX_ATTEMPTS', 1)
+    add_repo(db, 'a')
+    job = job_queue.enqueue('a')
+    job_queue.claim('w1')
+    expire_lease(db, job.id, config.JOB_STALE_SECONDS + 1)
+
+    assert job_queue.requeue_stale() == 1
+    assert load(db, IngestJob, job.id).status == 'failed'
+    repo = load(db, Repository, 'a')
+    assert (repo.status, repo.error) == ('failed', 'Worker stopped responding')
+    assert job_queue.claim('w2') is None
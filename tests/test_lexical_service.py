@@ -0,0 +1,92 @@
+import os
+import pytest
+from backend.config import config
+from backend.services.lexical_service import LexicalService, tokenize
+from backend.services.retrieval_service import fuse_rankings
+
+def chunk(file_path, text, symbols=None, start=1):
+    return {'file_path': file_path, 'text': text, 'start_line': start, 'end_line': start + 9,
+            'symbols': symbols or []}
+
+CORPUS = {
+    'config': chunk('config.py', "def parse_config(path):\n    raw = read_yaml(path)\n    return Settings(raw)",
+                    ['parse_config']),
+    'twice': chunk('loader.py', "settings = parse_config(a)\nfallback = parse_config(b)"),
+    'once': chunk('cli.py', "settings = parse_config(argv)\nrun(settings, verbose)"),
+    'render': chunk('views.py', "def renderTemplate(name, settings):\n    return engine.render(name, settings)",
+                    ['renderTemplate']),
+    'symbol_only': chunk('handlers.py', "@route('/upload')\ndef handler(request): ...", ['handle_upload']),
+}
+
+@pytest.fixture
+def lexical(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'LEXICAL_INDEX_DIR', str(tmp_path / 'lexical'))
+    service = LexicalService()
+    service.index_chunks('repo', list(CORPUS), list(CORPUS.values()))
+    return service
+
+def ids(hits):
+    return [h['id'] for h in hits]
+
+def test_tokenize_splits_identifiers_and_drops_stopwords():
+    assert tokenize("def parseHTTPRequest(self): return user_id") == [
+        'parsehttprequest', 'parse', 'http', 'request', 'user_id', 'user', 'id'
+    ]
+
+def test_bm25_ranks_by_term_frequency_and_rarity(lexical):
+    hits = lexical.search('repo', "parse_config", limit=10)
+    # Repeated terms score higher; chunks without the terms are not returned
+    assert ids(hits)[0] == 'twice'
+    assert set(ids(hits)) == {'config', 'twice', 'once'}
+    assert hits[0]['score'] > hits[-1]['score'] > 0
+
+    # A rare term outweighs a common one
+    assert ids(lexical.search('repo', "settings yaml", limit=1)) == ['config']
+    assert ids(lexical.search('repo', "render template", limit=10)) == ['render']
+    assert ids(lexical.search('repo', "upload", limit=10)) == ['symbol_only']
+    assert lexical.search('repo', "does not appear", limit=10) == []
+    assert lexical.search('other', "parse_config", limit=10) == []
+
+def test_search_returns_payload_fields(lexical):
+    hit = lexical.search('repo', "renderTemplate", limit=1)[0]
+    assert hit['text'] == CORPUS['render']['text']
+    assert hit['metadata'] == {'file_path': 'views.py', 'start_line': 1, 'end_line': 10,
+                               'symbols': ['renderTemplate']}
+
+def test_delete_file_chunks_keeps_listed_ids(lexical, tmp_path):
+    lexical.index_chunks('repo', ['loader-2'], [chunk('loader.py', "parse_config(c)", start=20)])
+    assert lexical.search('repo', "parse_config", limit=10)  # loads the index
+    lexical.delete_file_chunks('repo', ['loader.py', 'cli.py'], keep_ids=['loader-2'])
+
+    # The loaded copy skips deleted chunks right away
+    assert set(ids(lexical.search('repo', "parse_config", limit=10))) == {'config', 'loader-2'}
+    # and another process sees the same index
+    assert set(ids(LexicalService().search('repo', "parse_config", limit=10))) == {'config', 'loader-2'}
+
+    lexical.delete_repo('repo')
+    assert lexical.search('repo', "parse_config", limit=10) == []
+    assert not os.listdir(tmp_path / 'lexical')
+
+def test_rrf_orders_by_reciprocal_rank():
+    semantic = [{'id': 'a', 'score': 0.9}, {'id': 'b', 'score': 0.8}, {'id': 'c', 'score': 0.7}]
+    keyword = [{'id': 'c', 'score': 12.0}, {'id': 'd', 'score': 9.0}, {'id': 'a', 'score': 1.0}]
+    fused = fuse_rankings([semantic, keyword], limit=10)
+    # a: 1/61 + 1/63, c: 1/63 + 1/61, then b and d (ties keep the order first seen)
+    assert ids(fused) == ['a', 'c', 'b', 'd']
+    assert fused[0]['score'] == pytest.approx(1 / 61 + 1 / 63)
+    assert fused[0]['score'] == fused[1]['score']
+    assert ids(fuse_rankings([semantic, keyword], limit=2)) == ['a', 'c']
+    # Same input, same output
+    assert all(ids(fuse_rankings([semantic, keyword], limit=10)) == ids(fused) for _ in range(5))
+
+def test_rrf_fuses_lexical_hits_with_vector_hits(lexical):
+    lexical_hits = lexical.search('repo', "parse_config settings", limit=10)
+    assert ids(lexical_hits) == ['twice', 'config', 'once', 'render']
+    vector_hits = [{'id': 'render', 'score': 0.9, 'text': '', 'metadata': {}},
+                   {'id': 'once', 'score': 0.5, 'text': '', 'metadata': {}}]
+    fused = fuse_rankings([vector_hits, lexical_hits], limit=3)
+    # Found by both rankings beats first place in only one of them
+    assert ids(fused) == ['render', 'once', 'twice']
+    # The first ranking a hit appears in supplies its fields
+    assert fused[0]['text'] == ''
+    assert fused[2]['text'] == CORPUS['twice']['text']
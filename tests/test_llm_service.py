@@ -0,0 +1,129 @@
+import json
+import asyncio
+import httpx
+import pytest
+from backend.config import config
+from backend.services import llm_service as llm_module
+from backend.services.llm_service import LLMService
+
+def sse(*events):
+    lines = [": keep-alive comment"]
+    for event in events:
+        lines.append("data: " + (event if isinstance(event, str) else json.dumps(event)))
+        lines.append("")
+    return ("\n".join(lines) + "\n").encode()
+
+def delta(text):
+    return {"choices": [{"delta": {"content": text}}]}
+
+class OpenRouterStub:
+    """
+    Replays one scripted response (or exception) per request.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request: httpx.Request):
+        self.requests.append(request)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+@pytest.fixture
+def stub(monkeypatch):
+    """
+    Routes the service's own pooled client through a MockTransport, and records backoff sleeps.
+    """
+    handler = OpenRouterStub()
+    clients = []
+    real_client = httpx.AsyncClient
+
+    def client(**kwargs):
+        clients.append(real_client(transport=httpx.MockTransport(handler), **kwargs))
+        return clients[-1]
+
+    async def sleep(delay):
+        handler.sleeps.append(delay)
+
+    handler.clients, handler.sleeps = clients, []
+    monkeypatch.setattr(llm_module.httpx, 'AsyncClient', client)
+    monkeypatch.setattr(llm_module.asyncio, 'sleep', sleep)
+    monkeypatch.setattr(config, 'LLM_RETRY_BACKOFF', 0.5)
+    monkeypatch.setattr(config, 'LLM_MAX_RETRIES', 3)
+    return handler
+
+def chat(service, message="What does main do?"):
+    completed = []
+
+    async def run():
+        chunks = [chunk async for chunk in service.chat_stream(message, [], [], on_complete=completed.append)]
+        return chunks
+
+    return asyncio.run(run()), completed
+
+def test_streams_sse_deltas_until_done(stub):
+    stub.responses = [httpx.Response(200, content=sse(delta("Hello"), delta(""), "not json", delta(" world"),
+                                                      "[DONE]", delta("ignored")))]
+    service = LLMService()
+    chunks, completed = chat(service)
+    assert chunks == ["Hello", " world"]
+    assert completed == [["Hello", " world"]]
+
+    body = json.loads(stub.requests[0].content)
+    assert body["stream"] is True
+    assert body["messages"][-1] == {"role": "user", "content": "What does main do?"}
+    assert stub.requests[0].url.path.endswith("/chat/completions")
+    assert stub.requests[0].headers["Authorization"].startswith("Bearer ")
+
+def test_requests_share_one_pooled_client(stub):
+    stub.responses = [httpx.Response(200, content=sse(delta("one"), "[DONE]")),
+                      httpx.Response(200, content=sse(delta("two"), "[DONE]"))]
+    service = LLMService()
+
+    async def run():
+        first = [c async for c in service.chat_stream("a", [], [])]
+        second = [c async for c in service.chat_stream("b", [], [])]
+        await service.aclose()
+        return first + second
+
+    assert asyncio.run(run()) == ["one", "two"]
+    assert len(stub.clients) == 1
+    assert service.stats['requests'] == 2
+
+def test_retries_5xx_and_429_with_backoff(stub):
+    stub.responses = [httpx.Response(503, content=b"busy"),
+                      httpx.Response(429, headers={"Retry-After": "3"}),
+                      httpx.ConnectError("refused"),
+                      httpx.Response(200, content=sse(delta("ok"), "[DONE]"))]
+    service = LLMService()
+    chunks, completed = chat(service)
+    assert chunks == ["ok"]
+    assert completed == [["ok"]]
+    assert len(stub.requests) == 4
+    # Doubling backoff, raised to the server's Retry-After
+    assert stub.sleeps == [0.5, 3.0, 2.0]
+    assert service.stats['retries'] == 3
+
+def test_gives_up_after_max_retries(stub):
+    stub.responses = [httpx.Response(502, content=b"bad gateway")] * (config.LLM_MAX_RETRIES + 1)
+    service = LLMService()
+    chunks, completed = chat(service)
+    assert chunks == ["Error: OpenRouter returned 502: bad gateway"]
+    assert completed == []
+    assert len(stub.requests) == config.LLM_MAX_RETRIES + 1
+    assert service.stats['errors'] == 1
+
+def test_client_errors_are_not_retried(stub):
+    stub.responses = [httpx.Response(401, content=b"no key")]
+    chunks, completed = chat(LLMService())
+    assert chunks == ["Error: OpenRouter returned 401: no key"]
+    assert len(stub.requests) == 1
+
+def test_truncated_stream_is_not_completed(stub):
+    stub.responses = [httpx.Response(200, content=sse(delta("partial")))]
+    chunks, completed = chat(LLMService())
+    assert chunks == ["partial"]
+    assert completed == []
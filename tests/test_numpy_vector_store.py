@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from backend.services import numpy_vector_store
+from backend.services.numpy_vector_store import NumpyVectorStore
+
+DIM = 8
+
+def payload(file_path, n):
+    return {'file_path': file_path, 'start_line': n, 'end_line': n + 9, 'text': f"{file_path}:{n}",
+            'content_hash': f"{file_path}:{n}"}
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+def make_store(root):
+    store = NumpyVectorStore(str(root))
+    store.ensure_collection('repo', vector_size=DIM)
+    return store
+
+def ids_of(points):
+    return sorted(p['id'] for p in points)
+
+def test_upsert_and_search_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    vecs = vectors(4)
+    store.upsert_vectors('repo', vecs, [payload('a.py', i) for i in range(4)], ids=['p0', 'p1', 'p2', 'p3'])
+    hits = store.search('repo', vecs[2], limit=1)
+    assert hits[0]['id'] == 'p2'
+    assert hits[0]['metadata']['file_path'] == 'a.py'
+
+    # A second process (here: a second store) sees the same points
+    reloaded = NumpyVectorStore(str(tmp_path))
+    assert reloaded.search('repo', vecs[2], limit=1)[0]['id'] == 'p2'
+
+def test_overwrite_and_delete_survive_reload(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert_vectors('repo', vectors(2), [payload('a.py', 0), payload('b.py', 0)], ids=['a', 'b'])
+    replacement = vectors(1, seed=1)
+    store.upsert_vectors('repo', replacement, [payload('a.py', 1)], ids=['a'])
+    store.delete_file_points('repo', ['b.py'])
+
+    reloaded = NumpyVectorStore(str(tmp_path))
+    points = reloaded.get_file_points('repo', ['a.py', 'b.py'])
+    assert ids_of(points) == ['a']
+    assert points[0]['payload']['start_line'] == 1
+    assert np.allclose(points[0]['vector'], replacement[0] / np.linalg.norm(replacement[0]))
+
+def test_delete_file_points_keeps_listed_ids(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert_vectors('repo', vectors(3), [payload('a.py', i) for i in range(3)], ids=['x', 'y', 'z'])
+    store.delete_file_points('repo', ['a.py'], keep_ids=['y'])
+    assert ids_of(store.get_file_points('repo', ['a.py'])) == ['y']
+
+def test_compaction_drops_dead_rows(tmp_path):
+    store = make_store(tmp_path)
+    vecs = vectors(10)
+    store.upsert_vectors('repo', vecs, [payload('a.py', i) for i in range(10)], ids=[f"p{i}" for i in range(10)])
+    store.upsert_vectors('repo', vecs[:5], [payload('a.py', i) for i in range(5)], ids=[f"p{i}" for i in range(5)])
+    store.delete_file_points('repo', ['a.py'], keep_ids=[f"p{i}" for i in range(8)])
+    reader = NumpyVectorStore(str(tmp_path))
+    assert len(reader.get_file_points('repo', ['a.py'])) == 8
+
+    store._get('repo').compact()
+    files = sorted(os.listdir(tmp_path / 'repo'))
+    assert files == ['meta.json', 'points.jsonl', 'vectors.1.f32']
+    assert os.path.getsize(tmp_path / 'repo' / 'vectors.1.f32') == 8 * DIM * 4
+
+    # A reader that loaded the old files picks up the compacted ones
+    assert len(reader.get_file_points('repo', ['a.py'])) == 8
+    assert reader.search('repo', vecs[7], limit=1)[0]['id'] == 'p7'
+    store.upsert_vectors('repo', vecs[8:], [payload('b.py', i) for i in range(2)], ids=['q0', 'q1'])
+    assert ids_of(NumpyVectorStore(str(tmp_path)).get_file_points('repo', ['b.py'])) == ['q0', 'q1']
+
+def test_writes_compact_past_the_dead_ratio(tmp_path, monkeypatch):
+    monkeypatch.setattr(numpy_vector_store, 'COMPACT_MIN_DEAD', 2)
+    store = make_store(tmp_path)
+    ids = [f"p{i}" for i in range(4)]
+    store.upsert_vectors('repo', vectors(4), [payload('a.py', i) for i in range(4)], ids=ids)
+    store.upsert_vectors('repo', vectors(4, seed=1), [payload('a.py', i) for i in range(4)], ids=ids)
+    # 4 of 8 rows dead is not past the default ratio of 0.5; one more is
+    assert 'vectors.f32' in os.listdir(tmp_path / 'repo')
+    store.delete_file_points('repo', ['a.py'], keep_ids=ids[1:])
+    assert 'vectors.1.f32' in os.listdir(tmp_path / 'repo')
+    assert ids_of(NumpyVectorStore(str(tmp_path)).get_file_points('repo', ['a.py'])) == ids[1:]
+
+def test_delete_collection(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert_vectors('repo', vectors(1), [payload('a.py', 0)])
+    store.delete_collection('repo')
+    assert store.search('repo', vectors(1)[0]) == []
+    assert not os.path.exists(tmp_path / 'repo')
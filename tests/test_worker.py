@@ -0,0 +1,110 @@
+import os
+import pytest
+from sqlmodel import Session
+from backend import worker
+from backend.database import Repository
+
+class FakeIngestion:
+    """
+    Stands in for the embed/upsert pipeline: reports one file per batch and
+    fails before file fail_at if set.
+    """
+
+    def __init__(self):
+        self.fail_at = None
+        self.calls = []
+
+    def run(self, repo_id, repo_path, files, on_progress, start_file=0, timer=None, on_embedded=None):
+        self.calls.append(('run', [os.path.relpath(f, repo_path) for f in files], start_file))
+        for done in range(start_file + 1, len(files) + 1):
+            if done == self.fail_at:
+                raise RuntimeError("embedding failed")
+            on_progress(done, done)
+        return len(files) - start_file
+
+    def refresh(self, repo_id, repo_path, changed, deleted, on_progress, timer=None, on_embedded=None):
+        self.calls.append(('refresh', list(changed), list(deleted)))
+        on_progress(len(changed), len(changed))
+        return len(changed)
+
+@pytest.fixture
+def ingestion(db, git_service, monkeypatch):
+    fake = FakeIngestion()
+    dropped = []
+    monkeypatch.setattr(worker, 'github_service', git_service)
+    monkeypatch.setattr(worker, 'ingestion_service', fake)
+    monkeypatch.setattr(worker.vector_service, 'delete_collection', dropped.append)
+    monkeypatch.setattr(worker.lexical_service, 'delete_repo', lambda repo_id: None)
+    fake.dropped = dropped
+    return fake
+
+def add_repo(db, url):
+    with Session(db) as session:
+        session.add(Repository(id='repo', repo_url=url))
+        session.commit()
+
+def load_repo(db):
+    with Session(db) as session:
+        return session.get(Repository, 'repo')
+
+def test_resume_continues_from_the_watermark(db, source_repo, ingestion):
+    sha = source_repo.commit({'a.py': 'a = 1\n', 'b.py': 'b = 2\n', 'c.py': 'c = 3\n'})
+    add_repo(db, source_repo.url)
+    ingestion.fail_at = 3
+    with pytest.raises(RuntimeError):
+        worker.process_repository('repo', source_repo.url)
+    repo = load_repo(db)
+    assert (repo.status, repo.checkpoint_sha, repo.checkpoint_files) == ('failed', sha, 2)
+
+    ingestion.fail_at = None
+    worker.process_repository('repo', source_repo.url, resume=True)
+    assert ingestion.calls[-1] == ('run', ['a.py', 'b.py', 'c.py'], 2)
+    assert ingestion.dropped == ['repo']  # not cloned again
+    repo = load_repo(db)
+    assert (repo.status, repo.commit_sha, repo.processed_files, repo.progress) == ('completed', sha, 3, 1.0)
+    assert (repo.checkpoint_sha, repo.checkpoint_files, repo.error) == (None, 0, None)
+    assert 'total' in repo.stage_timings
+
+def test_resume_without_the_checkout_starts_over(db, source_repo, ingestion, git_service):
+    source_repo.commit({'a.py': 'a = 1\n', 'b.py': 'b = 2\n'})
+    add_repo(db, source_repo.url)
+    ingestion.fail_at = 2
+    with pytest.raises(RuntimeError):
+        worker.process_repository('repo', source_repo.url)
+    git_service.cleanup('repo')
+
+    ingestion.fail_at = None
+    worker.process_repository('repo', source_repo.url, resume=True)
+    assert ingestion.calls[-1] == ('run', ['a.py', 'b.py'], 0)
+    assert ingestion.dropped == ['repo', 'repo']
+    assert load_repo(db).status == 'completed'
+
+def test_refresh_indexes_the_diff_between_commits(db, source_repo, ingestion, git_service):
+    source_repo.commit({'a.py': 'a = 1\n', 'b.py': 'b = 2\n', 'pkg/c.py': 'c = 3\n'})
+    add_repo(db, source_repo.url)
+    worker.process_repository('repo', source_repo.url)
+
+    new_sha = source_repo.commit({'a.py': 'a = 10\n', 'pkg/d.py': 'd = 4\n', 'notes.txt': 'skip'},
+                                 deleted=['b.py'])
+    worker.refresh_repository('repo')
+    assert ingestion.calls[-1] == ('refresh', ['a.py', os.path.join('pkg', 'd.py')], ['b.py'])
+    repo = load_repo(db)
+    assert (repo.status, repo.commit_sha, repo.progress) == ('completed', new_sha, 1.0)
+    checkout = git_service.repo_path('repo')
+    assert os.path.exists(os.path.join(checkout, 'pkg', 'd.py'))
+    assert not os.path.exists(os.path.join(checkout, 'b.py'))
+
+def test_refresh_failure_marks_the_repository_failed(db, source_repo, ingestion, monkeypatch):
+    source_repo.commit({'a.py': 'a = 1\n'})
+    add_repo(db, source_repo.url)
+    worker.process_repository('repo', source_repo.url)
+    old_sha = load_repo(db).commit_sha
+
+    def broken_refresh(*args, **kwargs):
+        raise RuntimeError("upsert failed")
+    monkeypatch.setattr(ingestion, 'refresh', broken_refresh)
+    source_repo.commit({'a.py': 'a = 2\n'})
+    with pytest.raises(RuntimeError):
+        worker.refresh_repository('repo')
+    repo = load_repo(db)
+    assert (repo.status, repo.error, repo.commit_sha) == ('failed', 'upsert failed', old_sha)